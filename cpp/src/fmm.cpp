@@ -0,0 +1,464 @@
+#define NOMINMAX
+#include "fmm.hpp"
+#include "vsh_translation.hpp"
+#include "indices.hpp"
+#include <cmath>
+#include <algorithm>
+#include <map>
+#include <omp.h>
+
+using std::complex;
+
+using index3 = std::array<int,3>;
+
+// spherical coordinates (rad, theta, phi) of a displacement; a vanishing displacement is mapped to the z-axis
+static std::array<double,3> displacement_sph(const vec3& d) {
+    double rad = d.norm();
+    if (rad == 0)
+        return {0, 0, 0};
+
+    return {rad, acos(d(2)/rad), atan2(d(1), d(0))};
+}
+
+// octant of a box inside its parent
+static int octant(const index3& coords) {
+    return (coords[0] & 1) + 2*(coords[1] & 1) + 4*(coords[2] & 1);
+}
+
+// an M2L displacement and its opposite share a translation matrix (up to parity signs); use the one whose
+// first non-zero component is positive
+static bool is_canonical(const index3& offset) {
+    for (int i = 0; i < 3; i++) {
+        if (offset[i] != 0)
+            return offset[i] > 0;
+    }
+    return true;
+}
+
+int fmm_expansion_order(int lmax, double k, double box_size, double accuracy) {
+    double digits = std::max(1.0, -log10(accuracy));
+    double kd = k*sqrt(3)*box_size;
+
+    // low frequency: the expansions converge geometrically in the ratio of box size to box separation,
+    // about one more order per digit
+    int order_geometric = lmax + int(ceil(digits));
+
+    // high frequency: excess bandwidth formula for boxes that are large compared to the wavelength
+    // (the constant is calibrated so that the far-field error stays below the requested accuracy)
+    int order_wave = int(ceil(kd + pow(digits, 2.0/3.0)*pow(kd, 1.0/3.0)));
+
+    return std::max(order_geometric, order_wave);
+}
+
+fmm_operator::fmm_operator(const Ref<const position_t>& positions, int lmax, double k, double accuracy,
+        int leaf_size): positions(positions), lmax(lmax), k(k) {
+
+    build_tree(leaf_size);
+    build_translations(accuracy);
+}
+
+std::vector<int> fmm_operator::expansion_orders() const {
+    std::vector<int> orders;
+    for (const auto& lev: levels)
+        orders.push_back(lev.order);
+
+    return orders;
+}
+
+std::vector<int> fmm_operator::boxes_per_level() const {
+    std::vector<int> nboxes;
+    for (const auto& lev: levels)
+        nboxes.push_back(lev.boxes.size());
+
+    return nboxes;
+}
+
+void fmm_operator::build_tree(int leaf_size) {
+    int Nparticles = positions.rows();
+    const int max_depth = 10;
+
+    vec3 lower = positions.colwise().minCoeff();
+    vec3 upper = positions.colwise().maxCoeff();
+    double size = (upper - lower).maxCoeff();
+    if (size == 0)
+        size = 1/k;
+    size *= 1 + 1e-9;
+    vec3 corner = (lower + upper)/2 - vec3::Constant(size/2);
+
+    // deepen the tree until no leaf holds more than leaf_size particles
+    int depth = 0;
+    std::vector<index3> leaf_coords(Nparticles);
+    while (true) {
+        int nbox = 1 << depth;
+        double h = size/nbox;
+        std::map<index3,int> occupancy;
+        int largest = 0;
+
+        for (int i = 0; i < Nparticles; i++) {
+            for (int dim = 0; dim < 3; dim++) {
+                int c = int(floor((positions(i,dim) - corner(dim))/h));
+                leaf_coords[i][dim] = std::min(std::max(c, 0), nbox - 1);
+            }
+            largest = std::max(largest, ++occupancy[leaf_coords[i]]);
+        }
+
+        if (largest <= leaf_size || depth == max_depth)
+            break;
+        depth += 1;
+    }
+
+    levels.resize(depth+1);
+    std::vector<std::map<index3,int>> lookup(depth+1);
+
+    for (int l = 0; l < depth+1; l++) {
+        level& lev = levels[l];
+        lev.size = size/(1 << l);
+
+        for (int i = 0; i < Nparticles; i++) {
+            index3 coords;
+            for (int dim = 0; dim < 3; dim++)
+                coords[dim] = leaf_coords[i][dim] >> (depth - l);
+
+            auto found = lookup[l].find(coords);
+            int b;
+            if (found == lookup[l].end()) {
+                b = lev.boxes.size();
+                lookup[l][coords] = b;
+
+                box new_box;
+                new_box.coords = coords;
+                for (int dim = 0; dim < 3; dim++)
+                    new_box.center(dim) = corner(dim) + (coords[dim] + 0.5)*lev.size;
+                new_box.parent = -1;
+                if (l > 0) {
+                    index3 parent_coords = {coords[0] >> 1, coords[1] >> 1, coords[2] >> 1};
+                    new_box.parent = lookup[l-1][parent_coords];
+                    levels[l-1].boxes[new_box.parent].children.push_back(b);
+                }
+                lev.boxes.push_back(new_box);
+            }
+            else
+                b = found->second;
+
+            lev.boxes[b].particles.push_back(i);
+        }
+    }
+
+    // particles in the same or adjacent leaf boxes interact directly; each pair is stored once
+    const level& leaves = levels[depth];
+    for (int b = 0; b < int(leaves.boxes.size()); b++) {
+        const box& target = leaves.boxes[b];
+        for (int dx = -1; dx < 2; dx++) {
+            for (int dy = -1; dy < 2; dy++) {
+                for (int dz = -1; dz < 2; dz++) {
+                    index3 coords = {target.coords[0]+dx, target.coords[1]+dy, target.coords[2]+dz};
+                    auto found = lookup[depth].find(coords);
+                    if (found == lookup[depth].end() || found->second < b)
+                        continue;
+
+                    const box& source = leaves.boxes[found->second];
+                    for (int i: target.particles) {
+                        for (int j: source.particles) {
+                            if (found->second != b || i < j)
+                                near_pairs.push_back({i, j});
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    // interaction lists: children of the parent's neighbors that are not adjacent to the box
+    for (int l = 2; l < depth+1; l++) {
+        level& lev = levels[l];
+        std::map<index3,int> groups;
+
+        for (int b = 0; b < int(lev.boxes.size()); b++) {
+            const box& target = lev.boxes[b];
+            const box& parent = levels[l-1].boxes[target.parent];
+
+            for (int dx = -1; dx < 2; dx++) {
+                for (int dy = -1; dy < 2; dy++) {
+                    for (int dz = -1; dz < 2; dz++) {
+                        index3 coords = {parent.coords[0]+dx, parent.coords[1]+dy, parent.coords[2]+dz};
+                        auto found = lookup[l-1].find(coords);
+                        if (found == lookup[l-1].end())
+                            continue;
+
+                        for (int c: levels[l-1].boxes[found->second].children) {
+                            index3 offset;
+                            int separation = 0;
+                            for (int dim = 0; dim < 3; dim++) {
+                                offset[dim] = target.coords[dim] - lev.boxes[c].coords[dim];
+                                separation = std::max(separation, abs(offset[dim]));
+                            }
+                            if (separation < 2)
+                                continue;
+
+                            bool canonical = is_canonical(offset);
+                            if (!canonical) {
+                                for (int dim = 0; dim < 3; dim++)
+                                    offset[dim] *= -1;
+                            }
+
+                            auto group = groups.find(offset);
+                            if (group == groups.end()) {
+                                group = groups.insert({offset, int(lev.m2l.size())}).first;
+                                lev.m2l.push_back(m2l_group());
+                                lev.m2l.back().offset = offset;
+                            }
+
+                            auto& pairs = canonical ? lev.m2l[group->second].pairs
+                                                    : lev.m2l[group->second].flipped_pairs;
+                            pairs.push_back({b, c});
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+void fmm_operator::build_translations(double accuracy) {
+    int depth = levels.size() - 1;
+    first_level = depth + 1;
+    if (depth < 2)
+        return;
+
+    // rough operation counts of the M2L translations of a level versus the direct translations between
+    // the particles of its interaction lists; building a direct block (special functions and sums over
+    // about lmax terms per element) costs as much as about 4*size^2*(lmax+1) multiply-adds of the
+    // gathered M2L products
+    const double max_m2l_bytes = 4e9;
+    int size = 2*lmax_to_rmax(lmax);
+
+    for (int l = 2; l < depth+1; l++) {
+        int order = fmm_expansion_order(lmax, k, levels[l].size, accuracy);
+        double cols = 2*lmax_to_rmax(order);
+        double m2l_cost = 0, direct_cost = 0;
+
+        for (const auto& group: levels[l].m2l) {
+            for (const auto* pairs: {&group.pairs, &group.flipped_pairs}) {
+                for (const auto& pair: *pairs) {
+                    m2l_cost += cols*cols;
+                    direct_cost += double(levels[l].boxes[pair.first].particles.size())
+                                  *levels[l].boxes[pair.second].particles.size()*4*size*size*(lmax+1);
+                }
+            }
+        }
+
+        double m2l_bytes = levels[l].m2l.size()*cols*cols*sizeof(complex<double>);
+        if (m2l_cost < direct_cost && m2l_bytes < max_m2l_bytes) {
+            first_level = l;
+            break;
+        }
+    }
+
+    // interactions of the levels without expansions become direct pairs (each pair is stored once)
+    for (int l = 2; l < std::min(first_level, depth+1); l++) {
+        for (const auto& group: levels[l].m2l) {
+            for (const auto* pairs: {&group.pairs, &group.flipped_pairs}) {
+                for (const auto& pair: *pairs) {
+                    if (pair.first > pair.second)
+                        continue;
+
+                    for (int i: levels[l].boxes[pair.first].particles) {
+                        for (int j: levels[l].boxes[pair.second].particles)
+                            near_pairs.push_back({i, j});
+                    }
+                }
+            }
+        }
+        levels[l].m2l.clear();
+    }
+
+    if (first_level > depth)
+        return;
+
+    int max_order = lmax;
+    for (int l = first_level; l < depth+1; l++) {
+        levels[l].order = fmm_expansion_order(lmax, k, levels[l].size, accuracy);
+        max_order = std::max(max_order, levels[l].order);
+    }
+    table = &get_vsh_translation_table(max_order);
+
+    for (int l = first_level; l < depth+1; l++) {
+        level& lev = levels[l];
+        int rmax = lmax_to_rmax(lev.order);
+
+        // (-1)^(n+a) for every (a,n,m): reversing a displacement flips these signs on both sides
+        lev.parity = ComplexVector(2*rmax);
+        for (int a = 0; a < 2; a++) {
+            for (int n = 1; n < lev.order+1; n++) {
+                for (int m = -n; m < n+1; m++)
+                    lev.parity(a*rmax + n*(n+2) - n + m - 1) = ((n + a) % 2 == 0) ? 1 : -1;
+            }
+        }
+
+        #pragma omp parallel for schedule(dynamic)
+        for (int g = 0; g < int(lev.m2l.size()); g++) {
+            auto& group = lev.m2l[g];
+            vec3 d;
+            for (int dim = 0; dim < 3; dim++)
+                d(dim) = group.offset[dim]*lev.size;
+
+            auto sph = displacement_sph(d);
+            group.matrix = ComplexMatrix(2*rmax, 2*rmax);
+            vsh_translation_matrix(group.matrix, lev.order, lev.order, sph[0], sph[1], sph[2], k,
+                    vsh_mode::outgoing, *table);
+        }
+
+        if (l == first_level)
+            continue;
+
+        int parent_rmax = lmax_to_rmax(levels[l-1].order);
+        for (int o = 0; o < 8; o++) {
+            // displacement from the child's center to the parent's center
+            vec3 d;
+            for (int dim = 0; dim < 3; dim++)
+                d(dim) = (((o >> dim) & 1) ? -0.5 : 0.5)*lev.size;
+
+            auto sph = displacement_sph(d);
+            lev.m2m[o] = ComplexMatrix(2*parent_rmax, 2*rmax);
+            vsh_translation_matrix(lev.m2m[o], levels[l-1].order, lev.order, sph[0], sph[1], sph[2], k,
+                    vsh_mode::incident, *table);
+
+            sph = displacement_sph(-d);
+            lev.l2l[o] = ComplexMatrix(2*rmax, 2*parent_rmax);
+            vsh_translation_matrix(lev.l2l[o], lev.order, levels[l-1].order, sph[0], sph[1], sph[2], k,
+                    vsh_mode::incident, *table);
+        }
+    }
+}
+
+ComplexMatrix fmm_operator::apply(const Ref<const ComplexMatrix>& W) const {
+    int S = W.rows();
+    int size = 2*lmax_to_rmax(lmax);
+    int depth = levels.size() - 1;
+
+    ComplexMatrix result = ComplexMatrix::Zero(S, W.cols());
+
+    // near field: direct translations between particles of adjacent leaf boxes
+    const auto& near_table = get_vsh_translation_table(lmax);
+    #pragma omp parallel
+    {
+        ComplexMatrix block_ij(size, size);
+        ComplexMatrix block_ji(size, size);
+        ComplexMatrix result_local = ComplexMatrix::Zero(S, W.cols());
+
+        #pragma omp for schedule(dynamic, 64)
+        for (int pair = 0; pair < int(near_pairs.size()); pair++) {
+            int i = near_pairs[pair].first;
+            int j = near_pairs[pair].second;
+
+            vec3 dji = positions.row(i) - positions.row(j);
+            auto sph = displacement_sph(dji);
+            vsh_translation_block(block_ij, block_ji, lmax, sph[0], sph[1], sph[2], k, near_table);
+
+            result_local.middleCols(i*size, size).noalias() += W.middleCols(j*size, size)*block_ij.transpose();
+            result_local.middleCols(j*size, size).noalias() += W.middleCols(i*size, size)*block_ji.transpose();
+        }
+
+        #pragma omp critical
+        result += result_local;
+    }
+
+    if (first_level > depth)
+        return result;
+
+    // expansions of every level, one row per (box, vector)
+    std::vector<ComplexMatrix> multipole(depth+1), local(depth+1);
+    for (int l = first_level; l < depth+1; l++) {
+        int rows = levels[l].boxes.size()*S;
+        int cols = 2*lmax_to_rmax(levels[l].order);
+        multipole[l] = ComplexMatrix::Zero(rows, cols);
+        local[l] = ComplexMatrix::Zero(rows, cols);
+    }
+
+    const level& leaves = levels[depth];
+    int leaf_cols = 2*lmax_to_rmax(leaves.order);
+
+    // particles to leaf multipoles
+    #pragma omp parallel
+    {
+        ComplexMatrix T(leaf_cols, size);
+
+        #pragma omp for schedule(dynamic)
+        for (int b = 0; b < int(leaves.boxes.size()); b++) {
+            const box& leaf = leaves.boxes[b];
+            for (int j: leaf.particles) {
+                vec3 d = leaf.center - positions.row(j).transpose();
+                auto sph = displacement_sph(d);
+                vsh_translation_matrix(T, leaves.order, lmax, sph[0], sph[1], sph[2], k, vsh_mode::incident, *table);
+                multipole[depth].middleRows(b*S, S).noalias() += W.middleCols(j*size, size)*T.transpose();
+            }
+        }
+    }
+
+    // children multipoles to parent multipoles
+    for (int l = depth; l > first_level; l--) {
+        const level& lev = levels[l];
+
+        #pragma omp parallel for schedule(dynamic)
+        for (int p = 0; p < int(levels[l-1].boxes.size()); p++) {
+            for (int c: levels[l-1].boxes[p].children) {
+                int o = octant(lev.boxes[c].coords);
+                multipole[l-1].middleRows(p*S, S).noalias() += multipole[l].middleRows(c*S, S)*lev.m2m[o].transpose();
+            }
+        }
+    }
+
+    // multipoles to locals of well-separated boxes, grouped by displacement
+    for (int l = first_level; l < depth+1; l++) {
+        const level& lev = levels[l];
+
+        for (const auto& group: lev.m2l) {
+            int npairs = group.pairs.size() + group.flipped_pairs.size();
+            ComplexMatrix X(npairs*S, multipole[l].cols());
+
+            int counter = 0;
+            for (const auto& pair: group.pairs)
+                X.middleRows(S*counter++, S) = multipole[l].middleRows(pair.second*S, S);
+            for (const auto& pair: group.flipped_pairs)
+                X.middleRows(S*counter++, S) = multipole[l].middleRows(pair.second*S, S)*lev.parity.asDiagonal();
+
+            ComplexMatrix Z = X*group.matrix.transpose();
+
+            counter = 0;
+            for (const auto& pair: group.pairs)
+                local[l].middleRows(pair.first*S, S) += Z.middleRows(S*counter++, S);
+            for (const auto& pair: group.flipped_pairs)
+                local[l].middleRows(pair.first*S, S) += Z.middleRows(S*counter++, S)*lev.parity.asDiagonal();
+        }
+    }
+
+    // parent locals to children locals
+    for (int l = first_level+1; l < depth+1; l++) {
+        const level& lev = levels[l];
+
+        #pragma omp parallel for schedule(dynamic)
+        for (int b = 0; b < int(lev.boxes.size()); b++) {
+            int o = octant(lev.boxes[b].coords);
+            local[l].middleRows(b*S, S).noalias() += local[l-1].middleRows(lev.boxes[b].parent*S, S)*lev.l2l[o].transpose();
+        }
+    }
+
+    // leaf locals to particles
+    #pragma omp parallel
+    {
+        ComplexMatrix T(size, leaf_cols);
+
+        #pragma omp for schedule(dynamic)
+        for (int b = 0; b < int(leaves.boxes.size()); b++) {
+            const box& leaf = leaves.boxes[b];
+            for (int i: leaf.particles) {
+                vec3 d = positions.row(i).transpose() - leaf.center;
+                auto sph = displacement_sph(d);
+                vsh_translation_matrix(T, lmax, leaves.order, sph[0], sph[1], sph[2], k, vsh_mode::incident, *table);
+                result.middleCols(i*size, size).noalias() += local[depth].middleRows(b*S, S)*T.transpose();
+            }
+        }
+    }
+
+    return result;
+}
@@ -0,0 +1,73 @@
+#ifndef GUARD_fmm_h
+#define GUARD_fmm_h
+
+#include <complex>
+#include <vector>
+#include <array>
+#include <utility>
+#include "vec.hpp"
+
+struct vsh_translation_table;
+
+// Multilevel fast multipole evaluation of the particle-to-particle translations
+//     y_i = sum_{j != i} A_ij w_j
+// (the operator applied by translation_product). Particles are sorted into an octree: particles in
+// neighboring leaf boxes interact directly, while well-separated boxes interact through outgoing
+// (multipole) and regular (local) expansions about the box centers. The expansion order of every
+// level is chosen from the box size and the requested relative accuracy. The translation matrices are
+// dense, so expansions are only used from the coarsest level at which they are cheaper than the direct
+// translations they replace; the interactions of coarser levels are evaluated directly.
+class fmm_operator {
+public:
+    fmm_operator(const Ref<const position_t>& positions, int lmax, double k, double accuracy,
+            int leaf_size = 8);
+
+    // apply the operator to every row of W[S,2*rmax*N]
+    ComplexMatrix apply(const Ref<const ComplexMatrix>& W) const;
+
+    int depth() const {return levels.size() - 1;}
+    std::vector<int> expansion_orders() const;
+    std::vector<int> boxes_per_level() const;
+
+private:
+    struct box {
+        std::array<int,3> coords;
+        vec3 center;
+        int parent;
+        std::vector<int> children;
+        std::vector<int> particles;      // particles inside the box (and its descendants)
+    };
+
+    // M2L translations of one level that share the same displacement (up to a sign)
+    struct m2l_group {
+        std::array<int,3> offset;                        // displacement of the target box, in box sizes
+        ComplexMatrix matrix;
+        std::vector<std::pair<int,int>> pairs;           // (target, source) box indices
+        std::vector<std::pair<int,int>> flipped_pairs;   // pairs with the opposite displacement
+    };
+
+    struct level {
+        double size;
+        int order = 0;
+        std::vector<box> boxes;
+        ComplexVector parity;              // (-1)^(n+a) for every (a,n,m) of the level's expansions
+        std::vector<m2l_group> m2l;
+        std::array<ComplexMatrix,8> m2m;   // child to parent, by child octant
+        std::array<ComplexMatrix,8> l2l;   // parent to child, by child octant
+    };
+
+    position_t positions;
+    int lmax;
+    double k;
+    std::vector<level> levels;
+    int first_level;                   // coarsest level that uses expansions
+    std::vector<std::pair<int,int>> near_pairs;
+    const vsh_translation_table* table = nullptr;
+
+    void build_tree(int leaf_size);
+    void build_translations(double accuracy);
+};
+
+int fmm_expansion_order(int lmax, double k, double box_size, double accuracy);
+
+#endif
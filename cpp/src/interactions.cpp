@@ -2,8 +2,14 @@
 #include "interactions.hpp"
 #include "vsh_translation.hpp"
 #include "indices.hpp"
+#include "fmm.hpp"
+#include "special.hpp"
 #include <cmath>
+#include <algorithm>
+#include <limits>
+#include <unordered_map>
 #include <Eigen/IterativeLinearSolvers>
+#include <Eigen/SVD>
 #include <omp.h>
 
 using std::complex;
@@ -35,55 +41,147 @@ complex<double> dot_product(const Ref<const ComplexVector>& x, const Ref<const C
     return std::complex<double>(real_part, imag_part);
 }
 
-ComplexVector bicgstab(const Ref<const ComplexMatrix>& A, const Ref<const ComplexVector>& b,
-        int maxiter, double tolerance) {
+// conj(x_s)·y_s for every row s of X and Y
+static ComplexVector rowwise_dot_product(const Ref<const ComplexMatrix>& X, const Ref<const ComplexMatrix>& Y) {
+    return X.conjugate().cwiseProduct(Y).rowwise().sum();
+}
+
+template <class T>
+static T select_rows(const T& X, const std::vector<int>& rows) {
+    T ret(rows.size(), X.cols());
+    for (int s = 0; s < int(rows.size()); s++)
+        ret.row(s) = X.row(rows[s]);
+
+    return ret;
+}
+
+// record the final residuals of a solve: the largest relative residual over all right-hand sides,
+// converged if it is below the tolerance
+static void finalize_solve_info(solve_info& info, const Eigen::VectorXd& residual,
+        const Eigen::VectorXd& b_norm, double tolerance) {
 
-    int size = b.size();
+    info.residual = (residual.array()/b_norm.array()).maxCoeff();
+    info.converged = info.residual < tolerance;
+}
+
+ComplexMatrix bicgstab_operator(const linear_operator& A, const Ref<const ComplexMatrix>& B,
+        const Ref<const ComplexMatrix>& X0, solve_info& info, int maxiter, double tolerance) {
+
+    // every row of B is an independent right-hand side; all rows share each application of A
+    // and a row is removed from the iteration as soon as it has converged
+    int nrhs = B.rows();
+    ComplexMatrix solution = X0;
+
+    // residuals are relative to |b| (or 1 for a vanishing right-hand side), both in the convergence test
+    // and in the report
+    Eigen::VectorXd b_norm = B.rowwise().norm();
+    b_norm = (b_norm.array() > 0).select(b_norm, 1);
 
     // step 1
-    ComplexVector x_prev = b;
-    ComplexVector r_prev = b - matrix_vector_product(A, x_prev);
+    ComplexMatrix x_prev = X0;
+    ComplexMatrix r_prev = B - A(x_prev);
+
+    info.iterations = 0;
+    info.residual_history.clear();
+
+    std::vector<int> active;
+    Eigen::VectorXd residual = r_prev.rowwise().norm();
+    info.residual_history.push_back((residual.array()/b_norm.array()).maxCoeff());
+    for (int s = 0; s < nrhs; s++) {
+        if (residual(s) >= tolerance*b_norm(s))
+            active.push_back(s);
+    }
+
+    if (active.empty()) {
+        finalize_solve_info(info, residual, b_norm, tolerance);
+        return solution;
+    }
 
-    double error = (r_prev).norm();
-    if (error < tolerance)
-        return x_prev;
+    if (int(active.size()) < nrhs) {
+        x_prev = select_rows(x_prev, active);
+        r_prev = select_rows(r_prev, active);
+    }
 
     // step 2
-    ComplexVector r_hat = r_prev;
+    ComplexMatrix r_hat = r_prev;
 
     // step 3
-    complex<double> rho_prev = 1;
-    complex<double> alpha    = 1;
-    complex<double> w_prev   = 1;
+    int nactive = active.size();
+    ComplexVector rho_prev = ComplexVector::Ones(nactive);
+    ComplexVector alpha    = ComplexVector::Ones(nactive);
+    ComplexVector w_prev   = ComplexVector::Ones(nactive);
 
     // step 4
-    ComplexVector v_prev = ComplexVector::Zero(size);
-    ComplexVector p_prev = ComplexVector::Zero(size);
+    ComplexMatrix v_prev = ComplexMatrix::Zero(nactive, B.cols());
+    ComplexMatrix p_prev = ComplexMatrix::Zero(nactive, B.cols());
 
     // step 5
     int current_iteration = 1;
 
     while (true) {
-        //complex<double> rho_i = r_hat.dot(r_prev);
-        complex<double> rho_i = dot_product(r_hat, r_prev);
-        complex<double> beta = (rho_i/rho_prev)*(alpha/w_prev);
-        ComplexVector pi = r_prev + beta*(p_prev - w_prev*v_prev);
-        ComplexVector vi = matrix_vector_product(A, pi);
-
-        //alpha = rho_i/r_hat.dot(vi);
-        alpha = rho_i/dot_product(r_hat, vi);
-        ComplexVector h = x_prev + alpha*pi;
-
-        ComplexVector s = r_prev - alpha*vi;
-        ComplexVector t = matrix_vector_product(A, s);
-        //complex<double> w_i = t.dot(s)/t.dot(t);
-        complex<double> w_i = dot_product(t,s)/dot_product(t,t);
-        ComplexVector xi = h + w_i*s;
-        ComplexVector ri = s - w_i*t;
-
-        error = ri.norm();
-        if (error < tolerance || current_iteration > maxiter)
-            return xi;
+        ComplexVector rho_i = rowwise_dot_product(r_hat, r_prev);
+        ComplexVector beta = (rho_i.array()/rho_prev.array())*(alpha.array()/w_prev.array());
+        ComplexMatrix pi = r_prev + beta.asDiagonal()*(p_prev - w_prev.asDiagonal()*v_prev);
+        ComplexMatrix vi = A(pi);
+
+        alpha = rho_i.array()/rowwise_dot_product(r_hat, vi).array();
+        ComplexMatrix h = x_prev + alpha.asDiagonal()*pi;
+        ComplexMatrix s = r_prev - alpha.asDiagonal()*vi;
+
+        // rows with a vanishing s are finished; their w_i below is undefined but it stays confined
+        // to those rows, since every operation is row by row
+        Eigen::VectorXd s_error = s.rowwise().norm();
+
+        ComplexMatrix t = A(s);
+        ComplexVector w_i = rowwise_dot_product(t,s).array()/rowwise_dot_product(t,t).array();
+        ComplexMatrix xi = h + w_i.asDiagonal()*s;
+        ComplexMatrix ri = s - w_i.asDiagonal()*t;
+
+        Eigen::VectorXd error = ri.rowwise().norm();
+        info.iterations = current_iteration;
+
+        std::vector<int> remaining;
+        double largest_residual = 0;
+        for (int row = 0; row < nactive; row++) {
+            int rhs = active[row];
+
+            if (s_error(row) < tolerance*b_norm(rhs)) {
+                solution.row(rhs) = h.row(row);
+                residual(rhs) = s_error(row);
+            }
+            else {
+                residual(rhs) = error(row);
+                if (error(row) < tolerance*b_norm(rhs) || current_iteration >= maxiter)
+                    solution.row(rhs) = xi.row(row);
+                else
+                    remaining.push_back(row);
+            }
+
+            largest_residual = std::max(largest_residual, residual(rhs)/b_norm(rhs));
+        }
+        info.residual_history.push_back(largest_residual);
+
+        if (remaining.empty()) {
+            finalize_solve_info(info, residual, b_norm, tolerance);
+            return solution;
+        }
+
+        if (int(remaining.size()) < nactive) {
+            xi = select_rows(xi, remaining);
+            ri = select_rows(ri, remaining);
+            r_hat = select_rows(r_hat, remaining);
+            vi = select_rows(vi, remaining);
+            pi = select_rows(pi, remaining);
+            rho_i = select_rows(rho_i, remaining);
+            alpha = select_rows(alpha, remaining);
+            w_i = select_rows(w_i, remaining);
+
+            std::vector<int> still_active;
+            for (int row: remaining)
+                still_active.push_back(active[row]);
+            active = still_active;
+            nactive = active.size();
+        }
 
         x_prev   = xi;
         r_prev   = ri;
@@ -96,84 +194,548 @@ ComplexVector bicgstab(const Ref<const ComplexMatrix>& A, const Ref<const Comple
     }
 }
 
-ComplexVector solve_linear_system(const Ref<const ComplexMatrix>& agg_tmatrix,
-        const Ref<const ComplexVector>& p_src, solver method) {
+ComplexVector bicgstab(const Ref<const ComplexMatrix>& A, const Ref<const ComplexVector>& b,
+        int maxiter, double tolerance) {
+
+    auto matvec = [&A](const Ref<const ComplexMatrix>& X) {
+        ComplexMatrix ret = matrix_vector_product(A, X.row(0).transpose()).transpose();
+        return ret;
+    };
 
+    solve_info info;
+    ComplexMatrix B = b.transpose();
+    return bicgstab_operator(matvec, B, B, info, maxiter, tolerance).row(0).transpose();
+}
+
+interaction_factorization::interaction_factorization(const Ref<const ComplexMatrix>& agg_tmatrix) {
     ComplexMatrix interaction_matrix = agg_tmatrix;
     for (int i = 0; i < interaction_matrix.cols(); i++)
         interaction_matrix(i,i) += 1;
+
+    lu.compute(interaction_matrix);
+}
+
+solve_result interaction_factorization::solve(const Ref<const ComplexMatrix>& p_src) const {
+    // rows of p_src are separate right-hand sides
+    ComplexMatrix solution = lu.solve(p_src.transpose()).transpose();
+
+    // a direct solve has no residual estimate
+    solve_info info;
+    info.residual = std::numeric_limits<double>::quiet_NaN();
+    return std::make_tuple(solution, info);
+}
+
+solve_result solve_linear_system(const Ref<const ComplexMatrix>& agg_tmatrix,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0, solver method,
+        int maxiter, double tolerance) {
+
+    if (method == solver::exact)
+        return interaction_factorization(agg_tmatrix).solve(p_src);
+
+    ComplexMatrix interaction_matrix = agg_tmatrix;
+    for (int i = 0; i < interaction_matrix.cols(); i++)
+        interaction_matrix(i,i) += 1;
+
+    // rows of X are separate right-hand sides: a single one is a parallel matrix-vector product,
+    // several are combined into one matrix-matrix product
+    auto matvec = [&interaction_matrix](const Ref<const ComplexMatrix>& X) {
+        ComplexMatrix ret;
+        if (X.rows() == 1)
+            ret = matrix_vector_product(interaction_matrix, X.row(0).transpose()).transpose();
+        else
+            ret = X*interaction_matrix.transpose();
+        return ret;
+    };
+
+    solve_info info;
+    ComplexMatrix solution;
     
     switch (method) {
-        case solver::exact:  // TODO: implment
         default:
+        case solver::matrix_free:
         case solver::bicgstab:
             //Eigen::BiCGSTAB<ComplexMatrix> solver;
             //solver.setTolerance(1e-5);
             //solver.compute(interaction_matrix);
             //return solver.solveWithGuess(p_src, p_src);
-            return bicgstab(interaction_matrix, p_src);
+            solution = bicgstab_operator(matvec, p_src, x0, info, maxiter, tolerance);
     }
-}
 
-ComplexMatrix sphere_aggregate_tmatrix(const Ref<const position_t>& positions,
-        const Ref<const ComplexMatrix>& mie, double k) {
+    return std::make_tuple(solution, info);
+}
 
+// expand mie[N,2*lmax] to the diagonal of each sphere's T-matrix, mie_diag[N,2*rmax]
+static ComplexMatrix expand_mie_diagonal(const Ref<const ComplexMatrix>& mie) {
     int lmax = mie.cols()/2;
     int rmax = lmax_to_rmax(lmax);
+    int Nparticles = mie.rows();
+
+    ComplexMatrix mie_diag(Nparticles, 2*rmax);
+
+    for (int i = 0; i < Nparticles; i++) {
+        for (int b = 0; b < 2; b++) {
+            for (int v = 1; v < lmax+1; v++) {
+                for (int u = -v; u < v+1; u++) {
+                    int idx = b*(rmax) + v*(v+2) - v + u - 1;
+                    mie_diag(i, idx) = mie(i, b*lmax + v-1);
+                }
+            }
+        }
+    }
+
+    return mie_diag;
+}
+
+// particle pairs (i < j) that share a displacement; flipped pairs have the opposite displacement
+struct displacement_group {
+    Vector3d dji;
+    std::vector<std::array<int,3>> pairs;    // (i, j, flipped)
+};
+
+struct key_hash {
+    size_t operator()(const std::array<long long,3>& key) const {
+        size_t h = 0;
+        for (long long x: key)
+            h = h*1000003 ^ std::hash<long long>()(x);
+        return h;
+    }
+};
+
+// group the particle pairs by displacement dji = r_i - r_j, up to sign; displacements are matched after
+// rounding to 1e-10 of the cluster size, a change that is far below the accuracy of the translations.
+// If changed is not empty, only the pairs with a changed particle are grouped
+static std::vector<displacement_group> group_displacements(const Ref<const position_t>& positions,
+        const std::vector<bool>& changed = {}) {
     int Nparticles = positions.rows();
-    int size = 2*rmax*Nparticles;
+    std::vector<displacement_group> groups;
+    if (Nparticles < 2)
+        return groups;
 
-    ComplexMatrix agg_tmatrix = ComplexMatrix::Zero(size, size);
+    double extent = (positions.colwise().maxCoeff() - positions.colwise().minCoeff()).maxCoeff();
+    double quantum = (extent > 0 ? extent : 1)*1e-10;
 
-    if (Nparticles == 1)
-        return agg_tmatrix;
-    
-    int N = Nparticles*(Nparticles-1)/2;
-    Array ivals(N);
-    Array jvals(N);
-    int counter = 0;
+    std::unordered_map<std::array<long long,3>, int, key_hash> lookup;
 
     for (int i = 0; i < Nparticles; i++) {
         for (int j = i+1; j < Nparticles; j++) {
-            ivals(counter) = i;
-            jvals(counter) = j;
-            counter += 1;
+            if (!changed.empty() && !changed[i] && !changed[j])
+                continue;
+
+            Vector3d dji = positions.row(i) - positions.row(j);
+
+            std::array<long long,3> key;
+            for (int d = 0; d < 3; d++)
+                key[d] = std::llround(dji(d)/quantum);
+
+            // the canonical sign has a positive first non-zero component
+            bool flipped = false;
+            for (int d = 0; d < 3; d++) {
+                if (key[d] != 0) {
+                    flipped = key[d] < 0;
+                    break;
+                }
+            }
+            if (flipped) {
+                for (int d = 0; d < 3; d++)
+                    key[d] *= -1;
+            }
+
+            auto found = lookup.find(key);
+            if (found == lookup.end()) {
+                found = lookup.insert({key, int(groups.size())}).first;
+                groups.push_back({flipped ? Vector3d(-dji) : dji, {}});
+            }
+            groups[found->second].pairs.push_back({i, j, flipped});
         }
     }
-    
-    auto vsh_precompute = create_vsh_cache_map(lmax);
 
-    #pragma omp parallel for
-    for (int ij = 0; ij < N; ij++) {
-        int i = ivals(ij);
-        int j = jvals(ij);
+    return groups;
+}
+
+// insert(i, j, A_ij) writes the (i,j) block of the aggregate T-matrix from the translation A_ij
+using block_insert = std::function<void(int, int, const ComplexMatrix&)>;
+
+// rows a*rmax + r (r < rmax_i) and columns b*rmax + s (s < rmax_j) of a [2*rmax,2*rmax] translation block;
+// the modes of a lower order are the leading modes of a higher order
+static ComplexMatrix truncate_translation_block(const ComplexMatrix& block, int rmax_i, int rmax_j) {
+    int rmax = block.rows()/2;
+    ComplexMatrix truncated(2*rmax_i, 2*rmax_j);
+    for (int a = 0; a < 2; a++) {
+        for (int b = 0; b < 2; b++)
+            truncated.block(a*rmax_i, b*rmax_j, rmax_i, rmax_j) = block.block(a*rmax, b*rmax, rmax_i, rmax_j);
+    }
+
+    return truncated;
+}
+
+// translate every distinct pair displacement once and insert it for all pairs that share it;
+// with per-particle lmax, each displacement is translated at the largest lmax of its pairs
+// and insert(i, j, A_ij) receives A_ij truncated to [2*rmax_i, 2*rmax_j]
+static aggregate_stats insert_translation_blocks(const Ref<const position_t>& positions,
+        const std::vector<int>& lmax, double k, translation_kernel kernel, const block_insert& insert,
+        const std::vector<bool>& changed = {}) {
 
-        Vector3d dji = positions.row(i) - positions.row(j);
+    std::vector<displacement_group> groups = group_displacements(positions, changed);
 
-        double rad = dji.norm();
-        double theta = acos(dji(2)/rad);
-        double phi = atan2(dji(1), dji(0));
+    #pragma omp parallel
+    {
+        ComplexMatrix block_ij, block_ji;
 
-        vsh_translation_insert_pair(agg_tmatrix, mie, i, j, rad, theta, phi, k, vsh_precompute);
-    } 
+        #pragma omp for schedule(dynamic)
+        for (int g = 0; g < int(groups.size()); g++) {
+            const Vector3d& dji = groups[g].dji;
+
+            int lmax_g = 0;
+            for (const auto& pair: groups[g].pairs)
+                lmax_g = std::max({lmax_g, lmax[pair[0]], lmax[pair[1]]});
+            int size = 2*lmax_to_rmax(lmax_g);
+            block_ij.resize(size, size);
+            block_ji.resize(size, size);
+
+            double rad = dji.norm();
+            double theta = acos(dji(2)/rad);
+            double phi = atan2(dji(1), dji(0));
+            vsh_translation_block(block_ij, block_ji, lmax_g, rad, theta, phi, k,
+                    get_vsh_translation_table(lmax_g), kernel);
+
+            for (const auto& pair: groups[g].pairs) {
+                int i = pair[0], j = pair[1];
+                bool flipped = pair[2];
+                const ComplexMatrix& A_ij = flipped ? block_ji : block_ij;
+                const ComplexMatrix& A_ji = flipped ? block_ij : block_ji;
+
+                if (lmax[i] == lmax_g && lmax[j] == lmax_g) {
+                    insert(i, j, A_ij);
+                    insert(j, i, A_ji);
+                }
+                else {
+                    int rmax_i = lmax_to_rmax(lmax[i]);
+                    int rmax_j = lmax_to_rmax(lmax[j]);
+                    insert(i, j, truncate_translation_block(A_ij, rmax_i, rmax_j));
+                    insert(j, i, truncate_translation_block(A_ji, rmax_j, rmax_i));
+                }
+            }
+        }
+    }
+
+    aggregate_stats stats;
+    for (const auto& group: groups)
+        stats.pairs += group.pairs.size();
+    stats.unique_translations = groups.size();
+    return stats;
+}
+
+static aggregate_stats insert_translation_blocks(const Ref<const position_t>& positions,
+        int lmax, double k, translation_kernel kernel, const block_insert& insert,
+        const std::vector<bool>& changed = {}) {
+    return insert_translation_blocks(positions, std::vector<int>(positions.rows(), lmax), k, kernel, insert, changed);
+}
+
+// mark the changed particles, changed[i] for every i in indices
+static std::vector<bool> changed_mask(int Nparticles, const std::vector<int>& indices) {
+    std::vector<bool> changed(Nparticles, false);
+    for (int i: indices)
+        changed.at(i) = true;
+
+    return changed;
+}
+
+// write the blocks A_ij T_j of the sphere pairs (with a changed sphere, if changed is not empty)
+static aggregate_stats insert_sphere_blocks(Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, translation_kernel kernel, const std::vector<bool>& changed = {}) {
+
+    int lmax = mie.cols()/2;
+    int block_size = 2*lmax_to_rmax(lmax);
+    ComplexMatrix mie_diag = expand_mie_diagonal(mie);
+
+    auto insert = [&](int i, int j, const ComplexMatrix& block) {
+        agg_tmatrix.block(i*block_size, j*block_size, block_size, block_size).noalias()
+            = block*mie_diag.row(j).asDiagonal();
+    };
+
+    return insert_translation_blocks(positions, lmax, k, kernel, insert, changed);
+}
+
+// write the blocks A_ij T_j of the particle pairs (with a changed particle, if changed is not empty)
+// in the ragged layout of ragged_offsets(lmax); T_j keeps the leading [2,rmax_j,2,rmax_j] modes
+// of the padded [2,rmax,2,rmax] T-matrix
+static aggregate_stats insert_particle_blocks(Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, const std::vector<int>& lmax, double k, translation_kernel kernel,
+        const std::vector<bool>& changed = {}) {
+
+    int padded_size = tmatrix.dimensions()[1];
+    int padded_rmax = padded_size/2;
+    std::vector<int> offsets = ragged_offsets(lmax);
+
+    auto insert = [&](int i, int j, const ComplexMatrix& block) {
+        Eigen::Map<const ComplexMatrix> T_padded(tmatrix.data() + j*padded_size*padded_size, padded_size, padded_size);
+        int rmax_j = lmax_to_rmax(lmax[j]);
+
+        if (rmax_j == padded_rmax) {
+            agg_tmatrix.block(offsets[i], offsets[j], block.rows(), block.cols()).noalias() = block*T_padded;
+            return;
+        }
+
+        ComplexMatrix T_j(2*rmax_j, 2*rmax_j);
+        for (int a = 0; a < 2; a++) {
+            for (int b = 0; b < 2; b++)
+                T_j.block(a*rmax_j, b*rmax_j, rmax_j, rmax_j) = T_padded.block(a*padded_rmax, b*padded_rmax, rmax_j, rmax_j);
+        }
+
+        agg_tmatrix.block(offsets[i], offsets[j], block.rows(), block.cols()).noalias() = block*T_j;
+    };
+
+    return insert_translation_blocks(positions, lmax, k, kernel, insert, changed);
+}
+
+ComplexMatrix sphere_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, aggregate_stats* stats, translation_kernel kernel) {
+
+    int lmax = mie.cols()/2;
+    int rmax = lmax_to_rmax(lmax);
+    int Nparticles = positions.rows();
+    int block_size = 2*rmax;
+    int size = block_size*Nparticles;
+
+    ComplexMatrix agg_tmatrix = ComplexMatrix::Zero(size, size);
+
+    aggregate_stats build_stats = insert_sphere_blocks(agg_tmatrix, positions, mie, k, kernel);
+    if (stats)
+        *stats = build_stats;
 
     return agg_tmatrix;
 }
 
+aggregate_stats sphere_update_aggregate_tmatrix(Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, const std::vector<int>& changed, translation_kernel kernel) {
+
+    return insert_sphere_blocks(agg_tmatrix, positions, mie, k, kernel, changed_mask(positions.rows(), changed));
+}
+
 ComplexMatrix particle_aggregate_tmatrix(const Ref<const position_t>& positions,
-        const tmatrix_t& tmatrix, double k) {
+        const tmatrix_t& tmatrix, double k, aggregate_stats* stats, translation_kernel kernel) {
 
     int rmax = tmatrix.dimensions()[1]/2;
     int lmax = rmax_to_lmax(rmax);
-
     int Nparticles = positions.rows();
-    int size = 2*rmax*Nparticles;
+    int block_size = 2*rmax;
+    int size = block_size*Nparticles;
+
+    ComplexMatrix agg_tmatrix = ComplexMatrix::Zero(size, size);
+
+    aggregate_stats build_stats = insert_particle_blocks(agg_tmatrix, positions, tmatrix,
+            std::vector<int>(Nparticles, lmax), k, kernel);
+    if (stats)
+        *stats = build_stats;
+
+    return agg_tmatrix;
+}
+
+std::vector<int> ragged_offsets(const std::vector<int>& lmax) {
+    std::vector<int> offsets(lmax.size() + 1, 0);
+    for (size_t i = 0; i < lmax.size(); i++)
+        offsets[i+1] = offsets[i] + 2*lmax_to_rmax(lmax[i]);
+
+    return offsets;
+}
+
+ComplexMatrix particle_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, const std::vector<int>& lmax, double k, aggregate_stats* stats,
+        translation_kernel kernel) {
 
+    int size = ragged_offsets(lmax).back();
     ComplexMatrix agg_tmatrix = ComplexMatrix::Zero(size, size);
 
+    aggregate_stats build_stats = insert_particle_blocks(agg_tmatrix, positions, tmatrix, lmax, k, kernel);
+    if (stats)
+        *stats = build_stats;
+
+    return agg_tmatrix;
+}
+
+aggregate_stats particle_update_aggregate_tmatrix(Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, const std::vector<int>& lmax, double k, const std::vector<int>& changed,
+        translation_kernel kernel) {
+
+    return insert_particle_blocks(agg_tmatrix, positions, tmatrix, lmax, k, kernel,
+            changed_mask(positions.rows(), changed));
+}
+
+ComplexMatrix sparse_interaction_matrix::apply(const Ref<const ComplexMatrix>& X) const {
+    int Nparticles = indptr.size() - 1;
+    ComplexMatrix result = ComplexMatrix::Zero(X.rows(), X.cols());
+
+    #pragma omp parallel for schedule(dynamic)
+    for (int i = 0; i < Nparticles; i++) {
+        for (int s = indptr[i]; s < indptr[i+1]; s++) {
+            result.middleCols(i*block_size, block_size).noalias() +=
+                X.middleCols(indices[s]*block_size, block_size)*blocks.middleRows(s*block_size, block_size).transpose();
+        }
+    }
+
+    return result;
+}
+
+// Build the block-sparse aggregate T-matrix, keeping block (i,j) if the particles are no farther apart
+// than cutoff and the estimated coupling |A_ij T_j| is at least coupling_cutoff.
+// In the far field |A_ij| ~ rmax*|h_n(kr)| for any n <= 2*lmax; |h_2lmax(kr)| also bounds the near field,
+// so the coupling is estimated as rmax*|h_2lmax(kr)|*tmatrix_norm[j].
+// multiply_tmatrix(out, A_ij, j) writes out = A_ij T_j
+using tmatrix_product = std::function<void(Ref<ComplexMatrix>, const Ref<const ComplexMatrix>&, int)>;
+
+static sparse_interaction_matrix sparse_aggregate_tmatrix(const Ref<const position_t>& positions,
+        int lmax, double k, const std::vector<double>& tmatrix_norm, double cutoff, double coupling_cutoff,
+        translation_kernel kernel, const tmatrix_product& multiply_tmatrix) {
+
+    int rmax = lmax_to_rmax(lmax);
+    int size = 2*rmax;
+    int Nparticles = positions.rows();
+
+    sparse_interaction_matrix agg;
+    agg.block_size = size;
+
+    std::vector<std::vector<int>> rows(Nparticles);
+    std::vector<double> dropped(Nparticles, 0);
+
+    #pragma omp parallel for schedule(dynamic)
+    for (int i = 0; i < Nparticles; i++) {
+        for (int j = 0; j < Nparticles; j++) {
+            if (i == j)
+                continue;
+
+            double rad = (positions.row(i) - positions.row(j)).norm();
+            if (rad <= cutoff && coupling_cutoff == 0) {
+                rows[i].push_back(j);
+                continue;
+            }
+
+            double coupling = rmax*std::abs(spherical_hn(2*lmax, k*rad))*tmatrix_norm[j];
+            if (rad <= cutoff && coupling >= coupling_cutoff)
+                rows[i].push_back(j);
+            else
+                dropped[i] += coupling;
+        }
+    }
+
+    agg.indptr.resize(Nparticles+1);
+    agg.indptr[0] = 0;
+    for (int i = 0; i < Nparticles; i++) {
+        agg.indptr[i+1] = agg.indptr[i] + rows[i].size();
+        agg.indices.insert(agg.indices.end(), rows[i].begin(), rows[i].end());
+    }
+    agg.blocks = ComplexMatrix(agg.indptr[Nparticles]*size, size);
+    agg.dropped_coupling = Nparticles > 0 ? *std::max_element(dropped.begin(), dropped.end()) : 0;
+
+    // slot of block (i,j), or -1 if it was dropped
+    auto find_block = [&agg](int i, int j) {
+        auto first = agg.indices.begin() + agg.indptr[i];
+        auto last = agg.indices.begin() + agg.indptr[i+1];
+        auto found = std::lower_bound(first, last, j);
+        return (found != last && *found == j) ? int(found - agg.indices.begin()) : -1;
+    };
+
+    const auto& table = get_vsh_translation_table(lmax);
+
+    // both blocks of a pair are computed together, by the particle with the lower index unless it dropped the pair
+    #pragma omp parallel
+    {
+        ComplexMatrix block_ij(size, size);
+        ComplexMatrix block_ji(size, size);
+
+        #pragma omp for schedule(dynamic)
+        for (int i = 0; i < Nparticles; i++) {
+            for (int s = agg.indptr[i]; s < agg.indptr[i+1]; s++) {
+                int j = agg.indices[s];
+                int s_ji = find_block(j, i);
+                if (j < i && s_ji != -1)
+                    continue;
+
+                Vector3d dji = positions.row(i) - positions.row(j);
+                double rad = dji.norm();
+                double theta = acos(dji(2)/rad);
+                double phi = atan2(dji(1), dji(0));
+
+                vsh_translation_block(block_ij, block_ji, lmax, rad, theta, phi, k, table, kernel);
+                multiply_tmatrix(agg.blocks.middleRows(s*size, size), block_ij, j);
+                if (j > i && s_ji != -1)
+                    multiply_tmatrix(agg.blocks.middleRows(s_ji*size, size), block_ji, i);
+            }
+        }
+    }
+
+    return agg;
+}
+
+sparse_interaction_matrix sphere_sparse_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, double cutoff, double coupling_cutoff,
+        translation_kernel kernel) {
+
+    int lmax = mie.cols()/2;
+    ComplexMatrix mie_diag = expand_mie_diagonal(mie);
+
+    std::vector<double> mie_norm(mie.rows());
+    for (int i = 0; i < mie.rows(); i++)
+        mie_norm[i] = mie.row(i).cwiseAbs().maxCoeff();
+
+    auto multiply_tmatrix = [&mie_diag](Ref<ComplexMatrix> out, const Ref<const ComplexMatrix>& block, int j) {
+        out.noalias() = block*mie_diag.row(j).asDiagonal();
+    };
+
+    return sparse_aggregate_tmatrix(positions, lmax, k, mie_norm, cutoff, coupling_cutoff, kernel, multiply_tmatrix);
+}
+
+sparse_interaction_matrix particle_sparse_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k, double cutoff, double coupling_cutoff,
+        translation_kernel kernel) {
+
+    int size = tmatrix.dimensions()[1];
+    int lmax = rmax_to_lmax(size/2);
+    int Nparticles = tmatrix.dimensions()[0];
+
+    std::vector<double> tmatrix_norm(Nparticles);
+    for (int i = 0; i < Nparticles; i++) {
+        Eigen::Map<const ComplexMatrix> T(tmatrix.data() + i*size*size, size, size);
+        tmatrix_norm[i] = Eigen::JacobiSVD<ComplexMatrix>(T).singularValues()(0);
+    }
+
+    auto multiply_tmatrix = [&tmatrix, size](Ref<ComplexMatrix> out, const Ref<const ComplexMatrix>& block, int j) {
+        Eigen::Map<const ComplexMatrix> T(tmatrix.data() + j*size*size, size, size);
+        out.noalias() = block*T;
+    };
+
+    return sparse_aggregate_tmatrix(positions, lmax, k, tmatrix_norm, cutoff, coupling_cutoff, kernel, multiply_tmatrix);
+}
+
+solve_result solve_sparse_linear_system(const sparse_interaction_matrix& agg_tmatrix,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        int maxiter, double tolerance) {
+
+    auto matvec = [&agg_tmatrix](const Ref<const ComplexMatrix>& X) {
+        ComplexMatrix result = X + agg_tmatrix.apply(X);
+        return result;
+    };
+
+    solve_info info;
+    ComplexMatrix solution = bicgstab_operator(matvec, p_src, x0, info, maxiter, tolerance);
+    info.dropped_coupling = agg_tmatrix.dropped_coupling;
+    return std::make_tuple(solution, info);
+}
+
+// y_i = sum_{j != i} A_ij w_j, with each translation block A_ij computed on the fly
+// each row of W is a separate vector and every block is applied to all rows at once
+// (the rotation kernel applies the factors of rotated_translation without forming the blocks)
+static ComplexMatrix translation_product(const Ref<const position_t>& positions, int lmax,
+        double k, const Ref<const ComplexMatrix>& W, const vsh_translation_table& table,
+        translation_kernel kernel) {
+
+    int rmax = lmax_to_rmax(lmax);
+    int Nparticles = positions.rows();
+
+    ComplexMatrix result = ComplexMatrix::Zero(W.rows(), W.cols());
+
     if (Nparticles == 1)
-        return agg_tmatrix;
-    
+        return result;
+
     int N = Nparticles*(Nparticles-1)/2;
     Array ivals(N);
     Array jvals(N);
@@ -186,24 +748,179 @@ ComplexMatrix particle_aggregate_tmatrix(const Ref<const position_t>& positions,
             counter += 1;
         }
     }
-    
-    auto vsh_precompute = create_vsh_cache_map(lmax);
 
-    #pragma omp parallel for
-    for (int ij = 0; ij < N; ij++) {
-        int i = ivals(ij);
-        int j = jvals(ij);
+    #pragma omp parallel
+    {
+        ComplexMatrix block_ij(2*rmax, 2*rmax);
+        ComplexMatrix block_ji(2*rmax, 2*rmax);
+        ComplexMatrix result_local = ComplexMatrix::Zero(W.rows(), W.cols());
 
-        Vector3d dji = positions.row(i) - positions.row(j);
+        #pragma omp for
+        for (int ij = 0; ij < N; ij++) {
+            int i = ivals(ij);
+            int j = jvals(ij);
 
-        double rad = dji.norm();
-        double theta = acos(dji(2)/rad);
-        double phi = atan2(dji(1), dji(0));
+            Vector3d dji = positions.row(i) - positions.row(j);
 
-        vsh_translation_insert_pair(agg_tmatrix, tmatrix, i, j, rad, theta, phi, k, vsh_precompute);
-    } 
+            double rad = dji.norm();
+            double theta = acos(dji(2)/rad);
+            double phi = atan2(dji(1), dji(0));
 
-    return agg_tmatrix;
+            if (kernel == translation_kernel::rotation) {
+                rotated_translation(lmax, rad, theta, phi, k, table).apply(
+                        result_local.middleCols(i*2*rmax, 2*rmax), result_local.middleCols(j*2*rmax, 2*rmax),
+                        W.middleCols(i*2*rmax, 2*rmax), W.middleCols(j*2*rmax, 2*rmax));
+                continue;
+            }
+
+            vsh_translation_block(block_ij, block_ji, lmax, rad, theta, phi, k, table);
+
+            result_local.middleCols(i*2*rmax, 2*rmax).noalias() += W.middleCols(j*2*rmax, 2*rmax)*block_ij.transpose();
+            result_local.middleCols(j*2*rmax, 2*rmax).noalias() += W.middleCols(i*2*rmax, 2*rmax)*block_ji.transpose();
+        }
+
+        #pragma omp critical
+        result += result_local;
+    }
+
+    return result;
+}
+
+ComplexVector translation_product(const Ref<const position_t>& positions, int lmax,
+        double k, const Ref<const ComplexVector>& w, translation_kernel kernel) {
+
+    const auto& table = get_vsh_translation_table(lmax);
+    ComplexMatrix W = w.transpose();
+    return translation_product(positions, lmax, k, W, table, kernel).row(0).transpose();
+}
+
+// solve (I + A*T) p_inc = p_src for spheres, where translate applies the particle-to-particle translations A
+static solve_result sphere_operator_solve(const linear_operator& translate, const Ref<const ComplexMatrix>& mie,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0, int maxiter, double tolerance) {
+
+    int rmax = lmax_to_rmax(mie.cols()/2);
+    int Nparticles = mie.rows();
+    ComplexMatrix mie_diag = expand_mie_diagonal(mie);
+
+    auto matvec = [&](const Ref<const ComplexMatrix>& X) {
+        ComplexMatrix W(X.rows(), X.cols());
+
+        for (int i = 0; i < Nparticles; i++)
+            W.middleCols(i*2*rmax, 2*rmax) = X.middleCols(i*2*rmax, 2*rmax)*mie_diag.row(i).asDiagonal();
+
+        ComplexMatrix result = X + translate(W);
+        return result;
+    };
+
+    solve_info info;
+    ComplexMatrix solution = bicgstab_operator(matvec, p_src, x0, info, maxiter, tolerance);
+    return std::make_tuple(solution, info);
+}
+
+// solve (I + A*T) p_inc = p_src for particles, where translate applies the particle-to-particle translations A
+static solve_result particle_operator_solve(const linear_operator& translate, const tmatrix_t& tmatrix,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0, int maxiter, double tolerance) {
+
+    int rmax = tmatrix.dimensions()[1]/2;
+    int Nparticles = tmatrix.dimensions()[0];
+
+    auto matvec = [&](const Ref<const ComplexMatrix>& X) {
+        ComplexMatrix W(X.rows(), X.cols());
+
+        for (int i = 0; i < Nparticles; i++) {
+            Eigen::Map<const ComplexMatrix> T(tmatrix.data() + i*(2*rmax)*(2*rmax), 2*rmax, 2*rmax);
+            W.middleCols(i*2*rmax, 2*rmax).noalias() = X.middleCols(i*2*rmax, 2*rmax)*T.transpose();
+        }
+
+        ComplexMatrix result = X + translate(W);
+        return result;
+    };
+
+    solve_info info;
+    ComplexMatrix solution = bicgstab_operator(matvec, p_src, x0, info, maxiter, tolerance);
+    return std::make_tuple(solution, info);
+}
+
+solve_result sphere_matrix_free_solve(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, int maxiter, double tolerance, translation_kernel kernel) {
+
+    int lmax = mie.cols()/2;
+    const auto& table = get_vsh_translation_table(lmax);
+
+    auto translate = [&](const Ref<const ComplexMatrix>& W) {
+        return translation_product(positions, lmax, k, W, table, kernel);
+    };
+
+    return sphere_operator_solve(translate, mie, p_src, x0, maxiter, tolerance);
+}
+
+solve_result particle_matrix_free_solve(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, int maxiter, double tolerance, translation_kernel kernel) {
+
+    int lmax = rmax_to_lmax(tmatrix.dimensions()[1]/2);
+    const auto& table = get_vsh_translation_table(lmax);
+
+    auto translate = [&](const Ref<const ComplexMatrix>& W) {
+        return translation_product(positions, lmax, k, W, table, kernel);
+    };
+
+    return particle_operator_solve(translate, tmatrix, p_src, x0, maxiter, tolerance);
+}
+
+solve_result sphere_fmm_solve(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, double accuracy, int maxiter, double tolerance) {
+
+    fmm_operator fmm(positions, mie.cols()/2, k, accuracy);
+
+    auto translate = [&fmm](const Ref<const ComplexMatrix>& W) {
+        return fmm.apply(W);
+    };
+
+    return sphere_operator_solve(translate, mie, p_src, x0, maxiter, tolerance);
+}
+
+solve_result particle_fmm_solve(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, double accuracy, int maxiter, double tolerance) {
+
+    fmm_operator fmm(positions, rmax_to_lmax(tmatrix.dimensions()[1]/2), k, accuracy);
+
+    auto translate = [&fmm](const Ref<const ComplexMatrix>& W) {
+        return fmm.apply(W);
+    };
+
+    return particle_operator_solve(translate, tmatrix, p_src, x0, maxiter, tolerance);
+}
+
+solve_result sphere_lattice_solve(const Ref<const lattice_sites_t>& sites,
+        const Ref<const Matrix>& lattice_vectors, const Ref<const ComplexMatrix>& mie, double k,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        int maxiter, double tolerance) {
+
+    lattice_operator lattice(sites, lattice_vectors, mie.cols()/2, k);
+
+    auto translate = [&lattice](const Ref<const ComplexMatrix>& W) {
+        return lattice.apply(W);
+    };
+
+    return sphere_operator_solve(translate, mie, p_src, x0, maxiter, tolerance);
+}
+
+solve_result particle_lattice_solve(const Ref<const lattice_sites_t>& sites,
+        const Ref<const Matrix>& lattice_vectors, const tmatrix_t& tmatrix, double k,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        int maxiter, double tolerance) {
+
+    lattice_operator lattice(sites, lattice_vectors, rmax_to_lmax(tmatrix.dimensions()[1]/2), k);
+
+    auto translate = [&lattice](const Ref<const ComplexMatrix>& W) {
+        return lattice.apply(W);
+    };
+
+    return particle_operator_solve(translate, tmatrix, p_src, x0, maxiter, tolerance);
 }
 
 ComplexMatrix reflection_matrix_nia(const Ref<const position_t>& positions,
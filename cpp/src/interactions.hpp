@@ -3,25 +3,153 @@
 
 #include <complex>
 #include <eigen3/Eigen/Core>
+#include <eigen3/Eigen/LU>
 #include <vector>
+#include <tuple>
+#include <functional>
+#include <limits>
 #include "vec.hpp"
+#include "lattice.hpp"
+#include "vsh_translation.hpp"
 
 enum class solver {
     bicgstab,
-    exact
+    exact,
+    matrix_free,
+    fmm,
+    lattice
 };
 
+struct solve_info {
+    int iterations = 0;
+    bool converged = true;
+    double residual = 0;                    // final relative residual, largest over all right-hand sides
+    std::vector<double> residual_history;   // largest relative residual at every iteration
+    double build_time = 0;                  // wall time (s) building the interactions
+    double solve_time = 0;                  // wall time (s) solving the interactions
+    double dropped_coupling = 0;            // estimated coupling dropped by an interaction cutoff (see sparse_interaction_matrix)
+    double translation_hit_rate = 0;        // fraction of pair translations reused from identical displacements (see aggregate_stats)
+};
+
+// linear operators act on every row of a matrix; each row is a separate right-hand side
+using linear_operator = std::function<ComplexMatrix(const Ref<const ComplexMatrix>&)>;
+using solve_result = std::tuple<ComplexMatrix, solve_info>;
+
 ComplexVector bicgstab(const Ref<const ComplexMatrix>& A, const Ref<const ComplexVector>& b,
         int maxiter = 1000, double tolerance = 1e-5);
 
-ComplexVector solve_linear_system(const Ref<const ComplexMatrix>& agg_tmatrix,
-        const Ref<const ComplexVector>& p_src, solver method = solver::bicgstab);
+ComplexMatrix bicgstab_operator(const linear_operator& A, const Ref<const ComplexMatrix>& B,
+        const Ref<const ComplexMatrix>& X0, solve_info& info, int maxiter = 1000, double tolerance = 1e-5);
+
+// LU factorization of the interaction matrix (I + agg_tmatrix), for repeated direct solves
+class interaction_factorization {
+public:
+    interaction_factorization(const Ref<const ComplexMatrix>& agg_tmatrix);
+    solve_result solve(const Ref<const ComplexMatrix>& p_src) const;
+    int size() const {return lu.rows();}
+
+private:
+    Eigen::PartialPivLU<ComplexMatrix> lu;
+};
+
+solve_result solve_linear_system(const Ref<const ComplexMatrix>& agg_tmatrix,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        solver method = solver::bicgstab, int maxiter = 1000, double tolerance = 1e-5);
+
+// statistics of building an aggregate T-matrix
+struct aggregate_stats {
+    int pairs = 0;                  // particle pairs
+    int unique_translations = 0;    // distinct pair displacements (up to sign), each translated once
+
+    // fraction of the pairs that reused the translation of an identical displacement
+    double hit_rate() const {return pairs > 0 ? 1 - double(unique_translations)/pairs : 0;}
+};
 
 ComplexMatrix sphere_aggregate_tmatrix(const Ref<const position_t>& positions,
-        const Ref<const ComplexMatrix>& mie, double k);
+        const Ref<const ComplexMatrix>& mie, double k, aggregate_stats* stats = nullptr,
+        translation_kernel kernel = translation_kernel::direct);
+
+ComplexMatrix particle_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k, aggregate_stats* stats = nullptr,
+        translation_kernel kernel = translation_kernel::direct);
 
+// offsets of the particles in a ragged coefficient vector, where particle i has 2*rmax_i coefficients
+std::vector<int> ragged_offsets(const std::vector<int>& lmax);
+
+// aggregate T-matrix [size,size] of particles with per-particle lmax, with particle i at ragged_offsets(lmax)[i];
+// tmatrix[N,2,rmax,2,rmax] is padded to the largest lmax
 ComplexMatrix particle_aggregate_tmatrix(const Ref<const position_t>& positions,
-        const tmatrix_t& tmatrix, double k);
+        const tmatrix_t& tmatrix, const std::vector<int>& lmax, double k, aggregate_stats* stats = nullptr,
+        translation_kernel kernel = translation_kernel::direct);
+
+// recompute, in place, the blocks of an aggregate T-matrix in the rows and columns of the changed particles
+// (whose position or T-matrix changed since it was built); the other blocks are kept
+aggregate_stats sphere_update_aggregate_tmatrix(Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, const std::vector<int>& changed,
+        translation_kernel kernel = translation_kernel::direct);
+
+aggregate_stats particle_update_aggregate_tmatrix(Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, const std::vector<int>& lmax, double k, const std::vector<int>& changed,
+        translation_kernel kernel = translation_kernel::direct);
+
+// aggregate T-matrix in block-sparse row (BSR) form, storing only the blocks of interacting particles
+struct sparse_interaction_matrix {
+    int block_size;
+    std::vector<int> indptr;        // the blocks of particle i are indptr[i] to indptr[i+1]
+    std::vector<int> indices;       // the source particle of every block
+    ComplexMatrix blocks;           // [nblocks*block_size, block_size], stacked in the order of indices
+
+    // largest (over particles) sum of the estimated norms |A_ij T_j| of the dropped blocks
+    double dropped_coupling = 0;
+
+    // apply the aggregate T-matrix to every row of X[S,N*block_size]
+    ComplexMatrix apply(const Ref<const ComplexMatrix>& X) const;
+};
+
+sparse_interaction_matrix sphere_sparse_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k,
+        double cutoff = std::numeric_limits<double>::infinity(), double coupling_cutoff = 0,
+        translation_kernel kernel = translation_kernel::direct);
+
+sparse_interaction_matrix particle_sparse_aggregate_tmatrix(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k,
+        double cutoff = std::numeric_limits<double>::infinity(), double coupling_cutoff = 0,
+        translation_kernel kernel = translation_kernel::direct);
+
+solve_result solve_sparse_linear_system(const sparse_interaction_matrix& agg_tmatrix,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        int maxiter = 1000, double tolerance = 1e-5);
+
+ComplexVector translation_product(const Ref<const position_t>& positions, int lmax,
+        double k, const Ref<const ComplexVector>& w, translation_kernel kernel = translation_kernel::direct);
+
+solve_result sphere_matrix_free_solve(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, int maxiter = 1000, double tolerance = 1e-5,
+        translation_kernel kernel = translation_kernel::direct);
+
+solve_result particle_matrix_free_solve(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, int maxiter = 1000, double tolerance = 1e-5,
+        translation_kernel kernel = translation_kernel::direct);
+
+solve_result sphere_fmm_solve(const Ref<const position_t>& positions,
+        const Ref<const ComplexMatrix>& mie, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, double accuracy = 1e-4, int maxiter = 1000, double tolerance = 1e-5);
+
+solve_result particle_fmm_solve(const Ref<const position_t>& positions,
+        const tmatrix_t& tmatrix, double k, const Ref<const ComplexMatrix>& p_src,
+        const Ref<const ComplexMatrix>& x0, double accuracy = 1e-4, int maxiter = 1000, double tolerance = 1e-5);
+
+solve_result sphere_lattice_solve(const Ref<const lattice_sites_t>& sites,
+        const Ref<const Matrix>& lattice_vectors, const Ref<const ComplexMatrix>& mie, double k,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        int maxiter = 1000, double tolerance = 1e-5);
+
+solve_result particle_lattice_solve(const Ref<const lattice_sites_t>& sites,
+        const Ref<const Matrix>& lattice_vectors, const tmatrix_t& tmatrix, double k,
+        const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0,
+        int maxiter = 1000, double tolerance = 1e-5);
 
 ComplexMatrix reflection_matrix_nia(const Ref<const position_t>& positions,
         const Ref<const ComplexMatrix>& mie, double k, std::complex<double> reflection, double z);
@@ -1,52 +1,339 @@
 #define NOMINMAX
 #include "interactions.hpp"
+#include "fmm.hpp"
+#include "lattice.hpp"
 
 #include <pybind11/pybind11.h>
 #include <pybind11/complex.h>
 #include <pybind11/numpy.h>
 #include <pybind11/eigen.h>
+#include <pybind11/stl.h>
+#include <sstream>
 
 namespace py = pybind11;
 using namespace pybind11::literals;
 
+void bind_aggregate_stats(py::module &m) {
+    py::class_<aggregate_stats>(m, "aggregate_stats")
+        .def_readonly("pairs", &aggregate_stats::pairs)
+        .def_readonly("unique_translations", &aggregate_stats::unique_translations)
+        .def_property_readonly("hit_rate", &aggregate_stats::hit_rate)
+        .def("__repr__", [](const aggregate_stats& stats) {
+            std::ostringstream repr;
+            repr << "aggregate_stats(pairs=" << stats.pairs
+                 << ", unique_translations=" << stats.unique_translations
+                 << ", hit_rate=" << stats.hit_rate() << ")";
+            return repr.str();
+        });
+}
+
 void bind_particle_aggregate_tmatrix(py::module &m) {
     m.def("particle_aggregate_tmatrix", [](const Ref<const position_t>& positions,
-                Ref<ComplexMatrix> tmatrix, double k) {
+                Ref<ComplexMatrix> tmatrix, double k, bool return_stats, translation_kernel kernel) -> py::object {
 
                 int Nparticles = tmatrix.rows();
                 int cols = int(sqrt(tmatrix.cols()));
                 const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
-                return particle_aggregate_tmatrix(positions, tmatrix_map, k);
+
+                aggregate_stats stats;
+                ComplexMatrix agg_tmatrix;
+                {
+                    py::gil_scoped_release release;
+                    agg_tmatrix = particle_aggregate_tmatrix(positions, tmatrix_map, k, &stats, kernel);
+                }
+                if (return_stats)
+                    return py::make_tuple(std::move(agg_tmatrix), stats);
+                return py::cast(std::move(agg_tmatrix));
             },
-        "positions"_a, "tmatrix"_a, "k"_a, R"pbdoc(
+        "positions"_a, "tmatrix"_a, "k"_a, "return_stats"_a=false, "kernel"_a=translation_kernel::direct, R"pbdoc(
         Obtain the particle-centered aggregate T-matrix for a cluster of particles
+        (and the build statistics, if return_stats is True)
+    )pbdoc");
+}
+
+void bind_particle_ragged_aggregate_tmatrix(py::module &m) {
+    m.def("particle_ragged_aggregate_tmatrix", [](const Ref<const position_t>& positions,
+                Ref<ComplexMatrix> tmatrix, const std::vector<int>& lmax, double k, bool return_stats,
+                translation_kernel kernel) -> py::object {
+
+                int Nparticles = tmatrix.rows();
+                int cols = int(sqrt(tmatrix.cols()));
+                const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
+
+                aggregate_stats stats;
+                ComplexMatrix agg_tmatrix;
+                {
+                    py::gil_scoped_release release;
+                    agg_tmatrix = particle_aggregate_tmatrix(positions, tmatrix_map, lmax, k, &stats, kernel);
+                }
+                if (return_stats)
+                    return py::make_tuple(std::move(agg_tmatrix), stats);
+                return py::cast(std::move(agg_tmatrix));
+            },
+        "positions"_a, "tmatrix"_a, "lmax"_a, "k"_a, "return_stats"_a=false, "kernel"_a=translation_kernel::direct, R"pbdoc(
+        Obtain the particle-centered aggregate T-matrix for a cluster of particles with per-particle lmax,
+        in the ragged layout of ragged_offsets (and the build statistics, if return_stats is True)
+    )pbdoc");
+}
+
+void bind_sphere_update_aggregate_tmatrix(py::module &m) {
+    m.def("sphere_update_aggregate_tmatrix", sphere_update_aggregate_tmatrix,
+        "agg_tmatrix"_a.noconvert(), "positions"_a, "mie"_a, "k"_a, "changed"_a, "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Recompute, in place, the blocks of a sphere aggregate T-matrix in the rows and columns of the changed spheres.
+        Returns the build statistics of the recomputed pairs
+    )pbdoc");
+}
+
+void bind_particle_update_aggregate_tmatrix(py::module &m) {
+    m.def("particle_update_aggregate_tmatrix", [](Ref<ComplexMatrix> agg_tmatrix, const Ref<const position_t>& positions,
+                Ref<ComplexMatrix> tmatrix, const std::vector<int>& lmax, double k, const std::vector<int>& changed,
+                translation_kernel kernel) {
+
+                int Nparticles = tmatrix.rows();
+                int cols = int(sqrt(tmatrix.cols()));
+                const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
+
+                return particle_update_aggregate_tmatrix(agg_tmatrix, positions, tmatrix_map, lmax, k, changed, kernel);
+            },
+        "agg_tmatrix"_a.noconvert(), "positions"_a, "tmatrix"_a, "lmax"_a, "k"_a, "changed"_a,
+        "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Recompute, in place, the blocks of a particle aggregate T-matrix (in the ragged layout of ragged_offsets)
+        in the rows and columns of the changed particles. Returns the build statistics of the recomputed pairs
+    )pbdoc");
+}
+
+void bind_ragged_offsets(py::module &m) {
+    m.def("ragged_offsets", ragged_offsets, "lmax"_a, R"pbdoc(
+        Offsets of the particles in a ragged coefficient vector, where particle i has 2*rmax_i coefficients
     )pbdoc");
 }
 
 void bind_sphere_aggregate_tmatrix(py::module &m) {
-    m.def("sphere_aggregate_tmatrix", sphere_aggregate_tmatrix, 
-           "positions"_a, "mie"_a, "k"_a, R"pbdoc(
+    m.def("sphere_aggregate_tmatrix", [](const Ref<const position_t>& positions,
+                const Ref<const ComplexMatrix>& mie, double k, bool return_stats, translation_kernel kernel) -> py::object {
+
+                aggregate_stats stats;
+                ComplexMatrix agg_tmatrix;
+                {
+                    py::gil_scoped_release release;
+                    agg_tmatrix = sphere_aggregate_tmatrix(positions, mie, k, &stats, kernel);
+                }
+                if (return_stats)
+                    return py::make_tuple(std::move(agg_tmatrix), stats);
+                return py::cast(std::move(agg_tmatrix));
+            },
+        "positions"_a, "mie"_a, "k"_a, "return_stats"_a=false, "kernel"_a=translation_kernel::direct, R"pbdoc(
         Obtain the particle-centered aggregate T-matrix for a cluster of spheres
+        (and the build statistics, if return_stats is True)
+    )pbdoc");
+}
+
+void bind_sparse_interaction_matrix(py::module &m) {
+    py::class_<sparse_interaction_matrix>(m, "sparse_interaction_matrix", R"pbdoc(
+        Aggregate T-matrix in block-sparse row (BSR) form
+    )pbdoc")
+        .def_readonly("block_size", &sparse_interaction_matrix::block_size)
+        .def_readonly("indptr", &sparse_interaction_matrix::indptr)
+        .def_readonly("indices", &sparse_interaction_matrix::indices)
+        .def_readonly("blocks", &sparse_interaction_matrix::blocks)
+        .def_readonly("dropped_coupling", &sparse_interaction_matrix::dropped_coupling)
+        .def("apply", &sparse_interaction_matrix::apply, "X"_a, R"pbdoc(
+        Apply the aggregate T-matrix to every row of X
+    )pbdoc");
+}
+
+void bind_sphere_sparse_aggregate_tmatrix(py::module &m) {
+    m.def("sphere_sparse_aggregate_tmatrix", sphere_sparse_aggregate_tmatrix, 
+           "positions"_a, "mie"_a, "k"_a, "cutoff"_a=std::numeric_limits<double>::infinity(),
+           "coupling_cutoff"_a=0, "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Obtain the block-sparse aggregate T-matrix for a cluster of spheres, dropping weak interactions
+    )pbdoc");
+}
+
+void bind_particle_sparse_aggregate_tmatrix(py::module &m) {
+    m.def("particle_sparse_aggregate_tmatrix", [](const Ref<const position_t>& positions,
+                Ref<ComplexMatrix> tmatrix, double k, double cutoff, double coupling_cutoff,
+                translation_kernel kernel) {
+
+                int Nparticles = tmatrix.rows();
+                int cols = int(sqrt(tmatrix.cols()));
+                const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
+                return particle_sparse_aggregate_tmatrix(positions, tmatrix_map, k, cutoff, coupling_cutoff, kernel);
+            },
+        "positions"_a, "tmatrix"_a, "k"_a, "cutoff"_a=std::numeric_limits<double>::infinity(),
+        "coupling_cutoff"_a=0, "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Obtain the block-sparse aggregate T-matrix for a cluster of particles, dropping weak interactions
+    )pbdoc");
+}
+
+void bind_solve_sparse_linear_system(py::module &m) {
+    m.def("solve_sparse_linear_system", solve_sparse_linear_system, 
+           "agg_tmatrix"_a, "p_src"_a, "x0"_a, "maxiter"_a=1000, "tolerance"_a=1e-5, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the linear system:  p_inc = p_src - tmatrix*p_inc with a block-sparse aggregate T-matrix
     )pbdoc");
 }
 
 void bind_enum_solver(py::module &m) {
     py::enum_<solver>(m, "solver")
         .value("bicgstab", solver::bicgstab)
-        .value("exact",  solver::exact);
+        .value("exact",  solver::exact)
+        .value("matrix_free", solver::matrix_free)
+        .value("fmm", solver::fmm)
+        .value("lattice", solver::lattice);
+}
+
+void bind_solve_info(py::module &m) {
+    py::class_<solve_info>(m, "solve_info")
+        .def_readonly("iterations", &solve_info::iterations)
+        .def_readonly("converged", &solve_info::converged)
+        .def_readonly("residual", &solve_info::residual)
+        .def_readonly("residual_history", &solve_info::residual_history)
+        .def_readwrite("build_time", &solve_info::build_time)
+        .def_readwrite("solve_time", &solve_info::solve_time)
+        .def_readwrite("dropped_coupling", &solve_info::dropped_coupling)
+        .def_readwrite("translation_hit_rate", &solve_info::translation_hit_rate)
+        .def("__repr__", [](const solve_info& info) {
+            std::ostringstream repr;
+            repr << "solve_info(iterations=" << info.iterations
+                 << ", converged=" << (info.converged ? "True" : "False")
+                 << ", residual=" << info.residual
+                 << ", build_time=" << info.build_time
+                 << ", solve_time=" << info.solve_time;
+            if (info.dropped_coupling > 0)
+                repr << ", dropped_coupling=" << info.dropped_coupling;
+            if (info.translation_hit_rate > 0)
+                repr << ", translation_hit_rate=" << info.translation_hit_rate;
+            repr << ")";
+            return repr.str();
+        });
 }
 
 void bind_bicgstab(py::module &m) {
     m.def("bicgstab", bicgstab, 
-           "A"_a, "b"_a, "maxiter"_a, "tolerance"_a, R"pbdoc(
+           "A"_a, "b"_a, "maxiter"_a, "tolerance"_a, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
         BiCGSTAB linear solver
     )pbdoc");
 }
 
+void bind_interaction_factorization(py::module &m) {
+    py::class_<interaction_factorization>(m, "interaction_factorization", R"pbdoc(
+        LU factorization of the interaction matrix (I + agg_tmatrix)
+    )pbdoc")
+        .def(py::init<const Ref<const ComplexMatrix>&>(), "agg_tmatrix"_a, py::call_guard<py::gil_scoped_release>())
+        .def("solve", &interaction_factorization::solve, "p_src"_a, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the linear system for each row of p_src by back-substitution
+    )pbdoc")
+        .def_property_readonly("size", &interaction_factorization::size);
+}
+
 void bind_solve_linear_system(py::module &m) {
     m.def("solve_linear_system", solve_linear_system, 
-           "agg_tmatrix"_a, "p_src"_a, "method"_a, R"pbdoc(
-        Solve the linear system:  p_inc = p_src - tmatrix*p_inc
+           "agg_tmatrix"_a, "p_src"_a, "x0"_a, "method"_a, "maxiter"_a=1000, "tolerance"_a=1e-5, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the linear system:  p_inc = p_src - tmatrix*p_inc, starting from the initial guess x0
+        Each row of p_src is a separate right-hand side and all rows are solved together
+    )pbdoc");
+}
+
+void bind_translation_product(py::module &m) {
+    m.def("translation_product", translation_product, 
+           "positions"_a, "lmax"_a, "k"_a, "w"_a, "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Apply the particle-to-particle translation operator to a vector, block by block
+    )pbdoc");
+}
+
+void bind_sphere_matrix_free_solve(py::module &m) {
+    m.def("sphere_matrix_free_solve", sphere_matrix_free_solve, 
+           "positions"_a, "mie"_a, "k"_a, "p_src"_a, "x0"_a, "maxiter"_a=1000, "tolerance"_a=1e-5,
+           "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the interactions of a cluster of spheres without storing the aggregate T-matrix
+    )pbdoc");
+}
+
+void bind_particle_matrix_free_solve(py::module &m) {
+    m.def("particle_matrix_free_solve", [](const Ref<const position_t>& positions,
+                Ref<ComplexMatrix> tmatrix, double k, const Ref<const ComplexMatrix>& p_src,
+                const Ref<const ComplexMatrix>& x0, int maxiter, double tolerance, translation_kernel kernel) {
+
+                int Nparticles = tmatrix.rows();
+                int cols = int(sqrt(tmatrix.cols()));
+                const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
+                return particle_matrix_free_solve(positions, tmatrix_map, k, p_src, x0, maxiter, tolerance, kernel);
+            },
+        "positions"_a, "tmatrix"_a, "k"_a, "p_src"_a, "x0"_a, "maxiter"_a=1000, "tolerance"_a=1e-5,
+        "kernel"_a=translation_kernel::direct, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the interactions of a cluster of particles without storing the aggregate T-matrix
+    )pbdoc");
+}
+
+void bind_fmm_operator(py::module &m) {
+    py::class_<fmm_operator>(m, "fmm_operator", R"pbdoc(
+        Fast multipole evaluation of the particle-to-particle translations (see translation_product)
+    )pbdoc")
+        .def(py::init<const Ref<const position_t>&, int, double, double, int>(),
+                "positions"_a, "lmax"_a, "k"_a, "accuracy"_a, "leaf_size"_a=8)
+        .def("apply", &fmm_operator::apply, "W"_a, R"pbdoc(
+        Apply the translations to every row of W
+    )pbdoc")
+        .def_property_readonly("depth", &fmm_operator::depth)
+        .def_property_readonly("expansion_orders", &fmm_operator::expansion_orders)
+        .def_property_readonly("boxes_per_level", &fmm_operator::boxes_per_level);
+}
+
+void bind_sphere_fmm_solve(py::module &m) {
+    m.def("sphere_fmm_solve", sphere_fmm_solve, 
+           "positions"_a, "mie"_a, "k"_a, "p_src"_a, "x0"_a, "accuracy"_a=1e-4, "maxiter"_a=1000, "tolerance"_a=1e-5, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the interactions of a cluster of spheres with fast multipole translations
+    )pbdoc");
+}
+
+void bind_particle_fmm_solve(py::module &m) {
+    m.def("particle_fmm_solve", [](const Ref<const position_t>& positions,
+                Ref<ComplexMatrix> tmatrix, double k, const Ref<const ComplexMatrix>& p_src,
+                const Ref<const ComplexMatrix>& x0, double accuracy, int maxiter, double tolerance) {
+
+                int Nparticles = tmatrix.rows();
+                int cols = int(sqrt(tmatrix.cols()));
+                const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
+                return particle_fmm_solve(positions, tmatrix_map, k, p_src, x0, accuracy, maxiter, tolerance);
+            },
+        "positions"_a, "tmatrix"_a, "k"_a, "p_src"_a, "x0"_a, "accuracy"_a=1e-4, "maxiter"_a=1000, "tolerance"_a=1e-5, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the interactions of a cluster of particles with fast multipole translations
+    )pbdoc");
+}
+
+void bind_lattice_operator(py::module &m) {
+    py::class_<lattice_operator>(m, "lattice_operator", R"pbdoc(
+        Block-Toeplitz (FFT) evaluation of the particle-to-particle translations for particles on a lattice
+        (see translation_product)
+    )pbdoc")
+        .def(py::init<const Ref<const lattice_sites_t>&, const Ref<const Matrix>&, int, double>(),
+                "sites"_a, "lattice_vectors"_a, "lmax"_a, "k"_a)
+        .def("apply", &lattice_operator::apply, "W"_a, R"pbdoc(
+        Apply the translations to every row of W
+    )pbdoc")
+        .def_property_readonly("grid_shape", &lattice_operator::grid_shape)
+        .def_property_readonly("unique_blocks", &lattice_operator::unique_blocks);
+}
+
+void bind_sphere_lattice_solve(py::module &m) {
+    m.def("sphere_lattice_solve", sphere_lattice_solve, 
+           "sites"_a, "lattice_vectors"_a, "mie"_a, "k"_a, "p_src"_a, "x0"_a, "maxiter"_a=1000, "tolerance"_a=1e-5, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the interactions of spheres on a lattice with block-Toeplitz (FFT) translations
+    )pbdoc");
+}
+
+void bind_particle_lattice_solve(py::module &m) {
+    m.def("particle_lattice_solve", [](const Ref<const lattice_sites_t>& sites,
+                const Ref<const Matrix>& lattice_vectors, Ref<ComplexMatrix> tmatrix, double k,
+                const Ref<const ComplexMatrix>& p_src, const Ref<const ComplexMatrix>& x0, int maxiter, double tolerance) {
+
+                int Nparticles = tmatrix.rows();
+                int cols = int(sqrt(tmatrix.cols()));
+                const tmatrix_t tmatrix_map(tmatrix.data(), Nparticles, cols, cols);
+                return particle_lattice_solve(sites, lattice_vectors, tmatrix_map, k, p_src, x0, maxiter, tolerance);
+            },
+        "sites"_a, "lattice_vectors"_a, "tmatrix"_a, "k"_a, "p_src"_a, "x0"_a, "maxiter"_a=1000, "tolerance"_a=1e-5, py::call_guard<py::gil_scoped_release>(), R"pbdoc(
+        Solve the interactions of particles on a lattice with block-Toeplitz (FFT) translations
     )pbdoc");
 }
 
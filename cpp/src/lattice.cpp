@@ -0,0 +1,192 @@
+#define NOMINMAX
+#include "lattice.hpp"
+#include "vsh_translation.hpp"
+#include "indices.hpp"
+#include <cmath>
+#include <stdexcept>
+#include <eigen3/unsupported/Eigen/FFT>
+#include <omp.h>
+
+using std::complex;
+
+using index3 = std::array<int,3>;
+
+// smallest length >= n without prime factors other than 2, 3 and 5
+static int fft_length(int n) {
+    for (int L = n; ; L++) {
+        int r = L;
+        for (int p: {2, 3, 5}) {
+            while (r % p == 0)
+                r /= p;
+        }
+        if (r == 1)
+            return L;
+    }
+}
+
+// in-place FFT of every column of data[L0*L1*L2, cols], where each column is a row-major L0 x L1 x L2 grid
+// (the inverse transform is normalized)
+static void fft_grid(ComplexMatrix& data, const index3& L, bool inverse) {
+    int cols = data.cols();
+    index3 stride = {L[1]*L[2], L[2], 1};
+
+    #pragma omp parallel
+    {
+        Eigen::FFT<double> fft;
+        std::vector<complex<double>> line, transformed;
+
+        for (int axis = 0; axis < 3; axis++) {
+            int n = L[axis];
+            if (n == 1)
+                continue;
+
+            // lines along the axis are labeled by their coordinates (c1, c2) along the other two axes
+            int a1 = (axis == 0) ? 1 : 0;
+            int a2 = (axis == 2) ? 1 : 2;
+            int nlines = L[a1]*L[a2];
+            line.resize(n);
+
+            #pragma omp for schedule(static)
+            for (int q = 0; q < nlines*cols; q++) {
+                int c = q % cols;
+                int c1 = (q / cols) / L[a2];
+                int c2 = (q / cols) % L[a2];
+                int start = c1*stride[a1] + c2*stride[a2];
+
+                for (int t = 0; t < n; t++)
+                    line[t] = data(start + t*stride[axis], c);
+
+                if (inverse)
+                    fft.inv(transformed, line);
+                else
+                    fft.fwd(transformed, line);
+
+                for (int t = 0; t < n; t++)
+                    data(start + t*stride[axis], c) = transformed[t];
+            }
+        }
+    }
+}
+
+lattice_operator::lattice_operator(const Ref<const lattice_sites_t>& sites, const Ref<const Matrix>& lattice_vectors,
+        int lmax, double k): lmax(lmax) {
+
+    int Nparticles = sites.rows();
+    int D = sites.cols();
+    int size = 2*lmax_to_rmax(lmax);
+
+    if (D > 3 || lattice_vectors.rows() != D || lattice_vectors.cols() != 3)
+        throw std::runtime_error("sites must be [N,D] and lattice_vectors [D,3] with D <= 3");
+
+    // grid of the occupied lattice sites, and a padded grid for the circular convolution
+    index3 lower = {0, 0, 0};
+    for (int d = 0; d < 3; d++) {
+        shape[d] = 1;
+        fft_shape[d] = 1;
+        if (d < D && Nparticles > 0) {
+            lower[d] = sites.col(d).minCoeff();
+            shape[d] = sites.col(d).maxCoeff() - lower[d] + 1;
+            fft_shape[d] = fft_length(2*shape[d] - 1);
+        }
+    }
+
+    int grid_size = fft_shape[0]*fft_shape[1]*fft_shape[2];
+    auto grid_point = [this](const index3& c) {
+        index3 wrapped;
+        for (int d = 0; d < 3; d++)
+            wrapped[d] = (c[d] % fft_shape[d] + fft_shape[d]) % fft_shape[d];
+        return (wrapped[0]*fft_shape[1] + wrapped[1])*fft_shape[2] + wrapped[2];
+    };
+
+    grid_index.resize(Nparticles);
+    std::vector<bool> occupied(grid_size, false);
+    for (int i = 0; i < Nparticles; i++) {
+        index3 c = {0, 0, 0};
+        for (int d = 0; d < D; d++)
+            c[d] = sites(i,d) - lower[d];
+
+        grid_index[i] = grid_point(c);
+        if (occupied[grid_index[i]])
+            throw std::runtime_error("two particles occupy the same lattice site");
+        occupied[grid_index[i]] = true;
+    }
+
+    // every displacement between sites of the grid; a displacement and its opposite are translated together
+    std::vector<index3> displacements;
+    for (int dx = 0; dx < shape[0]; dx++) {
+        for (int dy = -shape[1]+1; dy < shape[1]; dy++) {
+            for (int dz = -shape[2]+1; dz < shape[2]; dz++) {
+                bool canonical = dx > 0 || (dx == 0 && (dy > 0 || (dy == 0 && dz > 0)));
+                if (canonical)
+                    displacements.push_back({dx, dy, dz});
+            }
+        }
+    }
+    nblocks = 2*displacements.size();
+
+    kernel = ComplexMatrix::Zero(grid_size, size*size);
+    const auto& table = get_vsh_translation_table(lmax);
+
+    #pragma omp parallel
+    {
+        ComplexMatrix block_ij(size, size);
+        ComplexMatrix block_ji(size, size);
+
+        #pragma omp for schedule(dynamic)
+        for (int n = 0; n < int(displacements.size()); n++) {
+            const index3& delta = displacements[n];
+
+            vec3 dji = vec3::Zero();
+            for (int d = 0; d < D; d++)
+                dji += delta[d]*lattice_vectors.row(d).transpose();
+
+            double rad = dji.norm();
+            double theta = acos(dji(2)/rad);
+            double phi = atan2(dji(1), dji(0));
+            vsh_translation_block(block_ij, block_ji, lmax, rad, theta, phi, k, table);
+
+            index3 opposite = {-delta[0], -delta[1], -delta[2]};
+            kernel.row(grid_point(delta)) = Eigen::Map<const ComplexVector>(block_ij.data(), size*size).transpose();
+            kernel.row(grid_point(opposite)) = Eigen::Map<const ComplexVector>(block_ji.data(), size*size).transpose();
+        }
+    }
+
+    fft_grid(kernel, fft_shape, false);
+}
+
+ComplexMatrix lattice_operator::apply(const Ref<const ComplexMatrix>& W) const {
+    int S = W.rows();
+    int size = 2*lmax_to_rmax(lmax);
+    int Nparticles = grid_index.size();
+    int grid_size = kernel.rows();
+
+    // row g of the grid holds the [S,size] coefficients of the particle at grid point g (zero if empty)
+    ComplexMatrix X = ComplexMatrix::Zero(grid_size, S*size);
+    for (int i = 0; i < Nparticles; i++) {
+        for (int s = 0; s < S; s++)
+            X.row(grid_index[i]).segment(s*size, size) = W.row(s).segment(i*size, size);
+    }
+
+    fft_grid(X, fft_shape, false);
+
+    // the convolution is a product of the transformed blocks at every grid point
+    ComplexMatrix Y(grid_size, S*size);
+
+    #pragma omp parallel for schedule(static)
+    for (int g = 0; g < grid_size; g++) {
+        Eigen::Map<const ComplexMatrix> K(kernel.row(g).data(), size, size);
+        Eigen::Map<const ComplexMatrix> Xg(X.row(g).data(), S, size);
+        Eigen::Map<ComplexMatrix> Yg(Y.row(g).data(), S, size);
+        Yg.noalias() = Xg*K.transpose();
+    }
+
+    fft_grid(Y, fft_shape, true);
+
+    ComplexMatrix result(S, W.cols());
+    for (int i = 0; i < Nparticles; i++) {
+        for (int s = 0; s < S; s++)
+            result.row(s).segment(i*size, size) = Y.row(grid_index[i]).segment(s*size, size);
+    }
+
+    return result;
+}
@@ -0,0 +1,36 @@
+#ifndef GUARD_lattice_h
+#define GUARD_lattice_h
+
+#include <complex>
+#include <vector>
+#include <array>
+#include "vec.hpp"
+
+using lattice_sites_t = Eigen::Matrix<int, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>;
+
+// Particle-to-particle translations y_i = sum_{j != i} A_ij w_j (the operator applied by translation_product)
+// for particles on the sites of a lattice. Every block depends only on the lattice displacement between the
+// particles, so each unique displacement is translated once and the sum is a block-Toeplitz convolution,
+// evaluated with FFTs over the (zero-padded) lattice grid. Empty sites are allowed.
+class lattice_operator {
+public:
+    // sites[N,D] integer lattice coordinates of the particles, lattice_vectors[D,3] (D <= 3)
+    lattice_operator(const Ref<const lattice_sites_t>& sites, const Ref<const Matrix>& lattice_vectors,
+            int lmax, double k);
+
+    // apply the operator to every row of W[S,2*rmax*N]
+    ComplexMatrix apply(const Ref<const ComplexMatrix>& W) const;
+
+    std::vector<int> grid_shape() const {return {shape[0], shape[1], shape[2]};}
+    int unique_blocks() const {return nblocks;}
+
+private:
+    int lmax;
+    int nblocks;
+    std::array<int,3> shape;            // lattice sites along each dimension
+    std::array<int,3> fft_shape;        // padded grid of the circular convolution
+    std::vector<int> grid_index;        // padded grid point of every particle
+    ComplexMatrix kernel;               // [grid points, size*size] Fourier transform of the translation blocks
+};
+
+#endif
@@ -18,6 +18,7 @@ void bind_pi_func(py::module &);
 void bind_tau_func(py::module &);
 
 void bind_wigner_3j(py::module &);
+void bind_wigner_d(py::module &);
 void bind_a_func(py::module &);
 void bind_b_func(py::module &);
 
@@ -34,14 +35,41 @@ void bind_vsh_translation_numpy(py::module &);
 void bind_vsh_translation_eigen(py::module &);
 void bind_vsh_translation_lambda(py::module &);
 void bind_vsh_translation_lambda_py(py::module &);
+void bind_enum_translation_kernel(py::module &);
+void bind_vsh_translation_block(py::module &);
+
+// vsh_rotation submodule
+void bind_vsh_rotation_matrix(py::module &);
+void bind_vsh_rotation_matrices(py::module &);
+void bind_rotate_tmatrices(py::module &);
 
 // interactions submodule
 void bind_enum_solver(py::module &);
+void bind_solve_info(py::module &);
 void bind_bicgstab(py::module &);
+void bind_aggregate_stats(py::module &);
 void bind_sphere_aggregate_tmatrix(py::module &);
 void bind_particle_aggregate_tmatrix(py::module &);
+void bind_particle_ragged_aggregate_tmatrix(py::module &);
+void bind_ragged_offsets(py::module &);
+void bind_sphere_update_aggregate_tmatrix(py::module &);
+void bind_particle_update_aggregate_tmatrix(py::module &);
 void bind_reflection_matrix_nia(py::module &);
+void bind_interaction_factorization(py::module &);
 void bind_solve_linear_system(py::module &);
+void bind_translation_product(py::module &);
+void bind_sphere_matrix_free_solve(py::module &);
+void bind_particle_matrix_free_solve(py::module &);
+void bind_fmm_operator(py::module &);
+void bind_sphere_fmm_solve(py::module &);
+void bind_particle_fmm_solve(py::module &);
+void bind_sparse_interaction_matrix(py::module &);
+void bind_sphere_sparse_aggregate_tmatrix(py::module &);
+void bind_particle_sparse_aggregate_tmatrix(py::module &);
+void bind_solve_sparse_linear_system(py::module &);
+void bind_lattice_operator(py::module &);
+void bind_sphere_lattice_solve(py::module &);
+void bind_particle_lattice_solve(py::module &);
 
 // forces submodule
 void bind_force(py::module &);
@@ -91,6 +119,7 @@ PYBIND11_MODULE(cpp, m) {
     bind_tau_func(special_m);
 
     bind_wigner_3j(special_m);
+    bind_wigner_d(special_m);
     bind_a_func(special_m);
     bind_b_func(special_m);
 
@@ -110,16 +139,45 @@ PYBIND11_MODULE(cpp, m) {
     bind_vsh_translation_eigen(vsh_translation_m);
     bind_vsh_translation_lambda(vsh_translation_m);
     bind_vsh_translation_lambda_py(vsh_translation_m);
+    bind_enum_translation_kernel(vsh_translation_m);
+    bind_vsh_translation_block(vsh_translation_m);
+
+    // vsh_rotation submodule
+    py::module vsh_rotation_m = m.def_submodule("vsh_rotation", "vsh rotation functions module");
+
+    bind_vsh_rotation_matrix(vsh_rotation_m);
+    bind_vsh_rotation_matrices(vsh_rotation_m);
+    bind_rotate_tmatrices(vsh_rotation_m);
 
     // interactions submodule
     py::module interactions_m = m.def_submodule("interactions", "interactions functions module");
 
     bind_enum_solver(interactions_m);
+    bind_solve_info(interactions_m);
     bind_bicgstab(interactions_m);
+    bind_aggregate_stats(interactions_m);
     bind_sphere_aggregate_tmatrix(interactions_m);
     bind_reflection_matrix_nia(interactions_m);
     bind_particle_aggregate_tmatrix(interactions_m);
+    bind_particle_ragged_aggregate_tmatrix(interactions_m);
+    bind_ragged_offsets(interactions_m);
+    bind_sphere_update_aggregate_tmatrix(interactions_m);
+    bind_particle_update_aggregate_tmatrix(interactions_m);
+    bind_interaction_factorization(interactions_m);
     bind_solve_linear_system(interactions_m);
+    bind_translation_product(interactions_m);
+    bind_sphere_matrix_free_solve(interactions_m);
+    bind_particle_matrix_free_solve(interactions_m);
+    bind_fmm_operator(interactions_m);
+    bind_sphere_fmm_solve(interactions_m);
+    bind_particle_fmm_solve(interactions_m);
+    bind_sparse_interaction_matrix(interactions_m);
+    bind_sphere_sparse_aggregate_tmatrix(interactions_m);
+    bind_particle_sparse_aggregate_tmatrix(interactions_m);
+    bind_solve_sparse_linear_system(interactions_m);
+    bind_lattice_operator(interactions_m);
+    bind_sphere_lattice_solve(interactions_m);
+    bind_particle_lattice_solve(interactions_m);
 
     // forces submodule
     py::module forces_m = m.def_submodule("forces", "force functions module");
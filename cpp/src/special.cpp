@@ -1,5 +1,6 @@
 #include "special.hpp"
 #include <cmath>
+#include <algorithm>
 #include <gsl/gsl_sf_bessel.h>
 #include <gsl/gsl_sf_coupling.h>
 #include <gsl/gsl_sf_legendre.h>
@@ -105,6 +106,15 @@ ComplexArray spherical_hn_recursion(int nmax, double z) {
     return ret;
 }
 
+// upward recursion of jn is unstable for n > z; Steed's method is accurate for every order
+ComplexArray spherical_jn_recursion(int nmax, double z) {
+    Array jn(nmax+1);
+    gsl_sf_bessel_jl_steed_array(nmax, z, jn.data());
+
+    ComplexArray ret = jn.cast<complex<double>>();
+    return ret;
+}
+
 
 complex<double> spherical_hn_2(int n, double z, bool derivative) {
     return std::conj(spherical_hn(n, z, derivative));
@@ -268,6 +278,57 @@ double wigner_3j(int j1, int j2, int j3, int m1, int m2, int m3) {
     return gsl_sf_coupling_3j(2*j1, 2*j2, 2*j3, 2*m1, 2*m2, 2*m3);
 }
 
+// Wigner small-d matrices for n = 0..nmax, where element (n+m', n+m) of the n-th matrix is d^n_{m'm}(beta).
+// Every (m', m) is recursed upward in n from n0 = max(|m|,|m'|), starting from the closed form
+//     d^n_{n,m}(beta) = sqrt((2n)!/((n+m)!(n-m)!)) cos(beta/2)^(n+m) (-sin(beta/2))^(n-m)
+// and the symmetries d^n_{m'm} = (-1)^(m-m') d^n_{mm'} = d^n_{-m,-m'}
+std::vector<Matrix> wigner_d_recursion(int nmax, double beta) {
+    std::vector<Matrix> d(nmax+1);
+    for (int n = 0; n <= nmax; n++)
+        d[n] = Matrix::Zero(2*n+1, 2*n+1);
+
+    double c = cos(beta/2);
+    double s = sin(beta/2);
+    double cos_beta = cos(beta);
+
+    auto d_top = [c, s](int n, int m) {
+        double binomial = exp(0.5*(std::lgamma(2*n+1) - std::lgamma(n+m+1) - std::lgamma(n-m+1)));
+        return binomial*pow(c, n+m)*pow(-s, n-m);
+    };
+
+    for (int mp = -nmax; mp <= nmax; mp++) {
+        for (int m = -nmax; m <= nmax; m++) {
+            int n0 = std::max(abs(m), abs(mp));
+
+            double value;
+            if (mp == n0)
+                value = d_top(n0, m);
+            else if (mp == -n0)
+                value = pow(-1, n0+m)*d_top(n0, -m);
+            else if (m == n0)
+                value = pow(-1, n0-mp)*d_top(n0, mp);
+            else
+                value = d_top(n0, -mp);
+
+            double prev = 0;
+            d[n0](n0+mp, n0+m) = value;
+
+            for (int n = n0+1; n <= nmax; n++) {
+                double next = (cos_beta - (m*mp == 0 ? 0 : double(m*mp)/(n*(n-1))))*value;
+                if (n > 1)
+                    next -= sqrt(double(((n-1)*(n-1) - m*m)*((n-1)*(n-1) - mp*mp)))/((n-1)*(2*n-1))*prev;
+                next *= n*(2*n-1)/sqrt(double((n*n - m*m)*(n*n - mp*mp)));
+
+                prev = value;
+                value = next;
+                d[n](n+mp, n+m) = value;
+            }
+        }
+    }
+
+    return d;
+}
+
 double a_func(int m, int n, int u, int v, int p) {
     double numerator   = factorial(n+m)*factorial(v+u)*factorial(p-m-u);
     double denominator = factorial(n-m)*factorial(v-u)*factorial(p+m+u);
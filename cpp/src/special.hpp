@@ -13,6 +13,7 @@ double spherical_yn(int n, double z, bool derivative=false);
 std::complex<double> spherical_hn(int n, double z, bool derivative=false);
 std::complex<double> spherical_hn_2(int n, double z, bool derivative=false);
 ComplexArray spherical_hn_recursion(int nmax, double z);
+ComplexArray spherical_jn_recursion(int nmax, double z);
 
 double riccati_1(int n, double z, bool derivative=false);
 double riccati_2(int n, double z, bool derivative=false);
@@ -24,6 +25,7 @@ double tau_func(int n, int m, double theta);
 double pi_func(int n, int m, double theta);
 
 double wigner_3j(int j1, int j2, int j3, int m1, int m2, int m3);
+std::vector<Matrix> wigner_d_recursion(int nmax, double beta);
 double a_func(int m, int n, int u, int v, int p);
 double b_func(int m, int n, int u, int v, int p);
 
@@ -4,6 +4,8 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
 #include <pybind11/complex.h>
+#include <pybind11/eigen.h>
+#include <pybind11/stl.h>
 
 namespace py = pybind11;
 using namespace pybind11::literals;
@@ -85,6 +87,13 @@ void bind_wigner_3j(py::module &m) {
     )pbdoc");
 }
 
+void bind_wigner_d(py::module &m) {
+    m.def("wigner_d", wigner_d_recursion, 
+           "nmax"_a, "beta"_a, R"pbdoc(
+        Wigner small-d matrices d^n(beta) for n = 0..nmax; element (n+m', n+m) of the n-th matrix is d^n_{m'm}(beta)
+    )pbdoc");
+}
+
 void bind_a_func(py::module &m) {
     m.def("a_func", a_func, 
            "m"_a, "n"_a, "u"_a, "v"_a, "p"_a, R"pbdoc(
@@ -0,0 +1,93 @@
+#define NOMINMAX
+#include "vsh_rotation.hpp"
+#include "special.hpp"
+#include "indices.hpp"
+#include <cmath>
+#include <algorithm>
+
+using std::complex;
+using namespace std::complex_literals;
+
+void vsh_rotation_operator(Ref<ComplexMatrix> D, int lmax, const Ref<const Eigen::Vector4d>& quat) {
+    Eigen::Vector4d q = quat.normalized();
+    double w = q(0), x = q(1), y = q(2), z = q(3);
+
+    double alpha = atan2(z, w) + atan2(-x, y);
+    double gamma = atan2(z, w) - atan2(-x, y);
+    double beta = 2*acos(std::min(1.0, sqrt(w*w + z*z)));
+
+    std::vector<Matrix> wigner_d = wigner_d_recursion(lmax, beta);
+    ComplexVector phase_alpha(2*lmax+1);
+    ComplexVector phase_gamma(2*lmax+1);
+    for (int m = -lmax; m <= lmax; m++) {
+        phase_alpha(lmax+m) = exp(-1i*(m*alpha));
+        phase_gamma(lmax+m) = exp(-1i*(m*gamma));
+    }
+
+    D.setZero();
+    for (int n = 1; n <= lmax; n++) {
+        int r = lmax_to_rmax(n-1);
+        D.block(r, r, 2*n+1, 2*n+1) = phase_alpha.segment(lmax-n, 2*n+1).asDiagonal()
+            *wigner_d[n].transpose().cast<complex<double>>()
+            *phase_gamma.segment(lmax-n, 2*n+1).asDiagonal();
+    }
+}
+
+ComplexMatrix vsh_rotation_matrix(int lmax, const Ref<const Eigen::Vector4d>& quat) {
+    int rmax = lmax_to_rmax(lmax);
+    ComplexMatrix D(rmax, rmax);
+    vsh_rotation_operator(D, lmax, quat);
+
+    return D;
+}
+
+ComplexMatrix vsh_rotation_matrices(int lmax, const Ref<const Matrix>& quat) {
+    int rmax = lmax_to_rmax(lmax);
+    int Q = quat.rows();
+    ComplexMatrix D(Q*rmax, rmax);
+
+    #pragma omp parallel for
+    for (int i = 0; i < Q; i++) {
+        Eigen::Vector4d q = quat.row(i).transpose();
+        vsh_rotation_operator(D.middleRows(i*rmax, rmax), lmax, q);
+    }
+
+    return D;
+}
+
+ComplexMatrix rotate_tmatrices(const Ref<const ComplexMatrix>& tmatrix, const Ref<const Matrix>& quat) {
+    int rmax = tmatrix.cols()/2;
+    int lmax = rmax_to_lmax(rmax);
+    int Q = quat.rows();
+    ComplexMatrix tmatrix_rot(Q*2*rmax, 2*rmax);
+
+    // D is block diagonal over n: apply it one order at a time
+    #pragma omp parallel for
+    for (int i = 0; i < Q; i++) {
+        ComplexMatrix D(rmax, rmax);
+        Eigen::Vector4d q = quat.row(i).transpose();
+        vsh_rotation_operator(D, lmax, q);
+
+        auto T = tmatrix.middleRows(2*i*rmax, 2*rmax);
+        auto T_rot = tmatrix_rot.middleRows(2*i*rmax, 2*rmax);
+        ComplexMatrix DT(2*rmax, 2*rmax);
+
+        for (int n = 1; n <= lmax; n++) {
+            int r = lmax_to_rmax(n-1);
+            auto D_n = D.block(r, r, 2*n+1, 2*n+1);
+
+            for (int a = 0; a < 2; a++)
+                DT.middleRows(a*rmax + r, 2*n+1).noalias() = D_n*T.middleRows(a*rmax + r, 2*n+1);
+        }
+
+        for (int n = 1; n <= lmax; n++) {
+            int r = lmax_to_rmax(n-1);
+            auto D_n = D.block(r, r, 2*n+1, 2*n+1);
+
+            for (int b = 0; b < 2; b++)
+                T_rot.middleCols(b*rmax + r, 2*n+1).noalias() = DT.middleCols(b*rmax + r, 2*n+1)*D_n.adjoint();
+        }
+    }
+
+    return tmatrix_rot;
+}
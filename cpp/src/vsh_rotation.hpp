@@ -0,0 +1,24 @@
+#ifndef GUARD_vsh_rotation_h
+#define GUARD_vsh_rotation_h
+
+#include <complex>
+#include "vec.hpp"
+
+// Wigner-D rotation of the VSH expansion coefficients of one polarization, for the rotation given by the
+// unit quaternion (w,x,y,z). The operator is block diagonal over the multipole order n; the block of order n,
+// between modes m' and m, is
+//     D^n_{m'm} = exp(-i m' alpha) d^n_{mm'}(beta) exp(-i m gamma)
+// where (alpha, beta, gamma) are the z-y-z Euler angles of the rotation, so that p' = D p
+void vsh_rotation_operator(Ref<ComplexMatrix> D, int lmax, const Ref<const Eigen::Vector4d>& quat);
+
+// D[rmax,rmax] for a single quaternion
+ComplexMatrix vsh_rotation_matrix(int lmax, const Ref<const Eigen::Vector4d>& quat);
+
+// D[Q*rmax,rmax] for every quaternion (row) of quat[Q,4], stacked along the rows
+ComplexMatrix vsh_rotation_matrices(int lmax, const Ref<const Matrix>& quat);
+
+// Rotate T-matrices [Q,2,rmax,2,rmax], viewed as tmatrix[Q*2*rmax,2*rmax], by the quaternions quat[Q,4]:
+// every polarization block becomes D T_ab D^H
+ComplexMatrix rotate_tmatrices(const Ref<const ComplexMatrix>& tmatrix, const Ref<const Matrix>& quat);
+
+#endif
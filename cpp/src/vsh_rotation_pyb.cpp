@@ -0,0 +1,35 @@
+#define NOMINMAX
+#include "vsh_rotation.hpp"
+
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/eigen.h>
+#include <pybind11/complex.h>
+#include <pybind11/stl.h>
+
+namespace py = pybind11;
+using namespace pybind11::literals;
+
+void bind_vsh_rotation_matrix(py::module &m) {
+    m.def("vsh_rotation_matrix", vsh_rotation_matrix,
+           "lmax"_a, "quat"_a, R"pbdoc(
+        Block-diagonal Wigner-D rotation matrix D[rmax,rmax] of the VSH expansion coefficients
+        for the rotation given by the quaternion components (w,x,y,z), such that p' = D p
+    )pbdoc");
+}
+
+void bind_vsh_rotation_matrices(py::module &m) {
+    m.def("vsh_rotation_matrices", vsh_rotation_matrices,
+           "lmax"_a, "quat"_a, R"pbdoc(
+        Block-diagonal Wigner-D rotation matrices D[Q*rmax,rmax] for every row (w,x,y,z) of quat[Q,4],
+        stacked along the rows
+    )pbdoc");
+}
+
+void bind_rotate_tmatrices(py::module &m) {
+    m.def("rotate_tmatrices", rotate_tmatrices,
+           "tmatrix"_a, "quat"_a, R"pbdoc(
+        Rotate the T-matrices tmatrix[Q*2*rmax,2*rmax] (T-matrices [Q,2,rmax,2,rmax] flattened) by the
+        quaternion components quat[Q,4]
+    )pbdoc");
+}
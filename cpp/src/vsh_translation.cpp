@@ -5,61 +5,86 @@
 #include <cmath>
 #include <algorithm>
 #include <iostream>
+#include <map>
+#include <memory>
+#include <mutex>
 
 using std::complex;
 using namespace std::complex_literals;
 
-vsh_cache::vsh_cache(int n, int m, int v, int u) {
-    factor = 0.5*pow(-1, m)*sqrt((2*v+1)*(2*n+1)*factorial(v-u)*factorial(n-m)
-            /(v*(v+1)*n*(n+1)*factorial(v+u)*factorial(n+m)));
-    qmax_A = std::min({n, v, (n + v - abs(m+u))/2});
-    qmax_B = std::min({n, v, (n + v + 1 - abs(m+u))/2});
-    A = ComplexArray(qmax_A+1);
-    B = ComplexArray(qmax_B+1);
-
-    for (int q = 0; q < qmax_A+1; q++) {
-        int p = n + v - 2*q;
-        double aq = a_func(m, n, u, v, p);
-        A(q) = aq*pow(1i, p)*double(n*(n+1) + v*(v+1) - p*(p+1));
-    }
-
-    B(0) = 0;
-    for (int q = 1; q < qmax_B+1; q++) {
-        int p = n + v - 2*q;
-        double bq = b_func(m, n, u, v, p);
-        B(q) = bq*pow(1i, p+1)*sqrt((pow(p+1,2) - pow(n-v,2))*(pow(n+v+1,2) - pow(p+1,2)));
-    }
+static inline double parity(int n) {
+    return (n % 2 == 0) ? 1 : -1;
 }
 
-vsh_cache_map create_vsh_cache_map(int lmax) {
-    vsh_cache_map ret;
+vsh_translation_table::vsh_translation_table(int lmax): lmax(lmax), rmax(lmax_to_rmax(lmax)) {
+    int size = rmax*rmax;
+    factor.resize(size);
+    offset_A.resize(size+1);
+    offset_B.resize(size+1);
+    offset_A[0] = 0;
+    offset_B[0] = 0;
 
     for (int n = 1; n < lmax+1; n++) {
         for (int m = -n; m < n+1; m++) {
-            for (int v = 1; v < n+1; v++) {
+            for (int v = 1; v < lmax+1; v++) {
                 for (int u = -v; u < v+1; u++) {
-                    std::array<int,4> key = {n, m, v, u};
-                    ret.insert(vsh_cache_map::value_type(key, vsh_cache(n, m, v, u)));
+                    int idx = index(n, m, v, u);
+
+                    factor[idx] = 0.5*pow(-1, m)*sqrt((2*v+1)*(2*n+1)*factorial(v-u)*factorial(n-m)
+                            /(v*(v+1)*n*(n+1)*factorial(v+u)*factorial(n+m)));
+
+                    int qmax_A = std::min({n, v, (n + v - abs(m+u))/2});
+                    for (int q = 0; q < qmax_A+1; q++) {
+                        int p = n + v - 2*q;
+                        double aq = a_func(m, n, u, v, p);
+                        A.push_back(aq*pow(1i, p)*double(n*(n+1) + v*(v+1) - p*(p+1)));
+                    }
+                    offset_A[idx+1] = A.size();
+
+                    int qmax_B = std::min({n, v, (n + v + 1 - abs(m+u))/2});
+                    B.push_back(0);
+                    for (int q = 1; q < qmax_B+1; q++) {
+                        int p = n + v - 2*q;
+                        double bq = b_func(m, n, u, v, p);
+                        B.push_back(bq*pow(1i, p+1)*sqrt((pow(p+1,2) - pow(n-v,2))*(pow(n+v+1,2) - pow(p+1,2))));
+                    }
+                    offset_B[idx+1] = B.size();
                 }
             }
         }
     }
+}
+
+const vsh_translation_table& get_vsh_translation_table(int lmax) {
+    static std::mutex tables_mutex;
+    static std::map<int, std::unique_ptr<const vsh_translation_table>> tables;
 
-    return ret;    
+    std::lock_guard<std::mutex> lock(tables_mutex);
+    auto& table = tables[lmax];
+    if (!table)
+        table.reset(new vsh_translation_table(lmax));
+
+    return *table;
 }
 
-void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const tmatrix_t& tmatrix, int i, int j, 
-        double rad, double theta, double phi, double k, const vsh_cache_map& vsh_precompute) {
+// Fill the [2*rmax,2*rmax] translation blocks between particles i and j, where
+// (rad, theta, phi) is the position of i relative to j. block_ij acts on
+// expansions centered at j and block_ji on expansions centered at i.
+void vsh_translation_block(Ref<ComplexMatrix> block_ij, Ref<ComplexMatrix> block_ji, int lmax,
+        double rad, double theta, double phi, double k, const vsh_translation_table& table,
+        translation_kernel kernel) {
+
+    if (kernel == translation_kernel::rotation) {
+        rotated_translation(lmax, rad, theta, phi, k, table).blocks(block_ij, block_ji);
+        return;
+    }
 
-    int rmax = tmatrix.dimensions()[1]/2;
-    int lmax = rmax_to_lmax(rmax);
+    int rmax = lmax_to_rmax(lmax);
 
     int p_max = 2*lmax + 1;
     ComplexArray zn = spherical_hn_recursion(p_max, k*rad);
     Array Pnm = associated_legendre_recursion(p_max, cos(theta));
 
-    ComplexMatrix A_matrix(agg_tmatrix.rows(), agg_tmatrix.cols());
-
     for (int n = 1; n < lmax+1; n++) {
         for (int m = -n; m < n+1; m++) {
             for (int v = 1; v < n+1; v++) {
@@ -69,33 +94,30 @@ void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const tmatrix_t
 
                     m *= -1;
 
-                    std::array<int,4> key = {n, m, v, u};
-                    vsh_cache cache = vsh_precompute.at(key);
-                    complex<double> factor = cache.factor;
-                    int qmax_A = cache.qmax_A;
-                    int qmax_B = cache.qmax_B;
-                    ComplexArray A = cache.A;
-                    ComplexArray B = cache.B;
-
-                    complex<double> exp_phi = exp(1i*double(u+m)*phi);
+                    int entry = table.index(n, m, v, u);
+                    const complex<double>* A = table.A.data() + table.offset_A[entry];
+                    const complex<double>* B = table.B.data() + table.offset_B[entry];
+                    int qmax_A = table.offset_A[entry+1] - table.offset_A[entry] - 1;
+                    int qmax_B = table.offset_B[entry+1] - table.offset_B[entry] - 1;
+                    complex<double> factor = table.factor[entry]*exp(1i*double(u+m)*phi);
 
                     complex<double> sum_term = 0;
                     for (int q = 0; q < qmax_A+1; q++) {
                         int p = n + v - 2*q;
                         int idx = p*(p+2) - p + (u+m);
-                        sum_term += A(q)*Pnm(idx)*zn(p);
+                        sum_term += A[q]*Pnm(idx)*zn(p);
                     }
 
-                    complex<double> A_translation = factor*exp_phi*sum_term;
+                    complex<double> A_translation = factor*sum_term;
 
                     sum_term = 0;
                     for (int q = 1; q < qmax_B+1; q++) {
                         int p = n + v - 2*q;
                         int idx = (p+1)*((p+1)+2) - (p+1) + (u+m);
-                        sum_term += B(q)*Pnm(idx)*zn(p+1);
+                        sum_term += B[q]*Pnm(idx)*zn(p+1);
                     }
 
-                    complex<double> B_translation = -factor*exp_phi*sum_term;
+                    complex<double> B_translation = -factor*sum_term;
                     std::array<complex<double>,2> transfer{A_translation, B_translation};
 
                     m *= -1;
@@ -103,22 +125,16 @@ void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const tmatrix_t
                     for (int a = 0; a < 2; a++) {
                         for (int b = 0; b < 2; b++) {
                             complex<double> val = transfer[(a+b)%2];
-                            int idx = i*(2*rmax) + a*(rmax) + n*(n+2) - n + m - 1;
-                            int idy = j*(2*rmax) + b*(rmax) + v*(v+2) - v + u - 1;
-                            A_matrix(idx, idy) = val;
-
-                            idx = j*(2*rmax) + a*(rmax) + n*(n+2) - n + m - 1;
-                            idy = i*(2*rmax) + b*(rmax) + v*(v+2) - v + u - 1;
-                            A_matrix(idx, idy) = pow(-1, n+v+a+b)*val;
+                            int idx = a*(rmax) + n*(n+2) - n + m - 1;
+                            int idy = b*(rmax) + v*(v+2) - v + u - 1;
+                            block_ij(idx, idy) = val;
+                            block_ji(idx, idy) = parity(n+v+a+b)*val;
 
                             if ((n == v && u != -m) || (n != v)) {
-                                idx = i*(2*rmax) + b*(rmax) + v*(v+2) - v - u - 1;
-                                idy = j*(2*rmax) + a*(rmax) + n*(n+2) - n - m - 1;
-                                A_matrix(idx, idy) = pow(-1, m+u-a-b)*val;
-
-                                idx = j*(2*rmax) + b*(rmax) + v*(v+2) - v - u - 1;
-                                idy = i*(2*rmax) + a*(rmax) + n*(n+2) - n - m - 1;
-                                A_matrix(idx, idy) = pow(-1, m+u+n+v)*val;
+                                idx = b*(rmax) + v*(v+2) - v - u - 1;
+                                idy = a*(rmax) + n*(n+2) - n - m - 1;
+                                block_ij(idx, idy) = parity(m+u-a-b)*val;
+                                block_ji(idx, idy) = parity(m+u+n+v)*val;
                             }
                         }
                     }
@@ -126,115 +142,221 @@ void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const tmatrix_t
             }
         }
     }
+}
+
+// With (rad, theta, phi) along the z-axis the associated Legendre functions vanish unless u = m,
+// so the translation coefficients of vsh_translation_block reduce to the axial translation A_z
+rotated_translation::rotated_translation(int lmax, double rad, double theta, double phi, double k,
+        const vsh_translation_table& table): lmax(lmax), rmax(lmax_to_rmax(lmax)) {
+
+    wigner_d = wigner_d_recursion(lmax, theta);
+
+    phase.resize(2*lmax+1);
+    for (int m = -lmax; m < lmax+1; m++)
+        phase(m+lmax) = exp(-1i*double(m)*phi);
+
+    ComplexArray zn = spherical_hn_recursion(2*lmax + 1, k*rad);
+
+    axial.resize(2*lmax+1);
+    for (int m = -lmax; m < lmax+1; m++) {
+        int nmin = std::max(1, abs(m));
+        int count = lmax - nmin + 1;
+        ComplexMatrix& A_z = axial[m+lmax];
+        A_z.resize(2*count, 2*count);
+
+        for (int n = nmin; n < lmax+1; n++) {
+            for (int v = nmin; v < lmax+1; v++) {
+                int entry = table.index(n, -m, v, m);
+                const complex<double>* A = table.A.data() + table.offset_A[entry];
+                const complex<double>* B = table.B.data() + table.offset_B[entry];
+                int qmax_A = table.offset_A[entry+1] - table.offset_A[entry] - 1;
+                int qmax_B = table.offset_B[entry+1] - table.offset_B[entry] - 1;
+
+                complex<double> sum_A = 0;
+                for (int q = 0; q < qmax_A+1; q++)
+                    sum_A += A[q]*zn(n + v - 2*q);
+
+                complex<double> sum_B = 0;
+                for (int q = 1; q < qmax_B+1; q++)
+                    sum_B += B[q]*zn(n + v - 2*q + 1);
+
+                int x = n - nmin;
+                int y = v - nmin;
+                A_z(x, y) = A_z(count + x, count + y) = table.factor[entry]*sum_A;
+                A_z(x, count + y) = A_z(count + x, y) = -table.factor[entry]*sum_B;
+            }
+        }
+    }
+}
+
+// A_ij[(a,n,m'),(b,v,u')] = exp(-i m' phi) sum_m d^n_{m m'} A_z[(a,n,m),(b,v,m)] d^v_{m u'} exp(i u' phi)
+// and A_ji = P A_ij P, with the parity P = (-1)^(n+a) of the modes. A_z is the same for a = b
+// (and for a != b), so each (n,v) needs two products; d is real, so these are real products
+void rotated_translation::blocks(Ref<ComplexMatrix> block_ij, Ref<ComplexMatrix> block_ji) const {
+    Array A_real(2*lmax+1), A_imag(2*lmax+1), B_real(2*lmax+1), B_imag(2*lmax+1);
+    Matrix product_real, product_imag;
+    ComplexMatrix product;
 
     for (int n = 1; n < lmax+1; n++) {
-    for (int m = -n; m < n+1; m++) {
-    for (int a = 0; a < 2; a++) {
         for (int v = 1; v < lmax+1; v++) {
-        for (int u = -v; u < v+1; u++) {
-        for (int b = 0; b < 2; b++) {
-            for (int vp = 1; vp < lmax+1; vp++) {
-            for (int up = -vp; up < vp+1; up++) {
-            for (int bp = 0; bp < 2; bp++) {
-
-                int ida = a*(rmax) + n*(n+2) - n + m - 1;
-                int idb = b*(rmax) + v*(v+2) - v + u - 1;
-                int idc = bp*(rmax) + vp*(vp+2) - vp - up - 1;
-
-                int idx = i*(2*rmax) + ida;
-                int idy = j*(2*rmax) + idb;
-                int mid = j*(2*rmax) + idc;
-
-                agg_tmatrix(idx, idy) += A_matrix(idx, mid)*tmatrix(j, idc, idb);
-
-                idx = j*(2*rmax) + ida;
-                idy = i*(2*rmax) + idb;
-                mid = i*(2*rmax) + idc;
-                agg_tmatrix(idx, idy) += A_matrix(idx, mid)*tmatrix(i, idc, idb);
-            }}}
-        }}}
-    }}}
+            int mu = std::min(n, v);
+            for (int m = -mu; m < mu+1; m++) {
+                int nmin = std::max(1, abs(m));
+                int count = lmax - nmin + 1;
+                complex<double> A_z = axial[m+lmax](n - nmin, v - nmin);
+                complex<double> B_z = axial[m+lmax](n - nmin, count + v - nmin);
+                A_real(m+mu) = A_z.real();
+                A_imag(m+mu) = A_z.imag();
+                B_real(m+mu) = B_z.real();
+                B_imag(m+mu) = B_z.imag();
+            }
+
+            auto d_n = wigner_d[n].middleRows(n-mu, 2*mu+1).transpose();
+            auto d_v = wigner_d[v].middleRows(v-mu, 2*mu+1);
+
+            for (int c = 0; c < 2; c++) {
+                const Array& real = (c == 0) ? A_real : B_real;
+                const Array& imag = (c == 0) ? A_imag : B_imag;
+                product_real.noalias() = d_n*real.head(2*mu+1).matrix().asDiagonal()*d_v;
+                product_imag.noalias() = d_n*imag.head(2*mu+1).matrix().asDiagonal()*d_v;
+
+                product.resize(2*n+1, 2*v+1);
+                for (int x = 0; x < 2*n+1; x++) {
+                    for (int y = 0; y < 2*v+1; y++) {
+                        complex<double> rotation = phase(lmax-n+x)*std::conj(phase(lmax-v+y));
+                        product(x, y) = complex<double>(product_real(x, y), product_imag(x, y))*rotation;
+                    }
+                }
+
+                for (int a = 0; a < 2; a++) {
+                    int b = (a + c) % 2;
+                    int row = a*rmax + n*n - 1;
+                    int col = b*rmax + v*v - 1;
+                    block_ij.block(row, col, 2*n+1, 2*v+1) = product;
+                    block_ji.block(row, col, 2*n+1, 2*v+1) = parity(n+v+a+b)*product;
+                }
+            }
+        }
+    }
 }
 
-void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const Ref<const ComplexMatrix>& mie, int i, int j, 
-        double rad, double theta, double phi, double k, const vsh_cache_map& vsh_precompute) {
+// Each expansion x is rotated into the pair frame, x' = R^-1 x, translated along the z-axis for
+// every m, y' = A_z x', and rotated back, y = R y'. The expansions of particle i are translated
+// together with those of particle j, after the parity P that maps A_ij to A_ji
+void rotated_translation::apply(Ref<ComplexMatrix> Y_i, Ref<ComplexMatrix> Y_j,
+        const Ref<const ComplexMatrix>& X_i, const Ref<const ComplexMatrix>& X_j) const {
 
-    int lmax = mie.cols()/2;
-    int rmax = lmax_to_rmax(lmax);
+    int S = X_j.rows();
+    ComplexMatrix X(2*S, 2*rmax);
+    ComplexMatrix X_rotated(2*S, 2*rmax);
+    ComplexMatrix Y_rotated(2*S, 2*rmax);
 
-    int p_max = 2*lmax + 1;
-    ComplexArray zn = spherical_hn_recursion(p_max, k*rad);
-    Array Pnm = associated_legendre_recursion(p_max, cos(theta));
+    X.topRows(S) = X_j;
+    X.bottomRows(S) = X_i;
+    for (int a = 0; a < 2; a++) {
+        for (int n = 1; n < lmax+1; n++) {
+            if ((n + a) % 2 == 1)
+                X.bottomRows(S).middleCols(a*rmax + n*n - 1, 2*n+1) *= -1;
+        }
+    }
 
-    for (int n = 1; n < lmax+1; n++) {
-        for (int m = -n; m < n+1; m++) {
-            for (int v = 1; v < n+1; v++) {
-                for (int u = -v; u < v+1; u++) {
-                    if (n == v && u < -m)
-                        continue;
+    for (int a = 0; a < 2; a++) {
+        for (int n = 1; n < lmax+1; n++) {
+            int col = a*rmax + n*n - 1;
+            X_rotated.middleCols(col, 2*n+1).noalias() = (X.middleCols(col, 2*n+1)
+                *phase.segment(lmax-n, 2*n+1).conjugate().asDiagonal())*wigner_d[n].transpose().cast<complex<double>>();
+        }
+    }
 
-                    m *= -1;
+    for (int m = -lmax; m < lmax+1; m++) {
+        int nmin = std::max(1, abs(m));
+        int count = lmax - nmin + 1;
+
+        ComplexMatrix modes(2*S, 2*count);
+        for (int a = 0; a < 2; a++) {
+            for (int n = nmin; n < lmax+1; n++)
+                modes.col(a*count + n - nmin) = X_rotated.col(a*rmax + n*(n+1) + m - 1);
+        }
+
+        ComplexMatrix translated = modes*axial[m+lmax].transpose();
+        for (int a = 0; a < 2; a++) {
+            for (int n = nmin; n < lmax+1; n++)
+                Y_rotated.col(a*rmax + n*(n+1) + m - 1) = translated.col(a*count + n - nmin);
+        }
+    }
+
+    for (int a = 0; a < 2; a++) {
+        for (int n = 1; n < lmax+1; n++) {
+            int col = a*rmax + n*n - 1;
+            ComplexMatrix Y = (Y_rotated.middleCols(col, 2*n+1)*wigner_d[n].cast<complex<double>>())
+                *phase.segment(lmax-n, 2*n+1).asDiagonal();
+
+            Y_i.middleCols(col, 2*n+1) += Y.topRows(S);
+            if ((n + a) % 2 == 1)
+                Y_j.middleCols(col, 2*n+1) -= Y.bottomRows(S);
+            else
+                Y_j.middleCols(col, 2*n+1) += Y.bottomRows(S);
+        }
+    }
+}
 
-                    std::array<int,4> key = {n, m, v, u};
-                    vsh_cache cache = vsh_precompute.at(key);
-                    complex<double> factor = cache.factor;
-                    int qmax_A = cache.qmax_A;
-                    int qmax_B = cache.qmax_B;
-                    ComplexArray A = cache.A;
-                    ComplexArray B = cache.B;
+// Fill the [2*rmax_target,2*rmax_source] matrix that translates an expansion centered at a source
+// point to an expansion centered at a target point, where (rad, theta, phi) is the position of the
+// target relative to the source. With mode = outgoing the radial functions are hn, as in
+// vsh_translation_block; with mode = incident they are jn, which translates outgoing expansions to
+// outgoing expansions (and regular to regular). The table must cover max(lmax_target, lmax_source)
+void vsh_translation_matrix(Ref<ComplexMatrix> block, int lmax_target, int lmax_source,
+        double rad, double theta, double phi, double k, vsh_mode mode, const vsh_translation_table& table) {
 
-                    complex<double> exp_phi = exp(1i*double(u+m)*phi);
+    int rmax_target = lmax_to_rmax(lmax_target);
+    int rmax_source = lmax_to_rmax(lmax_source);
+
+    int p_max = lmax_target + lmax_source + 1;
+    ComplexArray zn = (mode == vsh_mode::outgoing) ? spherical_hn_recursion(p_max, k*rad)
+                                                   : spherical_jn_recursion(p_max, k*rad);
+    Array Pnm = associated_legendre_recursion(p_max, cos(theta));
+
+    for (int n = 1; n < lmax_target+1; n++) {
+        for (int m = -n; m < n+1; m++) {
+            for (int v = 1; v < lmax_source+1; v++) {
+                for (int u = -v; u < v+1; u++) {
+                    int entry = table.index(n, -m, v, u);
+                    const complex<double>* A = table.A.data() + table.offset_A[entry];
+                    const complex<double>* B = table.B.data() + table.offset_B[entry];
+                    int qmax_A = table.offset_A[entry+1] - table.offset_A[entry] - 1;
+                    int qmax_B = table.offset_B[entry+1] - table.offset_B[entry] - 1;
+                    complex<double> factor = table.factor[entry]*exp(1i*double(u-m)*phi);
 
                     complex<double> sum_term = 0;
                     for (int q = 0; q < qmax_A+1; q++) {
                         int p = n + v - 2*q;
-                        int idx = p*(p+2) - p + (u+m);
-                        sum_term += A(q)*Pnm(idx)*zn(p);
+                        int idx = p*(p+2) - p + (u-m);
+                        sum_term += A[q]*Pnm(idx)*zn(p);
                     }
 
-                    complex<double> A_translation = factor*exp_phi*sum_term;
+                    complex<double> A_translation = factor*sum_term;
 
                     sum_term = 0;
                     for (int q = 1; q < qmax_B+1; q++) {
                         int p = n + v - 2*q;
-                        int idx = (p+1)*((p+1)+2) - (p+1) + (u+m);
-                        sum_term += B(q)*Pnm(idx)*zn(p+1);
+                        int idx = (p+1)*((p+1)+2) - (p+1) + (u-m);
+                        sum_term += B[q]*Pnm(idx)*zn(p+1);
                     }
 
-                    complex<double> B_translation = -factor*exp_phi*sum_term;
-                    std::array<complex<double>,2> transfer{A_translation, B_translation};
+                    complex<double> B_translation = -factor*sum_term;
 
-                    m *= -1;
-
-                    for (int a = 0; a < 2; a++) {
-                        for (int b = 0; b < 2; b++) {
-                            complex<double> val = transfer[(a+b)%2];
-                            int idx = i*(2*rmax) + a*(rmax) + n*(n+2) - n + m - 1;
-                            int idy = j*(2*rmax) + b*(rmax) + v*(v+2) - v + u - 1;
-                            agg_tmatrix(idx, idy) = val*mie(j, b*lmax + v-1);
-
-                            idx = j*(2*rmax) + a*(rmax) + n*(n+2) - n + m - 1;
-                            idy = i*(2*rmax) + b*(rmax) + v*(v+2) - v + u - 1;
-                            agg_tmatrix(idx, idy) = pow(-1, n+v+a+b)*val*mie(i, b*lmax + v-1);
-
-                            if ((n == v && u != -m) || (n != v)) {
-                                idx = i*(2*rmax) + b*(rmax) + v*(v+2) - v - u - 1;
-                                idy = j*(2*rmax) + a*(rmax) + n*(n+2) - n - m - 1;
-                                agg_tmatrix(idx, idy) = pow(-1, m+u-a-b)*val*mie(j, a*lmax + n-1);
-
-                                idx = j*(2*rmax) + b*(rmax) + v*(v+2) - v - u - 1;
-                                idy = i*(2*rmax) + a*(rmax) + n*(n+2) - n - m - 1;
-                                agg_tmatrix(idx, idy) = pow(-1, m+u+n+v)*val*mie(i, a*lmax + n-1);
-                            }
-                        }
-                    }
+                    int idx = n*(n+2) - n + m - 1;
+                    int idy = v*(v+2) - v + u - 1;
+                    block(idx, idy) = A_translation;
+                    block(rmax_target + idx, rmax_source + idy) = A_translation;
+                    block(idx, rmax_source + idy) = B_translation;
+                    block(rmax_target + idx, idy) = B_translation;
                 }
             }
         }
     }
 }
 
-
 py::array_t<complex<double>> vsh_translation_lambda_py(
         int m, int n, int u, int v, py::array_t<double> rad, py::array_t<double> theta,
         py::array_t<double> phi, double k, vsh_mode mode) {
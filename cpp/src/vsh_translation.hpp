@@ -4,7 +4,7 @@
 #include <complex>
 #include <functional>
 #include <array>
-#include <map>
+#include <vector>
 #include "vec.hpp"
 #include "vsh_functions.hpp"
 
@@ -13,25 +13,66 @@
 #include <pybind11/numpy.h>
 namespace py = pybind11;
 
-struct vsh_cache {
-    std::complex<double> factor;
-    int qmax_A;
-    int qmax_B;
-    ComplexArray A;
-    ComplexArray B;
-
-    vsh_cache(int n, int m, int v, int u);
+// Position-independent VSH translation coefficients for every (n,m,v,u) up to lmax,
+// stored in flat arrays. The coefficients of entry idx = index(n,m,v,u) are
+// A[offset_A[idx]:offset_A[idx+1]] and B[offset_B[idx]:offset_B[idx+1]]
+struct vsh_translation_table {
+    int lmax;
+    int rmax;
+    std::vector<std::complex<double>> factor;
+    std::vector<int> offset_A;
+    std::vector<int> offset_B;
+    std::vector<std::complex<double>> A;
+    std::vector<std::complex<double>> B;
+
+    explicit vsh_translation_table(int lmax);
+
+    int index(int n, int m, int v, int u) const {
+        return (n*(n+2) - n + m - 1)*rmax + v*(v+2) - v + u - 1;
+    }
 };
 
-using vsh_cache_map = std::map<std::array<int,4>, vsh_cache>;
+// Process-wide table for a given lmax; built once on first use and shared by all threads
+const vsh_translation_table& get_vsh_translation_table(int lmax);
+
+// Evaluation of the translations between particle pairs
+//     direct:     sum the translation coefficients of every (n,m,v,u) pair of modes
+//     rotation:   rotate into the pair axis, translate along it and rotate back (see rotated_translation)
+enum class translation_kernel {
+    direct,
+    rotation
+};
 
-vsh_cache_map create_vsh_cache_map(int lmax);
+// Translation between particles i and j factored as A_ij = R A_z R^-1 (point-and-shoot), where R is the
+// rotation that takes the z-axis to the pair axis and A_z is the translation along the z-axis, which only
+// couples modes of equal m. The factors take O(lmax^4) operations instead of the O(lmax^5) of the direct
+// translation blocks, and applying them to an expansion takes O(lmax^3) instead of O(lmax^4)
+class rotated_translation {
+public:
+    rotated_translation(int lmax, double rad, double theta, double phi, double k,
+            const vsh_translation_table& table);
+
+    // fill the translation blocks A_ij and A_ji (see vsh_translation_block)
+    void blocks(Ref<ComplexMatrix> block_ij, Ref<ComplexMatrix> block_ji) const;
+
+    // Y_i += X_j A_ij^T and Y_j += X_i A_ji^T, where each row of the [S,2*rmax] matrices is an expansion
+    void apply(Ref<ComplexMatrix> Y_i, Ref<ComplexMatrix> Y_j,
+            const Ref<const ComplexMatrix>& X_i, const Ref<const ComplexMatrix>& X_j) const;
+
+private:
+    int lmax;
+    int rmax;
+    std::vector<Matrix> wigner_d;         // d^n(theta) for n = 0..lmax
+    ComplexVector phase;                  // exp(-i*m*phi) for m = -lmax..lmax
+    std::vector<ComplexMatrix> axial;     // A_z between the modes (a,n,m) of every m, n = max(1,|m|)..lmax
+};
 
-void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const tmatrix_t& tmatrix, int i, int j, 
-        double rad, double theta, double phi, double k, const vsh_cache_map& vsh_precompute);
+void vsh_translation_block(Ref<ComplexMatrix> block_ij, Ref<ComplexMatrix> block_ji, int lmax,
+        double rad, double theta, double phi, double k, const vsh_translation_table& table,
+        translation_kernel kernel = translation_kernel::direct);
 
-void vsh_translation_insert_pair(Ref<ComplexMatrix> agg_tmatrix, const Ref<const ComplexMatrix>& mie, int i, int j, 
-        double rad, double theta, double phi, double k, const vsh_cache_map& vsh_precompute);
+void vsh_translation_matrix(Ref<ComplexMatrix> block, int lmax_target, int lmax_source,
+        double rad, double theta, double phi, double k, vsh_mode mode, const vsh_translation_table& table);
 
 py::array_t<double> combine_arrays(py::array_t<double> a, py::array_t<double> b);
 
@@ -1,5 +1,6 @@
 #define NOMINMAX
 #include "vsh_translation.hpp"
+#include "indices.hpp"
 
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
@@ -52,6 +53,28 @@ void bind_vsh_translation_lambda_py(py::module &m) {
     )pbdoc");
 }
 
+void bind_enum_translation_kernel(py::module &m) {
+    py::enum_<translation_kernel>(m, "translation_kernel")
+        .value("direct", translation_kernel::direct)
+        .value("rotation", translation_kernel::rotation);
+}
+
+void bind_vsh_translation_block(py::module &m) {
+    m.def("vsh_translation_block", [](int lmax, double rad, double theta, double phi, double k,
+                translation_kernel kernel) {
+
+                int size = 2*lmax_to_rmax(lmax);
+                ComplexMatrix block_ij(size, size);
+                ComplexMatrix block_ji(size, size);
+                vsh_translation_block(block_ij, block_ji, lmax, rad, theta, phi, k,
+                        get_vsh_translation_table(lmax), kernel);
+                return std::make_tuple(block_ij, block_ji);
+            },
+        "lmax"_a, "rad"_a, "theta"_a, "phi"_a, "k"_a, "kernel"_a=translation_kernel::direct, R"pbdoc(
+        Translation blocks (A_ij, A_ji) between particles i and j, where (rad, theta, phi) is the position of i relative to j
+    )pbdoc");
+}
+
 void bind_test3(py::module &m) {
     m.def("test3", test3,
             "size"_a, "cores"_a, R"pbdoc(
@@ -0,0 +1,25 @@
+"""
+speed of the in-process EBCM T-matrices compared to NFM-DS
+"""
+
+import numpy as np
+import miepy
+from timer import time_function
+
+nm = 1e-9
+wavelength = 600*nm
+eps = 4 + 0.5j
+eps_m = 1.33**2
+miepy.tmatrix.cache.enabled = False
+
+spheroid = miepy.tmatrix.spheroid_surface(100*nm, 200*nm)
+ellipsoid = miepy.tmatrix.ellipsoid_surface(100*nm, 150*nm, 200*nm)
+
+for lmax in [4, 6, 10]:
+    nfmds = time_function(lambda: miepy.tmatrix.tmatrix_spheroid(100*nm, 200*nm, wavelength, eps, eps_m, lmax))
+    ebcm = time_function(lambda: miepy.tmatrix.tmatrix_ebcm(spheroid, wavelength, eps, eps_m, lmax, axisymmetric=True))
+    print(f'spheroid,  lmax = {lmax:>2}: NFM-DS {nfmds:.3f}s, EBCM {ebcm:.3f}s')
+
+    nfmds = time_function(lambda: miepy.tmatrix.tmatrix_ellipsoid(100*nm, 150*nm, 200*nm, wavelength, eps, eps_m, lmax))
+    ebcm = time_function(lambda: miepy.tmatrix.tmatrix_ebcm(ellipsoid, wavelength, eps, eps_m, lmax))
+    print(f'ellipsoid, lmax = {lmax:>2}: NFM-DS {nfmds:.3f}s, EBCM {ebcm:.3f}s')
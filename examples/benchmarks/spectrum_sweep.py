@@ -0,0 +1,58 @@
+"""
+speed of a spectral sweep of one cluster compared to building a new cluster at every wavelength
+
+Measured on a single core (60 Ag spheres, lmax=4, 20 wavelengths from 400 to 800 nm):
+
+    new clusters  13.6 s
+           sweep  14.6 s
+
+    per wavelength: aggregate T-matrix build 0.18 s, bicgstab solve 0.43 s
+    bicgstab iterations over 19 wavelengths: 189 warm started, 184 cold
+
+The sweep is not faster here: the solves dominate, and at 20 nm spacing the previous solution is no better
+a starting point than the source coefficients. The pair geometry that does not depend on the wavelength
+(Legendre values and phases, O(lmax^2) per pair) is a small part of the build, which is dominated by the
+O(lmax^5) translation sums that depend on k, so the sweep does not cache it
+"""
+
+import numpy as np
+import miepy
+from timer import time_function
+
+nm = 1e-9
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave([1,0])
+wavelengths = np.linspace(400*nm, 800*nm, 20)
+
+np.random.seed(0)
+Nparticles = 60
+positions = np.random.uniform(-1500*nm, 1500*nm, size=(Nparticles,3))
+
+def build(wavelength):
+    return miepy.sphere_cluster(position=positions, radius=75*nm, material=Ag, source=source,
+                                wavelength=wavelength, lmax=4)
+
+def new_clusters():
+    return [build(wavelength).cross_sections() for wavelength in wavelengths]
+
+def sweep():
+    return build(wavelengths[0]).spectrum(wavelengths)
+
+def breakdown():
+    """build and solve times per wavelength, and iterations of warm started and cold solves"""
+    cluster = build(wavelengths[0])
+    build_time, solve_time, warm, cold = 0, 0, 0, 0
+    for wavelength in wavelengths[1:]:
+        cluster.solve(wavelength=wavelength)
+        build_time += cluster.solve_info.build_time
+        solve_time += cluster.solve_info.solve_time
+        warm += cluster.solve_info.iterations
+        cold += build(wavelength).solve_info.iterations
+
+    W = len(wavelengths) - 1
+    print(f'per wavelength: build {build_time/W:.3f}s, solve {solve_time/W:.3f}s')
+    print(f'iterations over {W} wavelengths: {warm} warm started, {cold} cold')
+
+print(f'{"new clusters":>14} {time_function(new_clusters):>8.3f}s')
+print(f'{"sweep":>14} {time_function(sweep):>8.3f}s')
+breakdown()
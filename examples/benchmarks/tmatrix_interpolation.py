@@ -0,0 +1,31 @@
+"""
+speed of a spectral sweep of NFM-DS particles with interpolated T-matrices compared to exact T-matrices
+"""
+
+import numpy as np
+import miepy
+from timer import time_function
+
+nm = 1e-9
+wavelengths = np.linspace(400*nm, 800*nm, 200)
+source = miepy.sources.plane_wave([1,0])
+miepy.tmatrix.cache.enabled = False
+
+def drude(wavelength):
+    energy = 1239.84193*nm/wavelength
+    return 5 - 9**2/(energy**2 + 0.05j*energy)
+
+material = miepy.function_material(drude)
+positions = [[-150*nm, 0, 0], [150*nm, 0, 0]]
+
+def sweep(interpolate):
+    def f():
+        particles = [miepy.spheroid(pos, 60*nm, 100*nm, material) for pos in positions]
+        if interpolate:
+            particles[0].interpolate_tmatrix(wavelengths[0], wavelengths[-1], 3, 1, tolerance=1e-5)
+        cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelengths[0], lmax=3)
+        return cluster.spectrum(wavelengths)
+    return f
+
+print(f'{"exact":>14} {time_function(sweep(False)):>8.3f}s')
+print(f'{"interpolated":>14} {time_function(sweep(True)):>8.3f}s')
@@ -0,0 +1,40 @@
+"""
+accuracy and speed of the direct and rotation (point-and-shoot) translation kernels
+"""
+
+import numpy as np
+import miepy
+from functools import partial
+from timer import time_function
+
+nm = 1e-9
+wavelength = 600*nm
+k = 2*np.pi/wavelength
+kernel = miepy.translation_kernel
+rad, theta, phi = 400*nm, 0.7, 0.4
+
+np.random.seed(0)
+Nparticles = 40
+positions = np.random.uniform(-1500*nm, 1500*nm, size=(Nparticles,3))
+
+print(f'{"lmax":>4} {"block error":>12} {"direct":>10} {"rotation":>10} {"product error":>14} {"direct":>10} {"rotation":>10}')
+for lmax in [2, 4, 6, 8, 10, 12]:
+    rmax = lmax*(lmax + 2)
+
+    block = partial(miepy.cpp.vsh_translation.vsh_translation_block, lmax, rad, theta, phi, k)
+    A_direct = block(kernel.direct)[0]
+    A_rotation = block(kernel.rotation)[0]
+    block_error = np.linalg.norm(A_direct - A_rotation)/np.linalg.norm(A_direct)
+    T_block_direct = time_function(partial(block, kernel.direct))
+    T_block_rotation = time_function(partial(block, kernel.rotation))
+
+    w = np.random.normal(size=Nparticles*2*rmax) + 1j*np.random.normal(size=Nparticles*2*rmax)
+    product = partial(miepy.cpp.interactions.translation_product, positions, lmax, k, w)
+    y_direct = product(kernel.direct)
+    y_rotation = product(kernel.rotation)
+    product_error = np.linalg.norm(y_direct - y_rotation)/np.linalg.norm(y_direct)
+    T_product_direct = time_function(partial(product, kernel.direct))
+    T_product_rotation = time_function(partial(product, kernel.rotation))
+
+    print(f'{lmax:>4} {block_error:>12.2e} {T_block_direct*1e3:>8.3f}ms {T_block_rotation*1e3:>8.3f}ms '
+          f'{product_error:>14.2e} {T_product_direct*1e3:>8.2f}ms {T_product_rotation*1e3:>8.2f}ms')
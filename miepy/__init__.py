@@ -10,6 +10,9 @@ from . import vsh
 from . import sources
 from . import material_functions
 from . import interactions
+from . import truncation
+from . import dynamics
+from . import sweep
 from . import tmatrix
 from . import particles
 from . import forces
@@ -33,6 +36,7 @@ from .vsh import (mode_indices, vsh_mode, VSH, expand_E, expand_E_far, expand_H,
 from .particles import (sphere, spheroid, cylinder, ellipsoid, regular_prism, cube,
                        sphere_cluster_particle, core_shell)
 from .cpp.interactions import solver
+from .cpp.vsh_translation import translation_kernel
 from .interface import interface
 from .visual.view3d import visualize
 from .microscope import microscope, cluster_microscope
@@ -1,6 +1,9 @@
 """
 The Generalized Mie Theory (GMT) for a collection of particles
 """
+import copy
+import time
+import warnings
 import numpy as np
 import miepy
 from miepy.special_functions import riccati_1,riccati_2,vector_spherical_harmonics
@@ -14,17 +17,48 @@ class cluster:
     """Solve Generalized Mie Theory for an N particle cluster in an arbitray source profile"""
     def __init__(self, *, particles, source, wavelength, lmax,
                  medium=None, origin=None, symmetry=None, interface=None,
-                 interactions=True):
+                 interactions=True, solver=None, tolerance=1e-5, maxiter=1000, fmm_accuracy=1e-4,
+                 cutoff=None, coupling_cutoff=None, lattice_vectors=None, translation=None, lmax_tolerance=1e-4,
+                 tmatrix_workers=None):
         """Arguments:
                particles[N]  list of particle objects
                source        source object specifying the incident E and H functions
                wavelength    wavelength to solve the system at
-               lmax          maximum number of orders to use in angular momentum expansion (int)
+               lmax          maximum number of orders to use in angular momentum expansion (int), or per-particle lmax[N].
+                             With per-particle lmax, the bicgstab and exact solvers solve the reduced system of
+                             2*rmax_i coefficients per particle; the other solvers pad every particle to the largest lmax.
+                             Choose 'auto' to select lmax per particle from its size and the gaps to its neighbors
+                             (see miepy.truncation.auto_lmax), raised until the truncation error is below lmax_tolerance
                medium        (optional) material medium (must be non-absorbing; default=vacuum)
                origin        (optional) system origin around which to compute cluster quantities (default = [0,0,0]). Choose 'auto' to automatically choose origin as center of geometry.
                symmetry      (optional) specify system symmetries (default: no symmetries)
                interface     (optional) include an infinite interface (default: no interface)
                interactions  (optional) If True, include particle interactions (bool, default=True) 
+               solver        (optional) linear solver for the interactions (miepy.solver, default=bicgstab).
+                             miepy.solver.matrix_free avoids storing the aggregate T-matrix;
+                             miepy.solver.exact keeps an LU factorization, reused for new sources;
+                             miepy.solver.fmm evaluates the interactions with a fast multipole method;
+                             miepy.solver.lattice translates each lattice displacement once and applies the
+                             interactions by FFT, for particles on the sites of a (1D, 2D or 3D) lattice
+               tolerance     (optional) tolerance of the residual relative to the source coefficients (default: 1e-5)
+               maxiter       (optional) maximum number of iterations of the iterative solvers (default: 1000)
+               fmm_accuracy  (optional) relative accuracy of the fast multipole translations (default: 1e-4)
+               cutoff        (optional) neglect the interactions of particles farther apart than this distance;
+                             the aggregate T-matrix is then stored block-sparse (default: no cutoff)
+               coupling_cutoff  (optional) neglect the interactions whose estimated coupling |A_ij T_j| is below
+                             this value (default: no cutoff). The estimated dropped coupling is reported
+                             in solve_info.dropped_coupling and should be small compared to 1
+               lattice_vectors  (optional) primitive lattice vectors [D,3] of miepy.solver.lattice
+                             (default: detected from the positions)
+               translation   (optional) kernel of the particle-to-particle translations (miepy.translation_kernel,
+                             default=direct). miepy.translation_kernel.rotation rotates into the pair axis,
+                             translates along it and rotates back; with miepy.solver.matrix_free it avoids
+                             the translation blocks and is faster for larger lmax
+               lmax_tolerance  (optional) accepted truncation error of lmax='auto' (default: 1e-4). The chosen
+                             orders are in particle_lmax and the estimated errors in truncation_error()
+               tmatrix_workers  (optional) number of numerical (e.g. NFM-DS or EBCM) T-matrices of unique particles
+                             computed concurrently (see miepy.tmatrix.compute_many; default: number of CPUs).
+                             Analytic T-matrices (spheres, core-shells) are always computed serially
         """
         self.interface = interface
         if interface is not None:
@@ -36,9 +70,20 @@ class cluster:
         ### system properties
         self.source = source
         self.wavelength = wavelength
-        self.lmax = lmax
-        self.rmax = miepy.vsh.lmax_to_rmax(lmax)
+        self.auto_lmax = isinstance(lmax, str) and lmax == 'auto'
+        self.lmax_tolerance = lmax_tolerance
+        self.tmatrix_workers = tmatrix_workers
         self.interactions = interactions
+        self.solver = miepy.solver.bicgstab if solver is None else solver
+        self.tolerance = tolerance
+        self.maxiter = maxiter
+        self.fmm_accuracy = fmm_accuracy
+        self.cutoff = cutoff
+        self.coupling_cutoff = coupling_cutoff
+        self.lattice_vectors = lattice_vectors
+        self.translation = miepy.translation_kernel.direct if translation is None else translation
+        if (cutoff is not None or coupling_cutoff is not None) and self.solver != miepy.solver.bicgstab:
+            raise ValueError('interaction cutoffs require the bicgstab solver')
 
         ### set the medium
         if medium is None:
@@ -54,22 +99,9 @@ class cluster:
         self.Nparticles = len(self.particles)
         self.position = np.empty([self.Nparticles,3], dtype=float)
         self.material = np.empty([self.Nparticles], dtype=object)
-        self.tmatrix  = np.empty([self.Nparticles, 2, self.rmax, 2, self.rmax], dtype=complex)
-
-        ### calculate T-matrices 
-        tmatrices = {}
         for i in range(self.Nparticles):
             self.position[i] = self.particles[i].position
             self.material[i] = self.particles[i].material
-            
-            key = self.particles[i]._dict_key(wavelength)
-            if key in tmatrices:
-                self.particles[i].tmatrix_fixed = tmatrices[key]
-                self.particles[i]._rotate_fixed_tmatrix()
-                self.tmatrix[i] = self.particles[i].tmatrix
-            else:
-                self.tmatrix[i]  = self.particles[i].compute_tmatrix(lmax, wavelength, self.medium.eps(wavelength))
-                tmatrices[key] = self.particles[i].tmatrix_fixed
 
         ### set the origin
         self.auto_origin = False    
@@ -84,17 +116,36 @@ class cluster:
         ### build material data of particles
         self.material_data = miepy.material_functions.material_struct(self.material, self.medium, wavelength=self.wavelength)
 
-        ### expansion coefficients
-        self.p_inc  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
-        self.p_scat = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
-        self.p_int  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
-        self.p_src  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        ### expansion orders
+        if self.auto_lmax:
+            radius = [particle.enclosed_radius() for particle in self.particles]
+            lmax = miepy.truncation.auto_lmax(self.position, radius, self.material_data.k_b, tolerance=lmax_tolerance)
+        elif np.ndim(lmax) == 0:
+            lmax = np.full(self.Nparticles, lmax, dtype=int)
+        lmax = np.asarray(lmax, dtype=int)
+        if lmax.shape != (self.Nparticles,):
+            raise ValueError("lmax must be an int, a list of one lmax per particle, or 'auto'")
+
+        ### T-matrices and expansion coefficients
+        self._set_lmax(lmax)
 
         ### cluster expansion coefficients
         self.p_cluster = None
 
+        ### report of the last interactions solve (iterations, residuals, convergence and timings)
+        self.solve_info = None
+
+        ### factorization of the interactions, kept for the exact solver
+        self._factorization = None
+
+        ### aggregate T-matrix, kept to update only the particles that move or rotate
+        self._agg_tmatrix = None
+        self._changed = np.zeros(self.Nparticles, dtype=bool)
+
         ### solve the interactions
         self.solve()
+        if self.auto_lmax:
+            self._refine_lmax()
 
     def __repr__(self):
         return f'''{self.__class__.__name__}:
@@ -121,13 +172,13 @@ class cluster:
         """
         rad, theta, phi = miepy.coordinates.cart_to_sph(x, y, z, origin=self.position[i])
 
-        E_sph = miepy.expand_E(self.p_scat[i], self.material_data.k_b,
+        E_sph = miepy.expand_E(self._particle_coefficients(self.p_scat, i), self.material_data.k_b,
                      mode=miepy.vsh_mode.outgoing)(rad,theta,phi)
         Escat = miepy.coordinates.vec_sph_to_cart(E_sph, theta, phi)
 
-        p = self.p_inc[i]
+        p = self._particle_coefficients(self.p_inc, i)
         if not source:
-            p -= self.p_src[i]
+            p = p - self._particle_coefficients(self.p_src, i)
         E_sph = miepy.expand_E(p, self.material_data.k_b,
                      mode=miepy.vsh_mode.incident)(rad,theta,phi)
         Einc = miepy.coordinates.vec_sph_to_cart(E_sph, theta, phi)
@@ -148,14 +199,14 @@ class cluster:
         """
         rad, theta, phi = miepy.coordinates.cart_to_sph(x, y, z, origin=self.position[i])
 
-        H_sph = miepy.expand_H(self.p_scat[i], self.material_data.k_b,
+        H_sph = miepy.expand_H(self._particle_coefficients(self.p_scat, i), self.material_data.k_b,
                   mode=miepy.vsh_mode.outgoing, eps=self.material_data.eps_b,
                   mu=self.material_data.mu_b)(rad,theta,phi)
         Hscat = miepy.coordinates.vec_sph_to_cart(H_sph, theta, phi)
 
-        p = self.p_inc[i]
+        p = self._particle_coefficients(self.p_inc, i)
         if not source:
-            p -= self.p_src[i]
+            p = p - self._particle_coefficients(self.p_src, i)
 
         H_sph = miepy.expand_H(p, self.material_data.k_b,
                   mode=miepy.vsh_mode.incident, eps=self.material_data.eps_b,
@@ -226,7 +277,7 @@ class cluster:
 
         for i in range(self.Nparticles):
             rad, theta, phi = miepy.coordinates.cart_to_sph(x, y, z, origin=self.position[i])
-            E_sph = expand(self.p_scat[i], self.material_data.k_b)(rad,theta,phi)
+            E_sph = expand(self._particle_coefficients(self.p_scat, i), self.material_data.k_b)(rad,theta,phi)
             E += miepy.coordinates.vec_sph_to_cart(E_sph, theta, phi)
 
         if source:
@@ -240,7 +291,7 @@ class cluster:
                 k_int = 2*np.pi*self.material_data.n[i]/self.wavelength
 
                 rad, theta, phi = miepy.coordinates.cart_to_sph(x, y, z, origin=self.position[i])
-                E_sph = miepy.expand_E(self.p_int[i], k_int, 
+                E_sph = miepy.expand_E(self._particle_coefficients(self.p_int, i), k_int, 
                                 mode=miepy.vsh_mode.interior)(rad[idx], theta[idx], phi[idx])
                 E[:,idx] = miepy.coordinates.vec_sph_to_cart(E_sph, theta[idx], phi[idx])
 
@@ -287,7 +338,7 @@ class cluster:
 
         for i in range(self.Nparticles):
             rad, theta, phi = miepy.coordinates.cart_to_sph(x, y, z, origin=self.position[i])
-            H_sph = expand(self.p_scat[i], self.material_data.k_b, eps=self.material_data.eps_b,
+            H_sph = expand(self._particle_coefficients(self.p_scat, i), self.material_data.k_b, eps=self.material_data.eps_b,
                                mu=self.material_data.mu_b)(rad,theta,phi)
             H += miepy.coordinates.vec_sph_to_cart(H_sph, theta, phi)
 
@@ -302,7 +353,7 @@ class cluster:
                 k_int = 2*np.pi*self.material_data.n[i]/self.wavelength
 
                 rad, theta, phi = miepy.coordinates.cart_to_sph(x, y, z, origin=self.position[i])
-                H_sph = miepy.expand_H(self.p_int[i], k_int, 
+                H_sph = miepy.expand_H(self._particle_coefficients(self.p_int, i), k_int, 
                             eps=self.material_data.eps[i], mu=self.material_data.mu[i],
                             mode=miepy.vsh_mode.interior)(rad[idx], theta[idx], phi[idx])
                 H[:,idx] = miepy.coordinates.vec_sph_to_cart(H_sph, theta[idx], phi[idx])
@@ -521,33 +572,50 @@ class cluster:
         return scope.image(x, y, z_val=z, magnify=magnify)
 
     def update(self, position=None, orientation=None):
-        """Update properties of the particles
+        """Update properties of the particles. Only the interactions of the particles that moved or rotated,
+           and the source coefficients of the particles that moved, are recomputed
 
             Arguments
                 position[N,3]     new particle positions
                 orientation[N]    new particle orientations (array of quaternions)
         """
+        if position is None and orientation is None:
+            self._reset_cluster_coefficients()
+            self.solve()
+            return
+
+        moved = np.zeros(self.Nparticles, dtype=bool)
+        rotated = np.zeros(self.Nparticles, dtype=bool)
 
         if position is not None:
-            self.position = np.asarray(np.atleast_2d(position), dtype=float)
+            position = np.asarray(np.atleast_2d(position), dtype=float)
+            moved = np.any(position != self.position, axis=1)
+            self.position = position
 
             if self.auto_origin:
                 self.origin = np.average(self.position, axis=0)
 
         if orientation is not None:
             for i in range(self.Nparticles):
-                self.particles[i].orientation = orientation[i]
-                self.tmatrix[i] = self.particles[i].tmatrix
+                if orientation[i] != self.particles[i].orientation:
+                    self.particles[i]._orientation = orientation[i]
+                    # the T-matrices of spherical particles are invariant under rotations
+                    rotated[i] = not self.particles[i]._analytic_tmatrix
+            self._rotate_tmatrices(rotated)
+
+        self._changed |= moved | rotated
+        if np.any(moved | rotated):
+            self._factorization = None
 
         self._reset_cluster_coefficients()
 
-        if position is not None or orientation is None:
-            self.solve()
-        elif position is None and orientation is not None:
-            if self.interactions:
-                self._solve_interactions()
-            else:
-                self._solve_without_interactions()
+        if np.any(moved):
+            self.p_src[moved] = self._source_decomposition(self.source, moved)
+
+        if self.interactions:
+            self._solve_interactions()
+        else:
+            self._solve_without_interactions()
 
     def solve_cluster_coefficients(self, lmax=None):
         """Solve for the p,q coefficients of the entire cluster around the origin
@@ -569,25 +637,352 @@ class cluster:
                wavelength   wavelength to solve at (default: current wavelength)
                source       source to use (default: current source). If current source is also None, solve the particle's T-matrix instead
         """
+        if source is not None:
+            self.source = source
+
+        new_wavelength = wavelength is not None and wavelength != self.wavelength
+        if new_wavelength:
+            self._set_wavelength(wavelength)
+
         self._solve_source_decomposition()
         if self.interactions:
             self._solve_interactions()
         else:
             self._solve_without_interactions()
 
+        if new_wavelength and self.auto_lmax:
+            self._refine_lmax()
+
+    def spectrum(self, wavelengths, quantities=('cross_sections',)):
+        """Solve the cluster at every wavelength and evaluate quantities (see miepy.sweep.spectrum)
+
+           Arguments:
+               wavelengths[W]   wavelengths to solve at
+               quantities       names of cluster methods without arguments (e.g. 'cross_sections', 'force', 'torque'),
+                                or a dict of {name: function(cluster)} (default: ('cross_sections',))
+
+           Returns:
+               dict of {name: quantity at every wavelength}
+        """
+        return miepy.sweep.spectrum(self, wavelengths, quantities=quantities)
+
+    def adaptive_spectrum(self, wavelength_min, wavelength_max, quantity='cross_sections', tolerance=1e-3,
+                          max_samples=100):
+        """Solve the cluster at adaptively chosen wavelengths and fit a rational interpolant of a quantity
+           (see miepy.sweep.adaptive_spectrum)
+
+           Arguments:
+               wavelength_min   shortest wavelength
+               wavelength_max   longest wavelength
+               quantity         name of a cluster method without arguments, or a function(cluster)
+                                (default: 'cross_sections')
+               tolerance        relative accuracy of the interpolant (default: 1e-3)
+               max_samples      largest number of samples (default: 100)
+
+           Returns:
+               (wavelengths, values, interpolant)
+        """
+        return miepy.sweep.adaptive_spectrum(self, wavelength_min, wavelength_max, quantity=quantity,
+                                             tolerance=tolerance, max_samples=max_samples)
+
+    def solve_sources(self, sources):
+        """Solve the cluster for several sources at once. The interactions are built a single time
+           and the right-hand sides of all sources are solved together
+
+           Arguments:
+               sources     list of sources
+
+           Returns:
+               list of clusters, one per source, each with its own p_src, p_inc and p_scat
+               (the particles and T-matrices are shared with this cluster)
+        """
+        sources = list(sources)
+        p_src = np.array([self._source_decomposition(source) for source in sources])
+
+        if self.interactions:
+            p_inc, info = self._solve_interaction_equations(p_src)
+        else:
+            p_inc, info = np.copy(p_src), None
+
+        solutions = []
+        for i, source in enumerate(sources):
+            solution = copy.copy(self)
+            solution.source = source
+            solution.p_src = p_src[i]
+            solution.p_inc = p_inc[i]
+            solution.p_scat = np.zeros_like(self.p_scat)
+            solution.p_int = np.zeros_like(self.p_int)
+            solution.solve_info = info
+            solution._reset_cluster_coefficients()
+            solution._solve_scattering_coefficients()
+            solutions.append(solution)
+
+        return solutions
+
+    def _set_wavelength(self, wavelength):
+        """Set the wavelength, recomputing the material data and the T-matrices. The incident coefficients
+           at the previous wavelength are kept to warm start the next solve"""
+        if (self.medium.eps(wavelength).imag != 0) or (self.medium.mu(wavelength).imag != 0):
+            raise ValueError('medium must be non-absorbing')
+
+        p_inc, solve_info = self.p_inc, self.solve_info
+        self.wavelength = wavelength
+        self.material_data.wavelength = wavelength
+        self._set_lmax(self.particle_lmax)
+
+        self.p_inc[...] = p_inc
+        self.solve_info = solve_info
+
     def _reset_cluster_coefficients(self):
         self.p_cluster = None
 
+    def _ragged(self):
+        """True if the particles have different lmax"""
+        return np.any(self.particle_lmax != self.lmax)
+
+    def truncation_error(self):
+        """Estimate the truncation error of every particle, the larger of the relative amplitude of the highest
+           order of its scattering coefficients and the convergence of the near fields of its neighbors
+           (see miepy.truncation.truncation_error and miepy.truncation.proximity_error)
+
+           Returns: error[N]
+        """
+        radius = [particle.enclosed_radius() for particle in self.particles]
+        return np.maximum(miepy.truncation.truncation_error(self.p_scat, self.particle_lmax),
+                          miepy.truncation.proximity_error(self.position, radius, self.particle_lmax))
+
+    def _set_lmax(self, lmax, keep=None):
+        """Set the per-particle lmax, computing the T-matrices and resetting the expansion coefficients
+
+           Arguments:
+               lmax[N]   maximum number of multipoles of each particle
+               keep[N]   (optional) boolean mask of the particles whose lmax is unchanged; their T-matrices are
+                         reduced from the current ones rather than recomputed
+        """
+        if keep is None:
+            keep = np.zeros(self.Nparticles, dtype=bool)
+
+        previous = self.tmatrix if np.any(keep) else None
+        self.particle_lmax = np.asarray(lmax, dtype=int)
+        self.lmax = int(np.max(self.particle_lmax))
+        self.rmax = miepy.vsh.lmax_to_rmax(self.lmax)
+        self.tmatrix = np.empty([self.Nparticles, 2, self.rmax, 2, self.rmax], dtype=complex)
+
+        for i in np.flatnonzero(keep):
+            self._set_tmatrix(i, miepy.tmatrix.tmatrix_reduce_lmax(previous[i], self.particle_lmax[i]))
+
+        # the T-matrices of the unique particles are computed (numerical ones concurrently), the rest are reused
+        unique = {}
+        for i in np.flatnonzero(~keep):
+            key = (self.particles[i]._dict_key(self.wavelength), self.particle_lmax[i])
+            unique.setdefault(key, i)
+
+        eps_m = self.medium.eps(self.wavelength)
+        first = list(unique.values())
+        numerical = [i for i in first if not self.particles[i]._analytic_tmatrix]
+        for i in first:
+            if self.particles[i]._analytic_tmatrix:
+                self._set_tmatrix(i, self.particles[i].compute_tmatrix(self.particle_lmax[i], self.wavelength, eps_m))
+
+        requests = [partial(self.particles[i].compute_tmatrix, self.particle_lmax[i], self.wavelength, eps_m)
+                    for i in numerical]
+        for i, tmatrix in zip(numerical, miepy.tmatrix.compute_many(requests, workers=self.tmatrix_workers)):
+            self._set_tmatrix(i, tmatrix)
+
+        reused = ~keep
+        reused[first] = False
+        for i in np.nonzero(reused)[0]:
+            key = (self.particles[i]._dict_key(self.wavelength), self.particle_lmax[i])
+            self.particles[i].tmatrix_fixed = self.particles[unique[key]].tmatrix_fixed
+        self._rotate_tmatrices(reused)
+
+        self.p_inc  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_scat = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_int  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_src  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_cluster = None
+        self.solve_info = None
+        self._factorization = None
+        self._agg_tmatrix = None
+
+    def _refine_lmax(self, lmax_limit=20):
+        """Raise the lmax of the particles whose truncation error is above lmax_tolerance, until it is not.
+           Only the T-matrices of the particles whose lmax is raised are recomputed"""
+        while True:
+            refine = (self.truncation_error() > self.lmax_tolerance) & (self.particle_lmax < lmax_limit)
+            if not np.any(refine):
+                break
+
+            self._set_lmax(self.particle_lmax + refine, keep=~refine)
+            self.solve()
+
+    def _rotate_tmatrices(self, particles):
+        """Rotate the fixed T-matrices of the particles (boolean mask) to their orientations in a single
+           batched call. Particles that share a fixed T-matrix and an orientation are rotated once"""
+        groups = {}
+        for i in np.flatnonzero(particles):
+            particle = self.particles[i]
+            if type(particle)._rotate_fixed_tmatrix is not miepy.particles.particle._rotate_fixed_tmatrix:
+                particle._rotate_fixed_tmatrix()
+                self._set_tmatrix(i, particle.tmatrix)
+                continue
+
+            key = (id(particle.tmatrix_fixed), tuple(miepy.quaternion.as_float_array(particle.orientation)))
+            groups.setdefault(key, []).append(i)
+
+        by_rmax = {}
+        for key, indices in groups.items():
+            rmax = self.particles[indices[0]].tmatrix_fixed.shape[-1]
+            by_rmax.setdefault(rmax, []).append(indices)
+
+        for rmax, group_indices in by_rmax.items():
+            fixed = np.array([self.particles[indices[0]].tmatrix_fixed for indices in group_indices])
+            quat = [self.particles[indices[0]].orientation for indices in group_indices]
+            rotated = miepy.tmatrix.rotate_tmatrices(fixed, quat)
+
+            for tmatrix, indices in zip(rotated, group_indices):
+                for i in indices:
+                    self.particles[i].tmatrix = tmatrix
+                    self._set_tmatrix(i, tmatrix)
+
+    def _set_tmatrix(self, i, tmatrix):
+        """Set the T-matrix of particle i, padded with zeros to self.rmax"""
+        rmax = tmatrix.shape[-1]
+        self.tmatrix[i] = 0
+        self.tmatrix[i,:,:rmax,:,:rmax] = tmatrix
+
+    def _particle_coefficients(self, p, i):
+        """The expansion coefficients p[2,rmax_i] of particle i, without the padding"""
+        return p[i,:,:miepy.vsh.lmax_to_rmax(self.particle_lmax[i])]
+
+    def _source_decomposition(self, source, particles=None):
+        """source coefficients p_src[N,2,rmax] of the particles (a boolean mask; default: all particles)"""
+        if particles is None:
+            particles = np.ones(self.Nparticles, dtype=bool)
+        position = self.position[particles]
+        particle_lmax = self.particle_lmax[particles]
+
+        if not self._ragged():
+            return source.structure(position, self.material_data.k_b, self.lmax)
+
+        # decompose the source once per distinct lmax, the largest first
+        p_src = np.zeros([len(position), 2, self.rmax], dtype=complex)
+        for lmax in sorted(set(particle_lmax), reverse=True):
+            idx = particle_lmax == lmax
+            rmax = miepy.vsh.lmax_to_rmax(lmax)
+            p_src[idx,:,:rmax] = source.structure(position[idx], self.material_data.k_b, lmax)
+
+        return p_src
+
     def _solve_source_decomposition(self):
-        self.p_src[...] = self.source.structure(self.position, self.material_data.k_b, self.lmax)
+        self.p_src[...] = self._source_decomposition(self.source)
 
     def _solve_without_interactions(self):
         self.p_inc[...] = self.p_src
-        self.p_scat[...] = np.einsum('naibj,nbj->nai', self.tmatrix, self.p_inc)
+        self._solve_scattering_coefficients()
 
     def _solve_interactions(self):
-        agg_tmatrix = miepy.interactions.particle_aggregate_tmatrix(self.position, self.tmatrix,
-                                  self.material_data.k_b)
-        self.p_inc[...] = miepy.interactions.solve_linear_system(agg_tmatrix, self.p_src, method=miepy.solver.bicgstab)
-
+        # warm start the iterative solver from the previous solution, if there is one
+        x0 = None if self.solve_info is None else self.p_inc
+
+        self.p_inc[...], self.solve_info = self._solve_interaction_equations(self.p_src, x0=x0)
+        self._solve_scattering_coefficients()
+
+    def _solve_interaction_equations(self, p_src, x0=None):
+        start = time.perf_counter()
+        build_time = 0
+        build_stats = None
+        ragged = self._ragged()
+        dense = self.cutoff is None and self.coupling_cutoff is None and self.solver in (miepy.solver.bicgstab,
+                miepy.solver.exact)
+
+        if ragged and dense:
+            # solve the reduced system in the ragged layout, with 2*rmax_i coefficients per particle
+            lmax = self.particle_lmax
+            if self.solver == miepy.solver.exact and self._factorization is not None:
+                agg_tmatrix = None
+            else:
+                agg_tmatrix, build_stats = self._build_aggregate_tmatrix()
+                build_time = time.perf_counter() - start
+
+            if self.solver == miepy.solver.exact:
+                if self._factorization is None:
+                    self._factorization = miepy.interactions.interaction_factorization(agg_tmatrix)
+                    build_time = time.perf_counter() - start
+                p_inc, info = miepy.interactions.solve_factorized(self._factorization,
+                                          miepy.interactions.to_ragged(p_src, lmax))
+            else:
+                p_inc, info = miepy.interactions.solve_linear_system(agg_tmatrix,
+                                          miepy.interactions.to_ragged(p_src, lmax), method=self.solver,
+                                          x0=None if x0 is None else miepy.interactions.to_ragged(x0, lmax),
+                                          maxiter=self.maxiter, tolerance=self.tolerance)
+            p_inc = miepy.interactions.from_ragged(p_inc, lmax, self.rmax)
+        elif self.solver == miepy.solver.matrix_free:
+            p_inc, info = miepy.interactions.particle_matrix_free_solve(self.position,
+                                      self.tmatrix, self.material_data.k_b, p_src, x0=x0,
+                                      maxiter=self.maxiter, tolerance=self.tolerance, kernel=self.translation)
+        elif self.solver == miepy.solver.fmm:
+            p_inc, info = miepy.interactions.particle_fmm_solve(self.position,
+                                      self.tmatrix, self.material_data.k_b, p_src, x0=x0, accuracy=self.fmm_accuracy,
+                                      maxiter=self.maxiter, tolerance=self.tolerance)
+        elif self.solver == miepy.solver.lattice:
+            sites, lattice_vectors = miepy.interactions.lattice_sites(self.position, self.lattice_vectors)
+            p_inc, info = miepy.interactions.particle_lattice_solve(sites, lattice_vectors,
+                                      self.tmatrix, self.material_data.k_b, p_src, x0=x0,
+                                      maxiter=self.maxiter, tolerance=self.tolerance)
+        elif self.solver == miepy.solver.exact:
+            # the factorization is kept until the particles change, so a new source only needs back-substitution
+            if self._factorization is None:
+                agg_tmatrix, build_stats = self._build_aggregate_tmatrix()
+                self._factorization = miepy.interactions.interaction_factorization(agg_tmatrix)
+                build_time = time.perf_counter() - start
+
+            p_inc, info = miepy.interactions.solve_factorized(self._factorization, p_src)
+        elif self.cutoff is not None or self.coupling_cutoff is not None:
+            agg_tmatrix = miepy.interactions.particle_sparse_aggregate_tmatrix(self.position, self.tmatrix,
+                                      self.material_data.k_b, cutoff=self.cutoff, coupling_cutoff=self.coupling_cutoff,
+                                      kernel=self.translation)
+            build_time = time.perf_counter() - start
+            p_inc, info = miepy.interactions.solve_sparse_linear_system(agg_tmatrix, p_src,
+                                      x0=x0, maxiter=self.maxiter, tolerance=self.tolerance)
+        else:
+            agg_tmatrix, build_stats = self._build_aggregate_tmatrix()
+            build_time = time.perf_counter() - start
+            p_inc, info = miepy.interactions.solve_linear_system(agg_tmatrix, p_src,
+                                      method=self.solver, x0=x0, maxiter=self.maxiter, tolerance=self.tolerance)
+
+        if ragged and not dense:
+            # the padded modes of the other solvers are not part of the expansion of the particles
+            for i, lmax in enumerate(self.particle_lmax):
+                p_inc[...,i,:,miepy.vsh.lmax_to_rmax(lmax):] = 0
+
+        info.build_time = build_time
+        info.solve_time = time.perf_counter() - start - build_time
+        if build_stats is not None:
+            info.translation_hit_rate = build_stats.hit_rate
+
+        if not info.converged:
+            warnings.warn('interactions solve did not converge in {} iterations (relative residual {:.2e})'.format(
+                          info.iterations, info.residual), RuntimeWarning)
+
+        return p_inc, info
+
+    def _build_aggregate_tmatrix(self):
+        # the aggregate T-matrix of the interactions (in the ragged layout with per-particle lmax) and its
+        # build statistics (None if nothing changed). It is kept, and only the blocks of the particles
+        # that moved or rotated since are recomputed
+        lmax = self.particle_lmax if self._ragged() else None
+        build_stats = None
+
+        if self._agg_tmatrix is None:
+            self._agg_tmatrix, build_stats = miepy.interactions.particle_aggregate_tmatrix(self.position, self.tmatrix,
+                                      self.material_data.k_b, return_stats=True, kernel=self.translation, lmax=lmax)
+        elif np.any(self._changed):
+            build_stats = miepy.interactions.particle_update_aggregate_tmatrix(self._agg_tmatrix, self.position,
+                                      self.tmatrix, self.material_data.k_b, self._changed, kernel=self.translation, lmax=lmax)
+        self._changed[...] = False
+
+        return self._agg_tmatrix, build_stats
+
+    def _solve_scattering_coefficients(self):
         self.p_scat[...] = np.einsum('naibj,nbj->nai', self.tmatrix, self.p_inc)
@@ -0,0 +1,151 @@
+"""
+Dynamics of optically bound particles: overdamped Langevin (Brownian) dynamics driven by the optical forces and torques
+"""
+
+import numpy as np
+from scipy import constants
+import miepy
+
+def stokes_drag(radius, viscosity=8.9e-4):
+    """Translational and rotational Stokes drag coefficients of spheres
+       Returns (drag[N], rotational_drag[N])
+
+       Arguments:
+           radius[N]     sphere radii
+           viscosity     fluid viscosity (Pa s) (default: water, 8.9e-4)
+    """
+    radius = np.asarray(radius, dtype=float)
+    return 6*np.pi*viscosity*radius, 8*np.pi*viscosity*radius**3
+
+def trajectory_dtype(Nparticles):
+    """The numpy structured dtype of one step of a trajectory of N particles, with the fields
+       time, position[N,3], orientation[N,4] (quaternion components w,x,y,z), force[N,3] and torque[N,3]
+
+       Arguments:
+           Nparticles    number of particles
+    """
+    return np.dtype([('time', float),
+                     ('position', float, (Nparticles, 3)),
+                     ('orientation', float, (Nparticles, 4)),
+                     ('force', float, (Nparticles, 3)),
+                     ('torque', float, (Nparticles, 3))])
+
+def _trajectory_output(output, steps, Nparticles):
+    """the array that the trajectory is written to (see langevin)"""
+    dtype = trajectory_dtype(Nparticles)
+
+    if output is None:
+        return np.zeros(steps + 1, dtype=dtype)
+    elif isinstance(output, np.ndarray):
+        if output.dtype != dtype or output.shape[0] < steps + 1:
+            raise ValueError('output must be an array of trajectory_dtype({}) with at least {} steps'.format(
+                             Nparticles, steps + 1))
+        return output
+    else:
+        return np.lib.format.open_memmap(output, mode='w+', dtype=dtype, shape=(steps + 1,))
+
+def langevin(cluster, dt, steps, temperature=300, drag=None, rotational_drag=None, viscosity=8.9e-4,
+             rotation=None, adaptive=False, max_displacement=None, max_rotation=0.05, output=None,
+             seed=None, flush_every=100):
+    """Overdamped Langevin dynamics of the particles of a cluster driven by the optical forces and torques.
+       The cluster is updated in place every step, reusing its T-matrices and warm-starting its
+       interactions solve from the previous step
+       Returns trajectory[steps+1] (structured array of trajectory_dtype(N), memory-mapped if output is a filename)
+
+       Arguments:
+           cluster       miepy.sphere_cluster or miepy.cluster
+           dt            time step (s); the largest time step with adaptive stepping
+           steps         number of time steps
+           temperature   temperature (K) of the thermal noise (default: 300; 0 for deterministic dynamics)
+           drag          translational drag coefficients [N] or scalar (kg/s) (default: Stokes drag of the enclosing spheres)
+           rotational_drag   rotational drag coefficients [N] or scalar (kg m^2/s) (default: Stokes drag of the enclosing spheres)
+           viscosity     fluid viscosity (Pa s) of the default drag coefficients (default: water, 8.9e-4)
+           rotation      if True, integrate the particle orientations (default: True for a miepy.cluster with
+                         non-spherical particles; miepy.sphere_cluster has no orientations)
+           adaptive      if True, shorten the time steps so that no particle drifts farther than max_displacement
+                         or rotates more than max_rotation in one step (default: False)
+           max_displacement   largest drift of a particle in an adaptive step (default: 1% of the smallest radius)
+           max_rotation  largest drift rotation (rad) of a particle in an adaptive step (default: 0.05)
+           output        where to write the trajectory: None (a new array), a preallocated array of
+                         trajectory_dtype(N) with at least steps+1 elements, or a filename of a .npy file
+                         (memory-mapped and flushed every flush_every steps)
+           seed          seed of the thermal noise (default: None)
+           flush_every   number of steps between the flushes of a memory-mapped output (default: 100)
+    """
+    is_sphere_cluster = isinstance(cluster, miepy.sphere_cluster)
+    Nparticles = cluster.Nparticles
+
+    if is_sphere_cluster:
+        radius = cluster.radius
+        if rotation:
+            raise ValueError('the spheres of a miepy.sphere_cluster have no orientation to integrate')
+        rotation = False
+    else:
+        radius = np.array([particle.enclosed_radius() for particle in cluster.particles])
+        if rotation is None:
+            rotation = not all(particle._analytic_tmatrix for particle in cluster.particles)
+
+    stokes, stokes_rotational = stokes_drag(radius, viscosity)
+    drag = stokes if drag is None else np.broadcast_to(np.asarray(drag, dtype=float), (Nparticles,))
+    rotational_drag = stokes_rotational if rotational_drag is None else \
+                      np.broadcast_to(np.asarray(rotational_drag, dtype=float), (Nparticles,))
+
+    if max_displacement is None:
+        max_displacement = 0.01*np.min(radius)
+
+    rng = np.random.default_rng(seed)
+    kT = constants.k*temperature
+    trajectory = _trajectory_output(output, steps, Nparticles)
+    memory_mapped = isinstance(trajectory, np.memmap)
+
+    if is_sphere_cluster:
+        orientation = [miepy.quaternion.one]*Nparticles
+    else:
+        orientation = [particle.orientation for particle in cluster.particles]
+
+    time = 0
+    for step in range(steps + 1):
+        F = cluster.force()
+        T = cluster.torque()
+
+        record = trajectory[step]
+        record['time'] = time
+        record['position'] = cluster.position
+        record['orientation'] = miepy.quaternion.as_float_array(orientation)
+        record['force'] = F
+        record['torque'] = T
+
+        if memory_mapped and (step % flush_every == 0 or step == steps):
+            trajectory.flush()
+
+        if step == steps:
+            break
+
+        h = dt
+        if adaptive:
+            drift = np.max(np.linalg.norm(F, axis=1)/drag)
+            if drift*h > max_displacement:
+                h = max_displacement/drift
+
+            if rotation:
+                spin = np.max(np.linalg.norm(T, axis=1)/rotational_drag)
+                if spin*h > max_rotation:
+                    h = max_rotation/spin
+
+        noise = np.sqrt(2*kT*h/drag)[:,np.newaxis]*rng.standard_normal((Nparticles, 3))
+        position = cluster.position + F/drag[:,np.newaxis]*h + noise
+
+        if rotation:
+            noise = np.sqrt(2*kT*h/rotational_drag)[:,np.newaxis]*rng.standard_normal((Nparticles, 3))
+            angle = T/rotational_drag[:,np.newaxis]*h + noise
+            orientation = [miepy.quaternion.from_rotation_vector(angle[i])*orientation[i]
+                           for i in range(Nparticles)]
+            cluster.update(position=position, orientation=orientation)
+        elif is_sphere_cluster:
+            cluster.update_position(position)
+        else:
+            cluster.update(position=position)
+
+        time += h
+
+    return trajectory
@@ -4,22 +4,388 @@ functions for building interaction matrices and solving them
 
 import numpy as np
 import miepy
+from scipy.sparse import bsr_matrix
+from scipy.spatial import cKDTree
 from scipy.sparse.linalg import bicgstab
 from miepy.cpp.vsh_translation import vsh_translation_numpy as vsh_translation
+from miepy.cpp.vsh_translation import translation_kernel
 
-def solve_linear_system(tmatrix, p_src, method):
+def solve_linear_system(tmatrix, p_src, method, x0=None, maxiter=1000, tolerance=1e-5):
     """Solve the linear system p_inc = p_src - tmatrix*p_inc
         size
        Arguments:
-           tmatrix[N,2,rmax,N,2,rmax]   particle aggregate tmatrix
-           p_src[N,2,rmax]   source scattering coefficients
-           method    solver method ('exact', 'bicgstab')
+           tmatrix[N,2,rmax,N,2,rmax]   particle aggregate tmatrix (or tmatrix[size,size] in the ragged layout, see ragged_offsets)
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together;
+                                 p_src[...,size] in the ragged layout)
+           method    solver method (miepy.solver)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    size = np.prod(tmatrix.shape[:tmatrix.ndim//2])
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.solve_linear_system(tmatrix.reshape(size, size), p_src.reshape(-1, size),
+                        x0=x0.reshape(-1, size), method=method, maxiter=maxiter, tolerance=tolerance)
+
+    return p_inc.reshape(p_src.shape), info
+
+def interaction_factorization(tmatrix):
+    """LU factorize the interaction matrix (I + tmatrix) for repeated direct solves
+
+       Arguments:
+           tmatrix[N,2,rmax,N,2,rmax]   particle aggregate tmatrix (or tmatrix[size,size] in the ragged layout)
+
+       Returns:
+           factorization (see solve_factorized)
+    """
+    size = np.prod(tmatrix.shape[:tmatrix.ndim//2])
+
+    return miepy.cpp.interactions.interaction_factorization(tmatrix.reshape(size, size))
+
+def solve_factorized(factorization, p_src):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc by back-substitution
+
+       Arguments:
+           factorization         factorization of the interaction matrix (see interaction_factorization)
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources;
+                                 p_src[...,size] in the ragged layout)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    size = factorization.size
+    p_inc, info = factorization.solve(p_src.reshape(-1, size))
+
+    return p_inc.reshape(p_src.shape), info
+
+def sphere_sparse_aggregate_tmatrix(positions, mie, k, cutoff=None, coupling_cutoff=None,
+                                    kernel=translation_kernel.direct):
+    """Obtain the particle-centered aggregate T-matrix for a cluster of spheres in block-sparse form,
+       keeping only the interactions within the cutoffs
+       Returns a miepy.cpp.interactions.sparse_interaction_matrix (see to_bsr_matrix)
+
+       Arguments:
+           positions[N,3]      particles positions
+           mie[N,2,lmax]       mie scattering coefficients
+           k                   medium wavenumber
+           cutoff              neglect the interactions of particles farther apart than cutoff (default: no cutoff)
+           coupling_cutoff     neglect the interactions whose estimated coupling |A_ij T_j| is below coupling_cutoff (default: no cutoff)
+           kernel              translation kernel (miepy.translation_kernel, default: direct)
+    """
+    Nparticles = positions.shape[0]
+    cutoff = np.inf if cutoff is None else cutoff
+    coupling_cutoff = 0 if coupling_cutoff is None else coupling_cutoff
+
+    return miepy.cpp.interactions.sphere_sparse_aggregate_tmatrix(positions, mie.reshape([Nparticles,-1]), k,
+                        cutoff=cutoff, coupling_cutoff=coupling_cutoff, kernel=kernel)
+
+def particle_sparse_aggregate_tmatrix(positions, tmatrix, k, cutoff=None, coupling_cutoff=None,
+                                      kernel=translation_kernel.direct):
+    """Obtain the particle-centered aggregate T-matrix for a cluster of particles in block-sparse form,
+       keeping only the interactions within the cutoffs
+       Returns a miepy.cpp.interactions.sparse_interaction_matrix (see to_bsr_matrix)
+
+       Arguments:
+           positions[N,3]      particles positions
+           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices
+           k                   medium wavenumber
+           cutoff              neglect the interactions of particles farther apart than cutoff (default: no cutoff)
+           coupling_cutoff     neglect the interactions whose estimated coupling |A_ij T_j| is below coupling_cutoff (default: no cutoff)
+           kernel              translation kernel (miepy.translation_kernel, default: direct)
+    """
+    Nparticles = positions.shape[0]
+    cutoff = np.inf if cutoff is None else cutoff
+    coupling_cutoff = 0 if coupling_cutoff is None else coupling_cutoff
+
+    return miepy.cpp.interactions.particle_sparse_aggregate_tmatrix(positions, tmatrix.reshape([Nparticles,-1]), k,
+                        cutoff=cutoff, coupling_cutoff=coupling_cutoff, kernel=kernel)
+
+def solve_sparse_linear_system(tmatrix, p_src, x0=None, maxiter=1000, tolerance=1e-5):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc with a block-sparse aggregate T-matrix
+
+       Arguments:
+           tmatrix               block-sparse aggregate tmatrix (see sphere_sparse_aggregate_tmatrix)
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
     """
-    Nparticles = tmatrix.shape[0]
+    size = np.prod(p_src.shape[-3:])
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.solve_sparse_linear_system(tmatrix, p_src.reshape(-1, size),
+                        x0=x0.reshape(-1, size), maxiter=maxiter, tolerance=tolerance)
+
+    return p_inc.reshape(p_src.shape), info
+
+def to_bsr_matrix(tmatrix):
+    """Convert a block-sparse aggregate T-matrix to a scipy.sparse.bsr_matrix of shape [N*2*rmax, N*2*rmax]
+
+       Arguments:
+           tmatrix      block-sparse aggregate tmatrix (see sphere_sparse_aggregate_tmatrix)
+    """
+    block_size = tmatrix.block_size
+    size = (len(tmatrix.indptr) - 1)*block_size
+    blocks = tmatrix.blocks.reshape([-1, block_size, block_size])
+
+    return bsr_matrix((blocks, tmatrix.indices, tmatrix.indptr), shape=(size, size))
+
+def sphere_matrix_free_solve(positions, mie, k, p_src, x0=None, maxiter=1000, tolerance=1e-5,
+                             kernel=translation_kernel.direct):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc for a cluster of spheres
+       without storing the aggregate T-matrix. Translation blocks are computed on the fly
+       every iteration of the iterative solver; with translation_kernel.rotation the
+       translations are applied as rotation, axial translation and rotation, without the blocks.
+
+       Arguments:
+           positions[N,3]      particles positions
+           mie[N,2,lmax]       mie scattering coefficients
+           k                   medium wavenumber
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+           kernel                translation kernel (miepy.translation_kernel, default: direct)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    Nparticles = positions.shape[0]
     rmax = p_src.shape[-1]
     size = Nparticles*2*rmax
 
-    return miepy.cpp.interactions.solve_linear_system(tmatrix.reshape(size, size), p_src.reshape(-1), method=method).reshape([Nparticles,2,rmax])
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.sphere_matrix_free_solve(positions, mie.reshape([Nparticles,-1]),
+                        k, p_src.reshape(-1, size), x0.reshape(-1, size), maxiter=maxiter, tolerance=tolerance,
+                        kernel=kernel)
+
+    return p_inc.reshape(p_src.shape), info
+
+def particle_matrix_free_solve(positions, tmatrix, k, p_src, x0=None, maxiter=1000, tolerance=1e-5,
+                               kernel=translation_kernel.direct):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc for a cluster of particles
+       without storing the aggregate T-matrix. Translation blocks are computed on the fly
+       every iteration of the iterative solver; with translation_kernel.rotation the
+       translations are applied as rotation, axial translation and rotation, without the blocks.
+
+       Arguments:
+           positions[N,3]      particles positions
+           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices
+           k                   medium wavenumber
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+           kernel                translation kernel (miepy.translation_kernel, default: direct)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    Nparticles = positions.shape[0]
+    rmax = p_src.shape[-1]
+    size = Nparticles*2*rmax
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.particle_matrix_free_solve(positions, tmatrix.reshape([Nparticles,-1]),
+                        k, p_src.reshape(-1, size), x0.reshape(-1, size), maxiter=maxiter, tolerance=tolerance,
+                        kernel=kernel)
+
+    return p_inc.reshape(p_src.shape), info
+
+def sphere_fmm_solve(positions, mie, k, p_src, x0=None, accuracy=1e-4, maxiter=1000, tolerance=1e-5):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc for a cluster of spheres
+       with the translations evaluated by a multilevel fast multipole method
+
+       Arguments:
+           positions[N,3]      particles positions
+           mie[N,2,lmax]       mie scattering coefficients
+           k                   medium wavenumber
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           accuracy              relative accuracy of the far-field translations (default: 1e-4)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    Nparticles = positions.shape[0]
+    rmax = p_src.shape[-1]
+    size = Nparticles*2*rmax
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.sphere_fmm_solve(positions, mie.reshape([Nparticles,-1]),
+                        k, p_src.reshape(-1, size), x0.reshape(-1, size), accuracy=accuracy,
+                        maxiter=maxiter, tolerance=tolerance)
+
+    return p_inc.reshape(p_src.shape), info
+
+def particle_fmm_solve(positions, tmatrix, k, p_src, x0=None, accuracy=1e-4, maxiter=1000, tolerance=1e-5):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc for a cluster of particles
+       with the translations evaluated by a multilevel fast multipole method
+
+       Arguments:
+           positions[N,3]      particles positions
+           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices
+           k                   medium wavenumber
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           accuracy              relative accuracy of the far-field translations (default: 1e-4)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    Nparticles = positions.shape[0]
+    rmax = p_src.shape[-1]
+    size = Nparticles*2*rmax
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.particle_fmm_solve(positions, tmatrix.reshape([Nparticles,-1]),
+                        k, p_src.reshape(-1, size), x0.reshape(-1, size), accuracy=accuracy,
+                        maxiter=maxiter, tolerance=tolerance)
+
+    return p_inc.reshape(p_src.shape), info
+
+def lattice_sites(positions, lattice_vectors=None, tolerance=1e-6):
+    """Find the integer lattice coordinates of particles that sit on the sites of a lattice
+       Returns sites[N,D], lattice_vectors[D,3]; raises ValueError if the particles are not on a lattice
+
+       Arguments:
+           positions[N,3]          particles positions
+           lattice_vectors[D,3]    primitive lattice vectors, D <= 3 (default: detected from the positions)
+           tolerance               allowed deviation from the lattice, relative to the shortest lattice vector (default: 1e-6)
+    """
+    positions = np.asarray(positions, dtype=float)
+    Nparticles = positions.shape[0]
+
+    if Nparticles < 2:
+        return np.zeros([Nparticles, 0], dtype=int), np.zeros([0, 3], dtype=float)
+
+    if lattice_vectors is None:
+        lattice_vectors = _detect_lattice_vectors(positions, tolerance)
+    lattice_vectors = np.atleast_2d(np.asarray(lattice_vectors, dtype=float))
+    scale = np.min(np.linalg.norm(lattice_vectors, axis=1))
+
+    displacements = positions - positions[0]
+    coords = np.linalg.lstsq(lattice_vectors.T, displacements.T, rcond=None)[0].T
+    sites = np.rint(coords).astype(int)
+
+    deviation = np.linalg.norm(sites @ lattice_vectors - displacements, axis=1)
+    if np.max(deviation) > tolerance*scale:
+        raise ValueError('the particles are not on a lattice (largest deviation {:.2e} of a lattice constant)'.format(
+                         np.max(deviation)/scale))
+
+    # the FFT grid spans twice the occupied extent in every dimension; refuse sparsely occupied lattices
+    extent = np.ptp(sites, axis=0) + 1
+    if np.prod(2*extent - 1) > 64*Nparticles:
+        raise ValueError('the lattice is too sparsely occupied ({} particles on a grid of {} sites)'.format(
+                         Nparticles, np.prod(extent)))
+
+    return sites, lattice_vectors
+
+def _detect_lattice_vectors(positions, tolerance):
+    """Primitive lattice vectors from the shortest linearly independent displacements between neighbors"""
+    Nparticles = positions.shape[0]
+    neighbors = min(Nparticles, 13)
+    _, idx = cKDTree(positions).query(positions, k=neighbors)
+
+    candidates = (positions[idx[:,1:]] - positions[:,np.newaxis]).reshape([-1,3])
+    lengths = np.linalg.norm(candidates, axis=1)
+    order = np.argsort(lengths)
+    candidates, lengths = candidates[order], lengths[order]
+    scale = lengths[lengths > 0][0]
+
+    basis = []
+    for vector, length in zip(candidates, lengths):
+        if length <= tolerance*scale:
+            continue
+
+        trial = np.array(basis + [vector])/scale
+        if np.linalg.matrix_rank(trial, tol=1e-3) == len(trial):
+            basis.append(vector)
+            if len(basis) == 3:
+                break
+
+    return np.array(basis)
+
+def sphere_lattice_solve(sites, lattice_vectors, mie, k, p_src, x0=None, maxiter=1000, tolerance=1e-5):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc for spheres on the sites of a lattice,
+       with the translations applied as an FFT block-Toeplitz convolution
+
+       Arguments:
+           sites[N,D]          integer lattice coordinates of the particles (see lattice_sites)
+           lattice_vectors[D,3]    primitive lattice vectors
+           mie[N,2,lmax]       mie scattering coefficients
+           k                   medium wavenumber
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    Nparticles = sites.shape[0]
+    rmax = p_src.shape[-1]
+    size = Nparticles*2*rmax
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.sphere_lattice_solve(sites, lattice_vectors, mie.reshape([Nparticles,-1]),
+                        k, p_src.reshape(-1, size), x0.reshape(-1, size), maxiter=maxiter, tolerance=tolerance)
+
+    return p_inc.reshape(p_src.shape), info
+
+def particle_lattice_solve(sites, lattice_vectors, tmatrix, k, p_src, x0=None, maxiter=1000, tolerance=1e-5):
+    """Solve the linear system p_inc = p_src - tmatrix*p_inc for particles on the sites of a lattice,
+       with the translations applied as an FFT block-Toeplitz convolution
+
+       Arguments:
+           sites[N,D]          integer lattice coordinates of the particles (see lattice_sites)
+           lattice_vectors[D,3]    primitive lattice vectors
+           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices
+           k                   medium wavenumber
+           p_src[...,N,2,rmax]   source scattering coefficients (leading dimensions are separate sources, solved together)
+           x0[...,N,2,rmax]      initial guess of the iterative solver (default: p_src)
+           maxiter               maximum number of iterations of the iterative solver (default: 1000)
+           tolerance             tolerance of the residual relative to |p_src| (default: 1e-5)
+
+       Returns:
+           p_inc[...,N,2,rmax], solve_info
+    """
+    Nparticles = sites.shape[0]
+    rmax = p_src.shape[-1]
+    size = Nparticles*2*rmax
+
+    if x0 is None:
+        x0 = p_src
+
+    p_inc, info = miepy.cpp.interactions.particle_lattice_solve(sites, lattice_vectors, tmatrix.reshape([Nparticles,-1]),
+                        k, p_src.reshape(-1, size), x0.reshape(-1, size), maxiter=maxiter, tolerance=tolerance)
+
+    return p_inc.reshape(p_src.shape), info
 
 def interactions_precomputation(positions, k, lmax):
     """Get the relative r,theta,phi positions of the particles and precomputed zn function
@@ -57,19 +423,27 @@ def interactions_precomputation(positions, k, lmax):
 
     return r_ji, theta_ji, phi_ji, zn_values
 
-def sphere_aggregate_tmatrix(positions, mie, k):
+def sphere_aggregate_tmatrix(positions, mie, k, return_stats=False, kernel=translation_kernel.direct):
     """Obtain the particle-centered aggregate T-matrix for a cluster of spheres
-       Returns T[N,2,rmax,N,2,rmax]
+       Returns T[N,2,rmax,N,2,rmax] (and the build statistics, if return_stats is True)
     
        Arguments:
            positions[N,3]      particles positions
            mie[N,2,lmax]       mie scattering coefficients
            k                   medium wavenumber
+           return_stats        if True, also return the build statistics (miepy.cpp.interactions.aggregate_stats)
+           kernel              translation kernel (miepy.translation_kernel, default: direct)
     """
     Nparticles = positions.shape[0]
     lmax = mie.shape[-1]
     rmax = miepy.vsh.lmax_to_rmax(lmax)
-    return miepy.cpp.interactions.sphere_aggregate_tmatrix(positions, mie.reshape([Nparticles,-1]), k).reshape([Nparticles,2,rmax,Nparticles,2,rmax])
+    agg_tmatrix, stats = miepy.cpp.interactions.sphere_aggregate_tmatrix(positions, mie.reshape([Nparticles,-1]), k,
+                                  return_stats=True, kernel=kernel)
+    agg_tmatrix = agg_tmatrix.reshape([Nparticles,2,rmax,Nparticles,2,rmax])
+
+    if return_stats:
+        return agg_tmatrix, stats
+    return agg_tmatrix
 
 
 def sphere_aggregate_tmatrix_periodic(positions, mie, k, symmetry, k_hat):
@@ -111,21 +485,115 @@ def sphere_aggregate_tmatrix_periodic(positions, mie, k, symmetry, k_hat):
     return agg_tmatrix
 
 #TODO this function is more general than above and can be used for both cases (change only the einsum)
-def particle_aggregate_tmatrix(positions, tmatrix, k):
+def particle_aggregate_tmatrix(positions, tmatrix, k, return_stats=False, kernel=translation_kernel.direct,
+                               lmax=None):
     """Obtain the particle-centered aggregate T-matrix for a cluster of particles
-       Returns T[N,2,rmax,N,2,rmax]
+       Returns T[N,2,rmax,N,2,rmax] (and the build statistics, if return_stats is True)
+       With per-particle lmax, returns T[size,size] in the ragged layout (see ragged_offsets)
     
        Arguments:
            positions[N,3]      particles positions
-           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices
+           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices (padded to the largest lmax)
            k                   medium wavenumber
+           return_stats        if True, also return the build statistics (miepy.cpp.interactions.aggregate_stats)
+           kernel              translation kernel (miepy.translation_kernel, default: direct)
+           lmax[N]             per-particle lmax (default: all particles use the lmax of tmatrix)
     """
 
     Nparticles = positions.shape[0]
     rmax = tmatrix.shape[-1]
-    lmax = miepy.vsh.rmax_to_lmax(rmax)
 
-    return miepy.cpp.interactions.particle_aggregate_tmatrix(positions, tmatrix.reshape([Nparticles,-1]), k).reshape([Nparticles,2,rmax,Nparticles,2,rmax])
+    if lmax is not None:
+        agg_tmatrix, stats = miepy.cpp.interactions.particle_ragged_aggregate_tmatrix(positions,
+                                      tmatrix.reshape([Nparticles,-1]), lmax, k, return_stats=True, kernel=kernel)
+    else:
+        agg_tmatrix, stats = miepy.cpp.interactions.particle_aggregate_tmatrix(positions, tmatrix.reshape([Nparticles,-1]), k,
+                                      return_stats=True, kernel=kernel)
+        agg_tmatrix = agg_tmatrix.reshape([Nparticles,2,rmax,Nparticles,2,rmax])
+
+    if return_stats:
+        return agg_tmatrix, stats
+    return agg_tmatrix
+
+def sphere_update_aggregate_tmatrix(agg_tmatrix, positions, mie, k, changed, kernel=translation_kernel.direct):
+    """Recompute, in place, the blocks of the aggregate T-matrix of a cluster of spheres in the rows and
+       columns of the changed spheres; the blocks between unchanged spheres are kept
+       Returns the build statistics of the recomputed pairs (miepy.cpp.interactions.aggregate_stats)
+
+       Arguments:
+           agg_tmatrix[N,2,rmax,N,2,rmax]   aggregate T-matrix (see sphere_aggregate_tmatrix)
+           positions[N,3]      particles positions
+           mie[N,2,lmax]       mie scattering coefficients
+           k                   medium wavenumber
+           changed[N]          True for the spheres that moved since agg_tmatrix was built
+           kernel              translation kernel (miepy.translation_kernel, default: direct)
+    """
+    Nparticles = positions.shape[0]
+    size = np.prod(agg_tmatrix.shape[:agg_tmatrix.ndim//2])
+
+    return miepy.cpp.interactions.sphere_update_aggregate_tmatrix(agg_tmatrix.reshape([size, size]), positions,
+                        mie.reshape([Nparticles,-1]), k, np.flatnonzero(changed), kernel=kernel)
+
+def particle_update_aggregate_tmatrix(agg_tmatrix, positions, tmatrix, k, changed, kernel=translation_kernel.direct,
+                                      lmax=None):
+    """Recompute, in place, the blocks of the aggregate T-matrix of a cluster of particles in the rows and
+       columns of the changed particles; the blocks between unchanged particles are kept
+       Returns the build statistics of the recomputed pairs (miepy.cpp.interactions.aggregate_stats)
+
+       Arguments:
+           agg_tmatrix[N,2,rmax,N,2,rmax]   aggregate T-matrix (see particle_aggregate_tmatrix; tmatrix[size,size]
+                                            in the ragged layout with per-particle lmax)
+           positions[N,3]      particles positions
+           tmatrix[N,2,rmax,2,rmax]   single particle T-matrices (padded to the largest lmax)
+           k                   medium wavenumber
+           changed[N]          True for the particles that moved or rotated since agg_tmatrix was built
+           kernel              translation kernel (miepy.translation_kernel, default: direct)
+           lmax[N]             per-particle lmax (default: all particles use the lmax of tmatrix)
+    """
+    Nparticles = positions.shape[0]
+    size = np.prod(agg_tmatrix.shape[:agg_tmatrix.ndim//2])
+    if lmax is None:
+        lmax = np.full(Nparticles, miepy.vsh.rmax_to_lmax(tmatrix.shape[-1]))
+
+    return miepy.cpp.interactions.particle_update_aggregate_tmatrix(agg_tmatrix.reshape([size, size]), positions,
+                        tmatrix.reshape([Nparticles,-1]), lmax, k, np.flatnonzero(changed), kernel=kernel)
+
+def ragged_offsets(lmax):
+    """Offsets of the particles in a ragged coefficient vector, where particle i has 2*rmax_i coefficients
+       Returns offsets[N+1]; the coefficients of particle i are offsets[i] to offsets[i+1]
+
+       Arguments:
+           lmax[N]     per-particle lmax
+    """
+    return np.array(miepy.cpp.interactions.ragged_offsets(lmax))
+
+def to_ragged(p, lmax):
+    """Pack padded expansion coefficients into the ragged layout
+       Returns p_ragged[...,size]
+
+       Arguments:
+           p[...,N,2,rmax]   expansion coefficients, padded to the largest lmax
+           lmax[N]           per-particle lmax
+    """
+    return np.concatenate([p[...,i,:,:miepy.vsh.lmax_to_rmax(l)].reshape(p.shape[:-3] + (-1,))
+                           for i, l in enumerate(lmax)], axis=-1)
+
+def from_ragged(p, lmax, rmax):
+    """Unpack ragged expansion coefficients, padding every particle with zeros to rmax
+       Returns p_padded[...,N,2,rmax]
+
+       Arguments:
+           p[...,size]       expansion coefficients in the ragged layout
+           lmax[N]           per-particle lmax
+           rmax              padded number of modes
+    """
+    offsets = ragged_offsets(lmax)
+    padded = np.zeros(p.shape[:-1] + (len(lmax), 2, rmax), dtype=p.dtype)
+
+    for i, l in enumerate(lmax):
+        padded[...,i,:,:miepy.vsh.lmax_to_rmax(l)] = p[...,offsets[i]:offsets[i+1]].reshape(p.shape[:-1] + (2,-1))
+
+    return padded
 
 def reflection_matrix_nia(positions, mie, k, reflected, z):
     """Obtain the particle-centered aggregate T-matrix for a cluster of spheres
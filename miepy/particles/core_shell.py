@@ -2,6 +2,8 @@ import miepy
 from .particle_base import particle
 
 class core_shell(particle):
+    _analytic_tmatrix = True
+
     def __init__(self, position, core_radius, shell_thickness, core_material, shell_material):
         """A sphere object
 
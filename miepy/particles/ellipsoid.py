@@ -2,7 +2,7 @@ import miepy
 from .particle_base import particle
 
 class ellipsoid(particle):
-    def __init__(self, position, rx, ry, rz, material, orientation=None, tmatrix_lmax=0):
+    def __init__(self, position, rx, ry, rz, material, orientation=None, tmatrix_lmax=0, tmatrix_method='nfmds'):
         """An ellipsoid object
 
         Arguments:
@@ -10,6 +10,9 @@ class ellipsoid(particle):
             rx,ry,rz      radii of the 3 axes
             material      particle material (miepy.material object)
             orientation   particle orientation
+            tmatrix_lmax  minimum lmax of the T-matrix computation (default: 0)
+            tmatrix_method  method of the T-matrix computation: 'nfmds' (NFM-DS) or 'ebcm' (in-process
+                          extended boundary condition method, see miepy.tmatrix.tmatrix_ebcm; default: 'nfmds')
         """
         super().__init__(position, orientation, material)
         self.rx  = rx
@@ -17,6 +20,12 @@ class ellipsoid(particle):
         self.rz  = rz
 
         self.tmatrix_lmax = tmatrix_lmax
+        self.tmatrix_method = tmatrix_method
+
+        if tmatrix_method not in ('nfmds', 'ebcm'):
+            raise ValueError("tmatrix_method must be 'nfmds' or 'ebcm'")
+        if tmatrix_method == 'ebcm' and self.conducting:
+            raise ValueError("tmatrix_method='ebcm' does not support conducting particles")
 
     def __repr__(self):
         return f'''{self.__class__.__name__}:
@@ -33,9 +42,13 @@ class ellipsoid(particle):
     def compute_tmatrix(self, lmax, wavelength, eps_m, **kwargs):
         calc_lmax = max(lmax+2, self.tmatrix_lmax)
 
-        self.tmatrix_fixed = miepy.tmatrix.tmatrix_ellipsoid(self.rx, self.ry, self.rz, wavelength, 
-                self.material.eps(wavelength), eps_m, calc_lmax, extended_precision=False,
-                conducting=self.conducting)
+        if self.tmatrix_method == 'ebcm':
+            self.tmatrix_fixed = miepy.tmatrix.tmatrix_ebcm(miepy.tmatrix.ellipsoid_surface(self.rx, self.ry, self.rz),
+                    wavelength, self.material.eps(wavelength), eps_m, calc_lmax, axisymmetric=(self.rx == self.ry))
+        else:
+            self.tmatrix_fixed = miepy.tmatrix.tmatrix_ellipsoid(self.rx, self.ry, self.rz, wavelength, 
+                    self.material.eps(wavelength), eps_m, calc_lmax, extended_precision=False,
+                    conducting=self.conducting)
 
         if lmax < calc_lmax:
             self.tmatrix_fixed = miepy.tmatrix.tmatrix_reduce_lmax(self.tmatrix_fixed, lmax)
@@ -47,4 +60,4 @@ class ellipsoid(particle):
         return max(self.rx, self.ry, self.rz)
 
     def _dict_key(self, wavelength):
-        return (ellipsoid, self.rx, self.ry, self.rz, self.material.eps(wavelength).item(), self.material.mu(wavelength).item())
+        return (ellipsoid, self.rx, self.ry, self.rz, self.tmatrix_method, self.material.eps(wavelength).item(), self.material.mu(wavelength).item())
@@ -1,9 +1,11 @@
 import numpy as np
 import miepy
 
-#TODO: lmax per particle
 #TODO: position and orientation should be properties
 class particle:
+    # True if the T-matrix has a cheap closed form (e.g. Mie theory), so it is not worth computing concurrently
+    _analytic_tmatrix = False
+
     def __init__(self, position, orientation, material):
         """A particle consists of a position, orientation, material, and a lazily evaluated T-matrix
 
@@ -65,6 +67,29 @@ class particle:
         """
         pass
 
+    def interpolate_tmatrix(self, wavelength_min, wavelength_max, lmax, eps_m, tolerance=1e-4, max_samples=60):
+        """Replace compute_tmatrix with a rational interpolant of the T-matrix over a band of wavelengths, so that
+        spectral sweeps compute the T-matrix only at adaptively chosen wavelengths (see miepy.tmatrix.tmatrix_interpolant).
+        Clusters only share the T-matrix of the particle with particles that use the same interpolant
+
+        Arguments:
+            wavelength_min   shortest wavelength
+            wavelength_max   longest wavelength
+            lmax             maximum number of multipoles
+            eps_m            permitvittiy of the medium
+            tolerance        relative accuracy of the T-matrix (default: 1e-4)
+            max_samples      largest number of T-matrix computations (default: 60)
+
+        Returns:
+            the miepy.tmatrix.tmatrix_interpolant
+        """
+        interpolant = miepy.tmatrix.tmatrix_interpolant(self, wavelength_min, wavelength_max, lmax, eps_m,
+                                                        tolerance=tolerance, max_samples=max_samples)
+        self.compute_tmatrix = interpolant.compute_tmatrix
+        self._dict_key = interpolant.dict_key
+
+        return interpolant
+
     def _rotate_fixed_tmatrix(self):
         if self.tmatrix_fixed is not None:
             self.tmatrix = miepy.tmatrix.rotate_tmatrix(self.tmatrix_fixed, self.orientation)
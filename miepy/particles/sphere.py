@@ -2,6 +2,8 @@ import miepy
 from .particle_base import particle
 
 class sphere(particle):
+    _analytic_tmatrix = True
+
     def __init__(self, position, radius, material):
         """A sphere object
 
@@ -2,7 +2,7 @@ import miepy
 from .particle_base import particle
 
 class spheroid(particle):
-    def __init__(self, position, axis_xy, axis_z, material, orientation=None, tmatrix_lmax=0):
+    def __init__(self, position, axis_xy, axis_z, material, orientation=None, tmatrix_lmax=0, tmatrix_method='nfmds'):
         """A spheroid object
 
         Arguments:
@@ -11,12 +11,21 @@ class spheroid(particle):
             axis_z        length of semiaxis along axis of symmetry
             material      particle material (miepy.material object)
             orientation   particle orientation
+            tmatrix_lmax  minimum lmax of the T-matrix computation (default: 0)
+            tmatrix_method  method of the T-matrix computation: 'nfmds' (NFM-DS) or 'ebcm' (in-process
+                          extended boundary condition method, see miepy.tmatrix.tmatrix_ebcm; default: 'nfmds')
         """
         super().__init__(position, orientation, material)
         self.axis_xy = axis_xy
         self.axis_z  = axis_z
 
         self.tmatrix_lmax = tmatrix_lmax
+        self.tmatrix_method = tmatrix_method
+
+        if tmatrix_method not in ('nfmds', 'ebcm'):
+            raise ValueError("tmatrix_method must be 'nfmds' or 'ebcm'")
+        if tmatrix_method == 'ebcm' and self.conducting:
+            raise ValueError("tmatrix_method='ebcm' does not support conducting particles")
 
     def __repr__(self):
         return f'''{self.__class__.__name__}:
@@ -32,8 +41,12 @@ class spheroid(particle):
     def compute_tmatrix(self, lmax, wavelength, eps_m, **kwargs):
         calc_lmax = max(lmax+2, self.tmatrix_lmax)
 
-        self.tmatrix_fixed = miepy.tmatrix.tmatrix_spheroid(self.axis_xy, self.axis_z, wavelength, 
-                self.material.eps(wavelength), eps_m, calc_lmax, extended_precision=False, conducting=self.conducting)
+        if self.tmatrix_method == 'ebcm':
+            self.tmatrix_fixed = miepy.tmatrix.tmatrix_ebcm(miepy.tmatrix.spheroid_surface(self.axis_xy, self.axis_z),
+                    wavelength, self.material.eps(wavelength), eps_m, calc_lmax, axisymmetric=True)
+        else:
+            self.tmatrix_fixed = miepy.tmatrix.tmatrix_spheroid(self.axis_xy, self.axis_z, wavelength, 
+                    self.material.eps(wavelength), eps_m, calc_lmax, extended_precision=False, conducting=self.conducting)
 
         if lmax < calc_lmax:
             self.tmatrix_fixed = miepy.tmatrix.tmatrix_reduce_lmax(self.tmatrix_fixed, lmax)
@@ -45,4 +58,4 @@ class spheroid(particle):
         return max(self.axis_xy, self.axis_z)
 
     def _dict_key(self, wavelength):
-        return (spheroid, self.axis_xy, self.axis_z, self.material.eps(wavelength).item(), self.material.mu(wavelength).item())
+        return (spheroid, self.axis_xy, self.axis_z, self.tmatrix_method, self.material.eps(wavelength).item(), self.material.mu(wavelength).item())
@@ -158,7 +158,8 @@ class beam(propagating_source):
         """
         position = np.asarray(position)
 
-        if k != self.k_stored or lmax != self.lmax_stored:
+        # the projection of a higher lmax also serves every lower lmax (its leading modes)
+        if k != self.k_stored or self.lmax_stored is None or lmax > self.lmax_stored:
             theta_c = self.theta_cutoff(k)
             self.k_stored = k
             self.lmax_stored = lmax
@@ -175,7 +176,7 @@ class beam(propagating_source):
         rmax = miepy.vsh.lmax_to_rmax(lmax)
         p_src = np.empty([position.shape[0], 2, rmax], dtype=complex)
         for i in range(position.shape[0]):
-            p_src[i] = self.p_src_func(pos[i])
+            p_src[i] = self.p_src_func(pos[i])[:,:rmax]
 
         if self.orientation != miepy.quaternion.one:
             p_src = miepy.vsh.rotate_expansion_coefficients(p_src, self.orientation)
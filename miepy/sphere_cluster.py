@@ -1,6 +1,9 @@
 """
 The Generalized Mie Theory (GMT) for a collection of spheres.
 """
+import copy
+import time
+import warnings
 import numpy as np
 import miepy
 from miepy.special_functions import riccati_1,riccati_2,vector_spherical_harmonics
@@ -14,19 +17,44 @@ class sphere_cluster:
     """Solve Generalized Mie Theory for an N particle sphere cluster in an arbitray source profile"""
     def __init__(self, *, position, radius, material, source, wavelength,
                  lmax, medium=None, origin=None, symmetry=None, interface=None,
-                 interactions=True):
+                 interactions=True, solver=None, tolerance=1e-5, maxiter=1000, fmm_accuracy=1e-4,
+                 cutoff=None, coupling_cutoff=None, lattice_vectors=None, translation=None, lmax_tolerance=1e-4):
         """Arguments:
                position[N,3] or [3]    sphere positions
                radius[N] or scalar     sphere radii
                material[N] or scalar   sphere materials
                source        source object specifying the incident E and H functions
                wavelength    wavelength to solve the system at
-               lmax          maximum number of orders to use in angular momentum expansion (int)
+               lmax          maximum number of orders to use in angular momentum expansion (int).
+                             Choose 'auto' to select lmax from the sizes of the spheres and their gaps
+                             (see miepy.truncation.auto_lmax), raised until the truncation error is below lmax_tolerance
                medium        (optional) material medium (must be non-absorbing; default=vacuum)
                origin        (optional) system origin around which to compute cluster quantities (default = [0,0,0]). Choose 'auto' to automatically choose origin as center of geometry.
                symmetry      (optional) specify system symmetries (default: no symmetries)
                interface     (optional) include an infinite interface (default: no interface)
                interactions  (optional) If True, include particle interactions (bool, default=True) 
+               solver        (optional) linear solver for the interactions (miepy.solver, default=bicgstab).
+                             miepy.solver.matrix_free avoids storing the aggregate T-matrix;
+                             miepy.solver.exact keeps an LU factorization, reused for new sources;
+                             miepy.solver.fmm evaluates the interactions with a fast multipole method;
+                             miepy.solver.lattice translates each lattice displacement once and applies the
+                             interactions by FFT, for particles on the sites of a (1D, 2D or 3D) lattice
+               tolerance     (optional) tolerance of the residual relative to the source coefficients (default: 1e-5)
+               maxiter       (optional) maximum number of iterations of the iterative solvers (default: 1000)
+               fmm_accuracy  (optional) relative accuracy of the fast multipole translations (default: 1e-4)
+               cutoff        (optional) neglect the interactions of particles farther apart than this distance;
+                             the aggregate T-matrix is then stored block-sparse (default: no cutoff)
+               coupling_cutoff  (optional) neglect the interactions whose estimated coupling |A_ij T_j| is below
+                             this value (default: no cutoff). The estimated dropped coupling is reported
+                             in solve_info.dropped_coupling and should be small compared to 1
+               lattice_vectors  (optional) primitive lattice vectors [D,3] of miepy.solver.lattice
+                             (default: detected from the positions)
+               translation   (optional) kernel of the particle-to-particle translations (miepy.translation_kernel,
+                             default=direct). miepy.translation_kernel.rotation rotates into the pair axis,
+                             translates along it and rotates back; with miepy.solver.matrix_free it avoids
+                             the translation blocks and is faster for larger lmax
+               lmax_tolerance  (optional) accepted truncation error of lmax='auto' (default: 1e-4). The estimated
+                             errors of the spheres are in truncation_error()
         """
         ### sphere properties
         self.position = np.asarray(np.atleast_2d(position), dtype=float)
@@ -41,9 +69,19 @@ class sphere_cluster:
         ### system properties
         self.source = source
         self.wavelength = wavelength
-        self.lmax = lmax
-        self.rmax = lmax*(lmax + 2)
+        self.auto_lmax = isinstance(lmax, str) and lmax == 'auto'
+        self.lmax_tolerance = lmax_tolerance
         self.interactions = interactions
+        self.solver = miepy.solver.bicgstab if solver is None else solver
+        self.tolerance = tolerance
+        self.maxiter = maxiter
+        self.fmm_accuracy = fmm_accuracy
+        self.cutoff = cutoff
+        self.coupling_cutoff = coupling_cutoff
+        self.lattice_vectors = lattice_vectors
+        self.translation = miepy.translation_kernel.direct if translation is None else translation
+        if (cutoff is not None or coupling_cutoff is not None) and self.solver != miepy.solver.bicgstab:
+            raise ValueError('interaction cutoffs require the bicgstab solver')
 
         ### set the origin
         self.auto_origin = False    
@@ -67,36 +105,29 @@ class sphere_cluster:
         ### build material data of particles
         self.material_data = miepy.material_functions.material_struct(self.material, self.medium, wavelength=self.wavelength)
 
-        ### mie coefficients
-        self.mie_scat = np.zeros([self.Nparticles, 2, self.lmax], dtype=complex)
-        self.mie_int = np.zeros([self.Nparticles, 2, self.lmax], dtype=complex)
+        ### mie coefficients and expansion coefficients
+        if self.auto_lmax:
+            lmax = int(np.max(miepy.truncation.auto_lmax(self.position, self.radius, self.material_data.k_b,
+                                                         tolerance=lmax_tolerance)))
+        self._set_lmax(lmax)
 
-        for i in range(self.Nparticles):
-            conducting = (self.material[i].name == 'metal')
-            for n in range(1, self.lmax+1):
-                self.mie_scat[i,:,n-1] = \
-                    miepy.mie_single.mie_sphere_scattering_coefficients(self.radius[i],
-                    n, self.material_data.eps[i], self.material_data.mu[i],
-                    self.material_data.eps_b, self.material_data.mu_b, self.material_data.k_b,
-                    conducting=conducting)
+        ### cluster coefficients
+        self.p_cluster = None
 
-                self.mie_int[i,:,n-1] = \
-                    miepy.mie_single.mie_sphere_interior_coefficients(self.radius[i],
-                    n, self.material_data.eps[i], self.material_data.mu[i],
-                    self.material_data.eps_b, self.material_data.mu_b, self.material_data.k_b,
-                    conducting=conducting)
+        ### report of the last interactions solve (iterations, residuals, convergence and timings)
+        self.solve_info = None
 
-        ### modified coefficients
-        self.p_inc  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
-        self.p_scat = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
-        self.p_int  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
-        self.p_src  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        ### factorization of the interactions, kept for the exact solver
+        self._factorization = None
 
-        ### cluster coefficients
-        self.p_cluster = None
+        ### aggregate T-matrix, kept to update only the spheres that move
+        self._agg_tmatrix = None
+        self._changed = np.zeros(self.Nparticles, dtype=bool)
 
         ### solve the interactions
         self.solve()
+        if self.auto_lmax:
+            self._refine_lmax()
 
     def __repr__(self):
         return f'''{self.__class__.__name__}:
@@ -547,18 +578,30 @@ class sphere_cluster:
         return scope.image(x, y, z_val=z, magnify=magnify)
 
     def update_position(self, position):
-        """Update the positions of the spheres
+        """Update the positions of the spheres. Only the interactions and source coefficients
+           of the spheres that moved are recomputed
 
             Arguments
                 position[N,3]       new particle positions
         """
-        self.position = np.asarray(np.atleast_2d(position), dtype=float)
+        position = np.asarray(np.atleast_2d(position), dtype=float)
+        moved = np.any(position != self.position, axis=1)
+        self.position = position
+        self._changed |= moved
         self._reset_cluster_coefficients()
+        if np.any(moved):
+            self._factorization = None
 
         if self.auto_origin:
             self.origin = np.average(self.position, axis=0)
 
-        self.solve()
+        if np.any(moved):
+            self.p_src[moved] = self._source_decomposition(self.source, self.position[moved])
+
+        if self.interactions:
+            self._solve_interactions()
+        else:
+            self._solve_without_interactions()
 
     def solve_cluster_coefficients(self, lmax=None):
         """Solve for the p,q coefficients of the entire cluster around the origin
@@ -580,33 +623,260 @@ class sphere_cluster:
                wavelength   wavelength to solve at (default: current wavelength)
                source       source to use (default: current source). If current source is also None, solve the particle's T-matrix instead
         """
+        if source is not None:
+            self.source = source
+
+        new_wavelength = wavelength is not None and wavelength != self.wavelength
+        if new_wavelength:
+            self._set_wavelength(wavelength)
+
         self._solve_source_decomposition()
         if self.interactions:
             self._solve_interactions()
         else:
             self._solve_without_interactions()
 
+        if new_wavelength and self.auto_lmax:
+            self._refine_lmax()
+
+    def spectrum(self, wavelengths, quantities=('cross_sections',)):
+        """Solve the cluster at every wavelength and evaluate quantities (see miepy.sweep.spectrum)
+
+           Arguments:
+               wavelengths[W]   wavelengths to solve at
+               quantities       names of cluster methods without arguments (e.g. 'cross_sections', 'force', 'torque'),
+                                or a dict of {name: function(cluster)} (default: ('cross_sections',))
+
+           Returns:
+               dict of {name: quantity at every wavelength}
+        """
+        return miepy.sweep.spectrum(self, wavelengths, quantities=quantities)
+
+    def adaptive_spectrum(self, wavelength_min, wavelength_max, quantity='cross_sections', tolerance=1e-3,
+                          max_samples=100):
+        """Solve the cluster at adaptively chosen wavelengths and fit a rational interpolant of a quantity
+           (see miepy.sweep.adaptive_spectrum)
+
+           Arguments:
+               wavelength_min   shortest wavelength
+               wavelength_max   longest wavelength
+               quantity         name of a cluster method without arguments, or a function(cluster)
+                                (default: 'cross_sections')
+               tolerance        relative accuracy of the interpolant (default: 1e-3)
+               max_samples      largest number of samples (default: 100)
+
+           Returns:
+               (wavelengths, values, interpolant)
+        """
+        return miepy.sweep.adaptive_spectrum(self, wavelength_min, wavelength_max, quantity=quantity,
+                                             tolerance=tolerance, max_samples=max_samples)
+
+    def solve_sources(self, sources):
+        """Solve the cluster for several sources at once. The interactions are built a single time
+           and the right-hand sides of all sources are solved together
+
+           Arguments:
+               sources     list of sources
+
+           Returns:
+               list of clusters, one per source, each with its own p_src, p_inc, p_scat and p_int
+               (the particles are shared with this cluster)
+        """
+        if self.symmetry is not None:
+            raise NotImplementedError('solving several sources at once is not supported with symmetries')
+
+        sources = list(sources)
+        p_src = np.array([self._source_decomposition(source) for source in sources])
+
+        if self.interactions:
+            p_inc, info = self._solve_interaction_equations(p_src)
+        else:
+            p_inc, info = np.copy(p_src), None
+
+        solutions = []
+        for i, source in enumerate(sources):
+            solution = copy.copy(self)
+            solution.source = source
+            solution.p_src = p_src[i]
+            solution.p_inc = p_inc[i]
+            solution.p_scat = np.zeros_like(self.p_scat)
+            solution.p_int = np.zeros_like(self.p_int)
+            solution.solve_info = info
+            solution._reset_cluster_coefficients()
+            solution._solve_scattering_coefficients()
+            solutions.append(solution)
+
+        return solutions
+
+    def truncation_error(self):
+        """Estimate the truncation error of every sphere, the larger of the relative amplitude of the highest
+           order of its scattering coefficients and the convergence of the near fields of its neighbors
+           (see miepy.truncation.truncation_error and miepy.truncation.proximity_error)
+
+           Returns: error[N]
+        """
+        return np.maximum(miepy.truncation.truncation_error(self.p_scat, self.lmax),
+                          miepy.truncation.proximity_error(self.position, self.radius, self.lmax))
+
+    def _set_lmax(self, lmax):
+        """Set lmax, computing the mie coefficients and resetting the expansion coefficients"""
+        self.lmax = lmax
+        self.rmax = lmax*(lmax + 2)
+
+        self.mie_scat = np.zeros([self.Nparticles, 2, self.lmax], dtype=complex)
+        self.mie_int = np.zeros([self.Nparticles, 2, self.lmax], dtype=complex)
+
+        for i in range(self.Nparticles):
+            conducting = (self.material[i].name == 'metal')
+            for n in range(1, self.lmax+1):
+                self.mie_scat[i,:,n-1] = \
+                    miepy.mie_single.mie_sphere_scattering_coefficients(self.radius[i],
+                    n, self.material_data.eps[i], self.material_data.mu[i],
+                    self.material_data.eps_b, self.material_data.mu_b, self.material_data.k_b,
+                    conducting=conducting)
+
+                self.mie_int[i,:,n-1] = \
+                    miepy.mie_single.mie_sphere_interior_coefficients(self.radius[i],
+                    n, self.material_data.eps[i], self.material_data.mu[i],
+                    self.material_data.eps_b, self.material_data.mu_b, self.material_data.k_b,
+                    conducting=conducting)
+
+        self.p_inc  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_scat = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_int  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+        self.p_src  = np.zeros([self.Nparticles, 2, self.rmax], dtype=complex)
+
+        self.p_cluster = None
+        self.solve_info = None
+        self._factorization = None
+        self._agg_tmatrix = None
+
+    def _refine_lmax(self, lmax_limit=20):
+        """Raise lmax while the truncation error of any sphere is above lmax_tolerance"""
+        while self.lmax < lmax_limit and np.max(self.truncation_error()) > self.lmax_tolerance:
+            self._set_lmax(self.lmax + 1)
+            self.solve()
+
+    def _set_wavelength(self, wavelength):
+        """Set the wavelength, recomputing the material data and the T-matrices. The incident coefficients
+           at the previous wavelength are kept to warm start the next solve"""
+        if (self.medium.eps(wavelength).imag != 0) or (self.medium.mu(wavelength).imag != 0):
+            raise ValueError('medium must be non-absorbing')
+
+        p_inc, solve_info = self.p_inc, self.solve_info
+        self.wavelength = wavelength
+        self.material_data.wavelength = wavelength
+        self._set_lmax(self.lmax)
+
+        self.p_inc[...] = p_inc
+        self.solve_info = solve_info
+
     def _reset_cluster_coefficients(self):
         self.p_cluster = None
 
-    def _solve_source_decomposition(self):
-        self.p_src[...] = self.source.structure(self.position, self.material_data.k_b, self.lmax)
+    def _source_decomposition(self, source, position=None):
+        if position is None:
+            position = self.position
+
+        p_src = source.structure(position, self.material_data.k_b, self.lmax)
 
         if self.interface is not None:
-            reflected = self.source.reflect(self.interface, self.medium, self.wavelength)
-            self.p_src += reflected.structure(self.position, self.material_data.k_b, self.lmax)
+            reflected = source.reflect(self.interface, self.medium, self.wavelength)
+            p_src += reflected.structure(position, self.material_data.k_b, self.lmax)
+
+        return p_src
+
+    def _solve_source_decomposition(self):
+        self.p_src[...] = self._source_decomposition(self.source)
 
     def _solve_without_interactions(self):
         self.p_inc[...] = self.p_src
-
-        for r,n,m in miepy.mode_indices(self.lmax):
-            self.p_scat[...,r] = self.p_inc[...,r]*self.mie_scat[...,n-1]
-            self.p_int[...,r] = self.p_inc[...,r]*self.mie_int[:,::-1,n-1]
+        self._solve_scattering_coefficients()
 
     def _solve_interactions(self):
+        # warm start the iterative solver from the previous solution, if there is one
+        x0 = None if self.solve_info is None else self.p_inc
+
+        self.p_inc[...], self.solve_info = self._solve_interaction_equations(self.p_src, x0=x0)
+        self._solve_scattering_coefficients()
+
+    def _solve_interaction_equations(self, p_src, x0=None):
+        start = time.perf_counter()
+        build_time = 0
+        build_stats = None
+
+        if self.solver in (miepy.solver.matrix_free, miepy.solver.fmm, miepy.solver.lattice):
+            if self.symmetry is not None or self.interface is not None:
+                raise NotImplementedError('the matrix-free, fmm and lattice solvers do not yet support symmetries or interfaces')
+
+        if self.solver == miepy.solver.matrix_free:
+            p_inc, info = miepy.interactions.sphere_matrix_free_solve(self.position,
+                                      self.mie_scat, self.material_data.k_b, p_src, x0=x0,
+                                      maxiter=self.maxiter, tolerance=self.tolerance, kernel=self.translation)
+        elif self.solver == miepy.solver.fmm:
+            p_inc, info = miepy.interactions.sphere_fmm_solve(self.position,
+                                      self.mie_scat, self.material_data.k_b, p_src, x0=x0, accuracy=self.fmm_accuracy,
+                                      maxiter=self.maxiter, tolerance=self.tolerance)
+        elif self.solver == miepy.solver.lattice:
+            sites, lattice_vectors = miepy.interactions.lattice_sites(self.position, self.lattice_vectors)
+            p_inc, info = miepy.interactions.sphere_lattice_solve(sites, lattice_vectors,
+                                      self.mie_scat, self.material_data.k_b, p_src, x0=x0,
+                                      maxiter=self.maxiter, tolerance=self.tolerance)
+        elif self.solver == miepy.solver.exact:
+            # the factorization is kept until the spheres move, so a new source only needs back-substitution
+            # (periodic interactions depend on the source direction and are always refactorized)
+            if self._factorization is None or self.symmetry is not None:
+                agg_tmatrix, build_stats = self._build_aggregate_tmatrix()
+                self._factorization = miepy.interactions.interaction_factorization(agg_tmatrix)
+                build_time = time.perf_counter() - start
+
+            p_inc, info = miepy.interactions.solve_factorized(self._factorization, p_src)
+        elif self.cutoff is not None or self.coupling_cutoff is not None:
+            if self.symmetry is not None or self.interface is not None:
+                raise NotImplementedError('interaction cutoffs do not yet support symmetries or interfaces')
+
+            agg_tmatrix = miepy.interactions.sphere_sparse_aggregate_tmatrix(self.position, self.mie_scat,
+                                      self.material_data.k_b, cutoff=self.cutoff, coupling_cutoff=self.coupling_cutoff,
+                                      kernel=self.translation)
+            build_time = time.perf_counter() - start
+            p_inc, info = miepy.interactions.solve_sparse_linear_system(agg_tmatrix, p_src,
+                                      x0=x0, maxiter=self.maxiter, tolerance=self.tolerance)
+        else:
+            agg_tmatrix, build_stats = self._build_aggregate_tmatrix()
+            build_time = time.perf_counter() - start
+            p_inc, info = miepy.interactions.solve_linear_system(agg_tmatrix, p_src,
+                                      method=self.solver, x0=x0, maxiter=self.maxiter, tolerance=self.tolerance)
+
+        info.build_time = build_time
+        info.solve_time = time.perf_counter() - start - build_time
+        if build_stats is not None:
+            info.translation_hit_rate = build_stats.hit_rate
+
+        if not info.converged:
+            warnings.warn('interactions solve did not converge in {} iterations (relative residual {:.2e})'.format(
+                          info.iterations, info.residual), RuntimeWarning)
+
+        return p_inc, info
+
+    def _build_aggregate_tmatrix(self):
+        # the aggregate T-matrix of the interactions and its build statistics (None with symmetries, or if
+        # nothing changed). Without symmetries or an interface it is kept, and only the blocks of the spheres
+        # that moved since are recomputed
+        build_stats = None
+        if self.symmetry is None and self.interface is None:
+            if self._agg_tmatrix is None:
+                self._agg_tmatrix, build_stats = miepy.interactions.sphere_aggregate_tmatrix(self.position,
+                                          self.mie_scat, self.material_data.k_b, return_stats=True, kernel=self.translation)
+            elif np.any(self._changed):
+                build_stats = miepy.interactions.sphere_update_aggregate_tmatrix(self._agg_tmatrix, self.position,
+                                          self.mie_scat, self.material_data.k_b, self._changed, kernel=self.translation)
+            self._changed[...] = False
+
+            return self._agg_tmatrix, build_stats
+
         if self.symmetry is None:
-            agg_tmatrix = miepy.interactions.sphere_aggregate_tmatrix(self.position, self.mie_scat,
-                                      self.material_data.k_b)
+            agg_tmatrix, build_stats = miepy.interactions.sphere_aggregate_tmatrix(self.position, self.mie_scat,
+                                      self.material_data.k_b, return_stats=True, kernel=self.translation)
         else:
             agg_tmatrix = miepy.interactions.sphere_aggregate_tmatrix_periodic(self.position, self.mie_scat,
                                       self.material_data.k_b, self.symmetry, self.source.k_hat)
@@ -617,9 +887,9 @@ class sphere_cluster:
             R_matrix = miepy.interactions.reflection_matrix_nia(self.position, self.mie_scat, self.material_data.k_b, r0, z)
             agg_tmatrix -= R_matrix
 
+        return agg_tmatrix, build_stats
 
-        self.p_inc[...] = miepy.interactions.solve_linear_system(agg_tmatrix, self.p_src, method=miepy.solver.bicgstab)
-
+    def _solve_scattering_coefficients(self):
         for r,n,m in miepy.mode_indices(self.lmax):
             self.p_scat[...,r] = self.p_inc[...,r]*self.mie_scat[...,n-1]
             self.p_int[...,r] = self.p_inc[...,r]*self.mie_int[:,::-1,n-1]
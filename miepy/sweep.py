@@ -0,0 +1,267 @@
+"""
+Spectral sweeps: solve a cluster at many wavelengths and collect quantities as arrays
+"""
+
+import numpy as np
+import scipy.linalg
+
+def _quantity_functions(quantities):
+    """dict of {name: function(cluster)} from names of cluster methods or a dict of functions"""
+    if isinstance(quantities, str):
+        quantities = [quantities]
+
+    if isinstance(quantities, dict):
+        return dict(quantities)
+
+    return {name: (lambda cluster, name=name: getattr(cluster, name)()) for name in quantities}
+
+def _stack(results):
+    """stack the results of every wavelength; namedtuples are stacked field by field"""
+    first = results[0]
+    if isinstance(first, tuple) and hasattr(first, '_fields'):
+        return type(first)(*(np.array(field) for field in zip(*results)))
+
+    return np.array(results)
+
+def _solve_wavelengths(cluster, wavelengths, functions):
+    """solve the cluster at consecutive wavelengths, warm starting each from the last"""
+    results = []
+    for wavelength in wavelengths:
+        cluster.solve(wavelength=wavelength)
+        results.append({name: f(cluster) for name, f in functions.items()})
+
+    return results
+
+def spectrum(cluster, wavelengths, quantities=('cross_sections',)):
+    """Solve a cluster at every wavelength and evaluate quantities of the solution.
+
+       The cluster is solved at consecutive wavelengths in place, each solve warm started from the solution at
+       the previous wavelength. This is a convenience over building a new cluster at every wavelength, not a
+       faster path: the aggregate T-matrix depends on the wavelength through every translation and is rebuilt
+       at every wavelength (see examples/benchmarks/spectrum_sweep.py)
+
+       Returns dict of {name: quantity at every wavelength}; quantities that return namedtuples
+       (e.g. cross_sections) are namedtuples of arrays, others are arrays with a leading [W] axis.
+       The cluster is left solved at the last wavelength
+
+       Arguments:
+           cluster          miepy.sphere_cluster or miepy.cluster
+           wavelengths[W]   wavelengths to solve at
+           quantities       names of cluster methods without arguments (e.g. 'cross_sections', 'force', 'torque'),
+                            or a dict of {name: function(cluster)}, e.g. far fields with
+                            {'E_far': lambda cluster: cluster.E_angular(theta, phi)} (default: ('cross_sections',))
+    """
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    functions = _quantity_functions(quantities)
+    results = _solve_wavelengths(cluster, wavelengths, functions)
+
+    return {name: _stack([result[name] for result in results]) for name in functions}
+
+def aaa(z, F, tolerance=1e-13, max_terms=100, scale=None):
+    """Set-valued AAA rational approximation (Nakatsukasa, Sete & Trefethen) of samples F[M,K] at the points z[M].
+       All K components share the support points and weights. The weights only depend on F F^H, so with more
+       components than samples they are computed from the M principal components of F
+       Returns (support indices[m], weights[m])
+
+       Arguments:
+           z[M]          sample points
+           F[M,K]        sample values of K components
+           tolerance     relative tolerance of the fit at the sample points, in the norm over the components
+                         (default: 1e-13)
+           max_terms     largest number of support points (default: 100)
+           scale         scale of the components, scalar or [K] (default: the largest value of each component)
+    """
+    z = np.asarray(z)
+    F = np.asarray(F).reshape(len(z), -1)
+    if scale is None:
+        scale = np.max(np.abs(F), axis=0)
+    scale = np.broadcast_to(scale, F.shape[1:])
+    F = F/np.where(scale > 0, scale, 1)
+
+    if F.shape[1] > len(z):
+        U, s, _ = np.linalg.svd(F, full_matrices=False)
+        F = U*s
+
+    remaining = np.ones(len(z), dtype=bool)
+    support = []
+    R = np.broadcast_to(np.mean(F, axis=0), F.shape)
+
+    for m in range(min(max_terms, len(z))):
+        j = np.argmax(np.linalg.norm(F - R, axis=1) * remaining)
+        support.append(j)
+        remaining[j] = False
+
+        C = 1/(z[remaining,np.newaxis] - z[np.newaxis,support])
+        loewner = np.concatenate([(F[remaining,k,np.newaxis] - F[np.newaxis,support,k])*C
+                                  for k in range(F.shape[1])])
+        if loewner.shape[0] > 0:
+            weights = np.linalg.svd(loewner, full_matrices=loewner.shape[0] < loewner.shape[1])[2][-1].conj()
+        else:
+            weights = np.ones(len(support))
+
+        R = F.copy()
+        R[remaining] = (C @ (weights[:,np.newaxis]*F[support]))/(C @ weights)[:,np.newaxis]
+        if np.max(np.linalg.norm(F - R, axis=1)) <= tolerance:
+            break
+
+    return np.array(support), weights
+
+class rational_interpolant:
+    """Barycentric rational interpolant r(x) = sum_j w_j f_j/(x - z_j) / sum_j w_j/(x - z_j) of a quantity,
+       in the variable x = 1/wavelength. Calling it with wavelengths[W] returns the quantity at every wavelength,
+       in the form of spectrum (namedtuples of arrays, or arrays with a leading [W] axis)"""
+    def __init__(self, wavelengths, values, template, tolerance=1e-13, max_terms=100, scale=None):
+        """Arguments:
+               wavelengths[M]   sampled wavelengths
+               values[M,K]      flattened quantity at the sampled wavelengths
+               template         the quantity at one wavelength, which sets the form of the output
+               tolerance        relative tolerance of the fit at the samples (default: 1e-13)
+               max_terms        largest number of support points (default: 100)
+               scale            scale of the components, scalar or [K] (default: the largest value of each component)
+        """
+        x = 1/np.asarray(wavelengths)
+        support, self.weights = aaa(x, values, tolerance=tolerance, max_terms=max_terms, scale=scale)
+        self.support = x[support]
+        self.support_values = np.asarray(values)[support]
+        self.template = template
+
+    def poles(self):
+        """Poles of the interpolant, as complex wavelengths"""
+        m = len(self.weights)
+        E = np.zeros((m+1, m+1), dtype=complex)
+        E[0,1:] = self.weights
+        E[1:,0] = 1
+        E[1:,1:] = np.diag(self.support)
+        B = np.eye(m+1)
+        B[0,0] = 0
+
+        x_poles = scipy.linalg.eigvals(E, B)
+        x_poles = x_poles[np.isfinite(x_poles)]
+
+        return 1/x_poles
+
+    def evaluate(self, wavelengths):
+        """the flattened quantity [W,K] at the wavelengths"""
+        x = 1/np.atleast_1d(np.asarray(wavelengths, dtype=float))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            C = 1/(x[:,np.newaxis] - self.support[np.newaxis])
+            r = (C @ (self.weights[:,np.newaxis]*self.support_values))/(C @ self.weights)[:,np.newaxis]
+
+        # at the support points the interpolant is the sampled value
+        exact = np.nonzero(x[:,np.newaxis] == self.support[np.newaxis])
+        r[exact[0]] = self.support_values[exact[1]]
+
+        if not np.iscomplexobj(_flatten(self.template)):
+            r = r.real
+
+        return r
+
+    def __call__(self, wavelengths):
+        return _unflatten(self.evaluate(wavelengths), self.template)
+
+def _flatten(result):
+    """a quantity at one wavelength as a flat array"""
+    return np.ravel(np.asarray(tuple(result) if _is_namedtuple(result) else result))
+
+def _unflatten(values, template):
+    """flat values [W,K] in the form of spectrum, from the quantity at one wavelength"""
+    if _is_namedtuple(template):
+        return type(template)(*values.T)
+
+    return values.reshape((-1,) + np.shape(template))
+
+def _is_namedtuple(result):
+    return isinstance(result, tuple) and hasattr(result, '_fields')
+
+def adaptive_spectrum(cluster, wavelength_min, wavelength_max, quantity='cross_sections', tolerance=1e-3,
+                      initial_samples=9, max_samples=100, grid=2000):
+    """Solve a cluster at adaptively chosen wavelengths, refining where a rational (AAA) fit of a quantity
+       has not converged. After every new sample the fit is rebuilt, and the next wavelength is the one where the
+       new and the previous fits differ the most on a fine grid; sampling stops when they agree to within
+       tolerance (relative to the largest value of each component) twice in a row.
+       The cluster is solved as in spectrum, warm starting every solve from the previous solution
+
+       Returns (wavelengths[M], values, interpolant): the sampled wavelengths in increasing order, the quantity
+       at these wavelengths (in the form of spectrum), and a rational_interpolant of the quantity
+
+       Arguments:
+           cluster          miepy.sphere_cluster or miepy.cluster
+           wavelength_min   shortest wavelength
+           wavelength_max   longest wavelength
+           quantity         name of a cluster method without arguments, or a function(cluster)
+                            (default: 'cross_sections')
+           tolerance        relative accuracy of the interpolant (default: 1e-3)
+           initial_samples  number of initial samples, evenly spaced in frequency (default: 9)
+           max_samples      largest number of samples (default: 100)
+           grid             number of points of the fine grid used to compare fits (default: 2000)
+    """
+    function = quantity if callable(quantity) else _quantity_functions(quantity)[quantity]
+
+    def sample(wavelength):
+        cluster.solve(wavelength=wavelength)
+        return function(cluster)
+
+    def fit(wavelengths, results):
+        values = np.array([_flatten(result) for result in results])
+        scale = np.max(np.abs(values), axis=0)
+        return rational_interpolant(wavelengths, values, results[0], tolerance=0.1*tolerance), scale
+
+    wavelengths, results, interpolant = adaptive_sampling(sample, fit, wavelength_min, wavelength_max,
+                       tolerance=tolerance, initial_samples=initial_samples, max_samples=max_samples, grid=grid)[:3]
+
+    order = np.argsort(wavelengths)
+    values = np.array([_flatten(results[i]) for i in order])
+
+    return np.array(wavelengths)[order], _unflatten(values, results[0]), interpolant
+
+def adaptive_sampling(sample, fit, wavelength_min, wavelength_max, tolerance=1e-3, initial_samples=9,
+                      max_samples=100, grid=2000, chunk=100):
+    """Sample a function of wavelength adaptively, refining where successive fits of the samples disagree
+       (see adaptive_spectrum)
+
+       Returns (wavelengths[M], results[M], interpolant, converged): the sampled wavelengths and results in
+       the order they were sampled, the last fit, and whether the fits converged within max_samples
+
+       Arguments:
+           sample           function(wavelength) that returns the result at a wavelength
+           fit              function(wavelengths, results) that returns (interpolant, scale), where
+                            interpolant.evaluate(wavelengths[W]) returns the flattened results [W,K] and the
+                            differences of successive fits are relative to scale (scalar or [K])
+           wavelength_min   shortest wavelength
+           wavelength_max   longest wavelength
+           tolerance        relative accuracy of the interpolant (default: 1e-3)
+           initial_samples  number of initial samples, evenly spaced in frequency (default: 9)
+           max_samples      largest number of samples (default: 100)
+           grid             number of points of the fine grid used to compare fits (default: 2000)
+           chunk            number of grid points evaluated at once (default: 100)
+    """
+    x_grid = np.linspace(1/wavelength_max, 1/wavelength_min, grid)
+    wavelengths = list(1/np.linspace(1/wavelength_max, 1/wavelength_min, initial_samples))
+    results = [sample(wavelength) for wavelength in wavelengths]
+
+    # the first reference is a fit to every other initial sample; later references are the previous fits
+    interpolant, scale = fit(wavelengths, results)
+    reference = fit(wavelengths[::2], results[::2])[0]
+
+    converged = 0
+    while len(wavelengths) < max_samples:
+        scale = np.where(scale == 0, 1, scale)
+        error = np.concatenate([np.max(np.abs(interpolant.evaluate(1/x) - reference.evaluate(1/x))/scale, axis=1)
+                                for x in np.array_split(x_grid, max(1, grid//chunk))])
+
+        converged = converged + 1 if np.max(error) < tolerance else 0
+        if converged == 2:
+            break
+
+        # sample where the fits differ the most, away from the existing samples
+        distance = np.min(np.abs(x_grid[:,np.newaxis] - 1/np.array(wavelengths)[np.newaxis]), axis=1)
+        error[distance < 0.5*(x_grid[1] - x_grid[0])] = 0
+        wavelength = 1/x_grid[np.argmax(error)]
+
+        wavelengths.append(wavelength)
+        results.append(sample(wavelength))
+        reference = interpolant
+        interpolant, scale = fit(wavelengths, results)
+
+    return wavelengths, results, interpolant, converged == 2
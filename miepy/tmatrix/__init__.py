@@ -4,9 +4,15 @@ from . import required_files
 from . import axisymmetric_file
 from . import non_axisymmetric_file
 from . import functions
+from . import cache
+from . import ebcm
+from . import interpolation
 
-from .get_tmatrix import nfmds_solver, tmatrix_solvers
+from .get_tmatrix import nfmds_solver, tmatrix_solvers, compute_many
 from .common import (tmatrix_cylinder, tmatrix_spheroid, tmatrix_sphere, tmatrix_core_shell, 
                      tmatrix_ellipsoid, tmatrix_square_prism, tmatrix_regular_prism,
                      tmatrix_sphere_cluster)
-from .functions import tmatrix_reduce_lmax, rotate_tmatrix
+from .functions import tmatrix_reduce_lmax, rotate_tmatrix, rotate_tmatrices
+from .cache import clear_tmatrix_cache
+from .ebcm import tmatrix_ebcm, spheroid_surface, ellipsoid_surface
+from .interpolation import tmatrix_interpolant
@@ -0,0 +1,216 @@
+"""
+Persistent on-disk cache of NFM-DS T-matrices
+
+When enabled, every T-matrix computed by nfmds_solver is stored in a .npy file in the cache directory, named by
+a hash of everything that determines it (the NFM-DS executable, solver, geometry and material parameters,
+wavelength, lmax, Nint, precision).
+Files are written to a temporary name and atomically renamed, so concurrent writers (separate processes or
+threads) never expose partial files, and the least recently used files are evicted once the cache exceeds
+max_size bytes. The size of the cache is scanned once per process and then tracked by adding the size of every
+stored file, so the directory is only scanned again when the tracked size crosses max_size (files written by
+other processes are counted at that scan).
+
+Cached T-matrices are loaded into memory rather than memory-mapped: a T-matrix is small (about 1 MB at lmax=10)
+and every element is read right away when it is rotated into the cluster, so mapping saves nothing, while a
+mapping would keep a file open for the lifetime of the particle after it may have been evicted or replaced.
+
+The cache is disabled by default. It is configured by the module variables enabled, directory and max_size, with
+the defaults set by the environment variables MIEPY_TMATRIX_CACHE (1 to enable the cache in ~/.cache/miepy/tmatrix,
+or a directory to enable it there) and MIEPY_TMATRIX_CACHE_SIZE (in bytes)
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import functools
+import threading
+import numpy as np
+
+cache_version = 2
+
+_environment = os.environ.get('MIEPY_TMATRIX_CACHE', '')
+enabled = _environment.lower() not in ('', '0', 'false', 'off')
+directory = _environment if _environment.lower() not in ('', '0', 'false', 'off', '1', 'true', 'on') else \
+            os.path.join(os.path.expanduser('~'), '.cache', 'miepy', 'tmatrix')
+max_size = int(os.environ.get('MIEPY_TMATRIX_CACHE_SIZE', 2**30))
+
+# tracked size in bytes of each cache directory this process has stored to
+_tracked_size = {}
+_tracked_size_lock = threading.Lock()
+
+def _canonical(value):
+    """a JSON-serializable form of a solver parameter, exact for floats and complex numbers"""
+    if isinstance(value, dict):
+        return {str(key): _canonical(value[key]) for key in sorted(value)}
+    elif isinstance(value, np.ndarray):
+        return _canonical(value.tolist())
+    elif isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    elif isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    elif isinstance(value, (int, np.integer)):
+        return int(value)
+    elif isinstance(value, (float, np.floating)):
+        return float(value).hex()
+    elif isinstance(value, (complex, np.complexfloating)):
+        return [complex(value).real.hex(), complex(value).imag.hex()]
+    elif value is None or isinstance(value, str):
+        return value
+
+    return repr(value)
+
+@functools.lru_cache(maxsize=None)
+def _executable_digest(executable, mtime, size):
+    """hex digest of the content of an executable (cached per modification time and size)"""
+    digest = hashlib.sha256()
+    try:
+        with open(executable, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                digest.update(block)
+    except OSError:
+        return None
+
+    return digest.hexdigest()
+
+def executable_digest(executable):
+    """hex digest of the content of an executable, or None if it cannot be read
+
+    Arguments:
+        executable     path to the executable
+    """
+    try:
+        stat = os.stat(executable)
+    except OSError:
+        return None
+
+    return _executable_digest(executable, stat.st_mtime_ns, stat.st_size)
+
+def tmatrix_key(solver_name, lmax, input_kwargs, extended_precision, executable=None):
+    """The content-addressed key (a hex digest) of an NFM-DS T-matrix
+
+    Arguments:
+        solver_name          name of the NFM-DS solver
+        lmax                 maximum number of multipoles
+        input_kwargs         keyword arguments of the solver input function
+        extended_precision   whether extended precision is used
+        executable           path to the NFM-DS executable; its content is part of the key, so T-matrices of a
+                             rebuilt or upgraded solver are not served from the cache (default: None)
+    """
+    solver_digest = None if executable is None else executable_digest(executable)
+    description = dict(version=cache_version, solver=solver_name, lmax=lmax, executable=solver_digest,
+                       extended_precision=extended_precision, parameters=input_kwargs)
+    text = json.dumps(_canonical(description), sort_keys=True)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def _path(key):
+    return os.path.join(directory, key + '.npy')
+
+def load(key):
+    """Load a cached T-matrix, or return None if it is not in the cache
+
+    Arguments:
+        key     key of the T-matrix (see tmatrix_key)
+    """
+    if not enabled:
+        return None
+
+    path = _path(key)
+    try:
+        tmatrix = np.load(path)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+
+    return tmatrix
+
+def store(key, tmatrix):
+    """Store a T-matrix in the cache, evicting the least recently used T-matrices if the cache is full.
+    Failures to write (e.g. a read-only cache directory) are ignored
+
+    Arguments:
+        key        key of the T-matrix (see tmatrix_key)
+        tmatrix    the T-matrix
+    """
+    if not enabled:
+        return
+
+    path = _path(key)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, tmatrix)
+                written = f.tell()
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+    except OSError:
+        return
+
+    with _tracked_size_lock:
+        if directory in _tracked_size:
+            _tracked_size[directory] += written - replaced
+        else:
+            _tracked_size[directory] = cache_size()
+        full = _tracked_size[directory] > max_size
+
+    if full:
+        evict()
+
+def _entries():
+    """(last use, size, path) of every cached T-matrix"""
+    entries = []
+    try:
+        files = os.scandir(directory)
+    except OSError:
+        return entries
+
+    with files:
+        for entry in files:
+            if not entry.name.endswith('.npy'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    return entries
+
+def evict(size=None):
+    """Remove the least recently used T-matrices until the cache holds at most size bytes
+
+    Arguments:
+        size     largest size of the cache in bytes (default: max_size)
+    """
+    size = max_size if size is None else size
+    entries = sorted(_entries())
+    total = sum(entry[1] for entry in entries)
+
+    for _, file_size, path in entries:
+        if total <= size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= file_size
+
+    with _tracked_size_lock:
+        _tracked_size[directory] = total
+
+def cache_size():
+    """The total size of the cached T-matrices in bytes"""
+    return sum(entry[1] for entry in _entries())
+
+def clear_tmatrix_cache():
+    """Remove every T-matrix from the cache"""
+    evict(size=0)
@@ -0,0 +1,188 @@
+"""
+In-process T-matrices of star-shaped particles with the extended boundary condition method (EBCM)
+
+The particle surface is given by its radius r(θ,φ). The internal field is expanded in regular VSHs of the
+particle medium, and the null-field equations are written with the reciprocity integral
+
+    <a, b> = ∮ n·(E_a × H_b - E_b × H_a) dS
+
+of the internal field with the regular and outgoing VSHs of the surrounding medium. The integrals of the incident
+and scattered waves do not depend on the surface, so they are evaluated on a sphere with the same quadrature,
+and the resulting T-matrix is in the VSH convention of miepy (p_scat = T p_inc)
+"""
+
+import numpy as np
+import miepy
+from miepy.cpp.vsh_functions import Emn
+
+def spheroid_surface(axis_xy, axis_z):
+    """Surface of a spheroid, for tmatrix_ebcm
+
+    Arguments:
+        axis_xy     length of semiaxes perpendicular to the axis of symmetry
+        axis_z      length of semiaxis along axis of symmetry
+    """
+    def surface(theta, phi):
+        r = 1/np.sqrt(np.sin(theta)**2/axis_xy**2 + np.cos(theta)**2/axis_z**2)
+        dr_theta = -r**3*np.sin(theta)*np.cos(theta)*(1/axis_xy**2 - 1/axis_z**2)
+        return r, dr_theta, np.zeros_like(r)
+
+    return surface
+
+def ellipsoid_surface(rx, ry, rz):
+    """Surface of an ellipsoid, for tmatrix_ebcm
+
+    Arguments:
+        rx,ry,rz    radii of the 3 axes
+    """
+    def surface(theta, phi):
+        r = 1/np.sqrt(np.sin(theta)**2*(np.cos(phi)**2/rx**2 + np.sin(phi)**2/ry**2) + np.cos(theta)**2/rz**2)
+        dr_theta = -r**3*np.sin(theta)*np.cos(theta)*(np.cos(phi)**2/rx**2 + np.sin(phi)**2/ry**2 - 1/rz**2)
+        dr_phi = -r**3*np.sin(theta)**2*np.sin(phi)*np.cos(phi)*(1/ry**2 - 1/rx**2)
+        return r, dr_theta, dr_phi
+
+    return surface
+
+def _angular_functions(n, m, theta, phi):
+    """Angular functions (P, pi, tau)[R,G] and the factors Emn*exp(i m phi)[R,G] of modes (n,m) at the surface points,
+       evaluated once per distinct theta"""
+    theta_unique, inverse = np.unique(theta, return_inverse=True)
+    n_, m_ = n[:,np.newaxis], m[:,np.newaxis]
+    P = miepy.vsh.special.associated_legendre(n_, m_, np.cos(theta_unique))[:,inverse]
+    pi = miepy.vsh.special.pi_func(n_, m_, theta_unique)[:,inverse]
+    tau = miepy.vsh.special.tau_func(n_, m_, theta_unique)[:,inverse]
+
+    E_mn = np.array([Emn(int(mi), int(ni)) for ni, mi in zip(n, m)])
+    phase = E_mn[:,np.newaxis]*np.exp(1j*m_*phi)
+
+    return P, pi, tau, phase
+
+def _surface_fields(n, angular, x, eps, mode):
+    """E and H of the electric and magnetic VSHs of modes n (with the angular functions of _angular_functions)
+       at the surface points x = k*r, in spherical components, such that E = sum(p[a,i]*E[a*R+i]) for expansion
+       coefficients p[2,R]; H omits the factor -i/(mu0*c) common to all media
+
+       Returns E[2R,3,G], H[2R,3,G]
+    """
+    zn = miepy.vsh.get_zn(mode)
+    factor = 1j if mode == miepy.vsh_mode.outgoing else -1j
+    P, pi, tau, phase = angular
+
+    n_unique, inverse = np.unique(n, return_inverse=True)
+    z = zn(n_unique[:,np.newaxis], x)[inverse]
+    zp = zn(n_unique[:,np.newaxis], x, True)[inverse]
+
+    e = factor*phase
+    radial = (z + x*zp)/x
+    N = np.stack([n[:,np.newaxis]*(n[:,np.newaxis]+1)*P*z/x, tau*radial, 1j*pi*radial], axis=1)*e[:,np.newaxis]
+    M = np.stack([np.zeros_like(z), 1j*pi*z, -tau*z], axis=1)*e[:,np.newaxis]
+
+    E = np.concatenate([N, M])
+    H = np.sqrt(eps)*np.concatenate([M, N])
+
+    return E, H
+
+def _reciprocity(E_field, H_field, E_test, H_test, sigma):
+    """Reciprocity integrals <field_j, test_i> = sum over the surface of sigma·(E_j × H_i - E_i × H_j)
+
+       Arguments:
+           E_field[J,3,G], H_field[J,3,G]    fields
+           E_test[I,3,G], H_test[I,3,G]      test fields
+           sigma[3,G]                        outward surface element times the quadrature weights
+    """
+    J, I = len(E_field), len(E_test)
+    sigma_E = np.cross(sigma[np.newaxis], E_field, axis=1)
+    sigma_H = np.cross(sigma[np.newaxis], H_field, axis=1)
+
+    return H_test.reshape(I,-1) @ sigma_E.reshape(J,-1).T + E_test.reshape(I,-1) @ sigma_H.reshape(J,-1).T
+
+def _quadrature(surface, Ntheta, Nphi):
+    """Surface points (r, theta, phi) and the surface element sigma[3,G] with the quadrature weights:
+       Gauss-Legendre in cos(theta), uniform in phi"""
+    x, w = np.polynomial.legendre.leggauss(Ntheta)
+    theta = np.arccos(x)
+    phi = 2*np.pi*np.arange(Nphi)/Nphi
+    THETA, PHI = np.meshgrid(theta, phi, indexing='ij')
+    weights = np.outer(w, np.full(Nphi, 2*np.pi/Nphi))
+
+    THETA, PHI, weights = THETA.ravel(), PHI.ravel(), weights.ravel()
+    r, dr_theta, dr_phi = (np.broadcast_to(v, THETA.shape) for v in surface(THETA, PHI))
+    sigma = weights*r**2*np.array([np.ones_like(r), -dr_theta/r, -dr_phi/(r*np.sin(THETA))])
+
+    return r, THETA, PHI, sigma
+
+def _ebcm_block(n_field, m_field, n_test, m_test, points, sphere_points, k, k_int, eps_m, eps):
+    """T-matrix [2R,2R] coupling the modes (n_field, m_field), tested with the modes (n_test, m_test)"""
+    incident, outgoing = miepy.vsh_mode.incident, miepy.vsh_mode.outgoing
+    same = np.array_equal(n_field, n_test) and np.array_equal(m_field, m_test)
+
+    def fields(points):
+        r, theta, phi, sigma = points
+        field = _angular_functions(n_field, m_field, theta, phi)
+        test = field if same else _angular_functions(n_test, m_test, theta, phi)
+        return r, sigma, field, test
+
+    r, sigma, field, test = fields(points)
+    E_int, H_int = _surface_fields(n_field, field, k_int*r, eps, incident)
+    E_rg, H_rg = _surface_fields(n_test, test, k*r, eps_m, incident)
+    E_out, H_out = _surface_fields(n_test, test, k*r, eps_m, outgoing)
+    A = _reciprocity(E_int, H_int, E_out, H_out, sigma)
+    B = _reciprocity(E_int, H_int, E_rg, H_rg, sigma)
+
+    r, sigma, field, test = fields(sphere_points)
+    E_inc, H_inc = _surface_fields(n_field, field, k*r, eps_m, incident)
+    E_sca, H_sca = _surface_fields(n_field, field, k*r, eps_m, outgoing)
+    E_rg, H_rg = _surface_fields(n_test, test, k*r, eps_m, incident)
+    E_out, H_out = _surface_fields(n_test, test, k*r, eps_m, outgoing)
+    L = _reciprocity(E_inc, H_inc, E_out, H_out, sigma)
+    K = _reciprocity(E_sca, H_sca, E_rg, H_rg, sigma)
+
+    return np.linalg.solve(K, B @ np.linalg.solve(A, L))
+
+def tmatrix_ebcm(surface, wavelength, eps, eps_m, lmax, axisymmetric=False, Ntheta=None, Nphi=None):
+    """Compute the T-matrix of a star-shaped particle in-process with the extended boundary condition method
+
+    Arguments:
+        surface       function(theta, phi) of the particle surface, returning (r, dr/dtheta, dr/dphi)
+                      (see spheroid_surface and ellipsoid_surface)
+        wavelength    incident wavelength
+        eps           particle permittivity
+        eps_m         medium permittivity
+        lmax          maximum number of multipoles
+        axisymmetric  if True, the surface does not depend on phi; the T-matrix is then solved separately
+                      for every m, with a 1D quadrature in theta (default: False)
+        Ntheta        number of Gauss-Legendre points in cos(theta) (default: 4*lmax + 20)
+        Nphi          number of points in phi, for surfaces that are not axisymmetric (default: 4*lmax + 20)
+    """
+    if Ntheta is None:
+        Ntheta = 4*lmax + 20
+    if Nphi is None:
+        Nphi = 4*lmax + 20
+
+    rmax = miepy.vsh.lmax_to_rmax(lmax)
+    k = 2*np.pi*np.sqrt(eps_m)/wavelength
+    k_int = 2*np.pi*np.sqrt(eps)/wavelength
+    modes = np.array(list(miepy.mode_indices(lmax)))
+    r_index, n, m = modes.T
+
+    # the surface-independent integrals are evaluated on the sphere kr = 1, exactly with this quadrature
+    sphere = lambda theta, phi: (1/np.real(k), 0, 0)
+    T = np.zeros([2, rmax, 2, rmax], dtype=complex)
+
+    if axisymmetric:
+        # only modes m and -m couple in the reciprocity integrals, and the phi integral is 2π
+        points = _quadrature(surface, Ntheta, 1)
+        sphere_points = _quadrature(sphere, lmax + 2, 1)
+
+        for mval in range(-lmax, lmax + 1):
+            idx = r_index[m == mval]
+            nm = n[m == mval]
+            block = _ebcm_block(nm, m[m == mval], nm, -m[m == mval], points, sphere_points,
+                                k, k_int, eps_m, eps).reshape(2, len(idx), 2, len(idx))
+            T[np.ix_([0,1], idx, [0,1], idx)] = block
+    else:
+        points = _quadrature(surface, Ntheta, Nphi)
+        sphere_points = _quadrature(sphere, lmax + 2, 2*lmax + 2)
+        T[...] = _ebcm_block(n, m, n, m, points, sphere_points, k, k_int, eps_m, eps).reshape(2, rmax, 2, rmax)
+
+    return T
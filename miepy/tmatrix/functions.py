@@ -34,14 +34,25 @@ def rotate_tmatrix(tmatrix, quat):
     """
     rmax = tmatrix.shape[1]
     lmax = miepy.vsh.rmax_to_lmax(rmax)
+    R = miepy.vsh.vsh_rotation_operator(lmax, quat)
 
-    R = np.zeros([rmax, rmax], dtype=complex)
+    tmatrix_rot = np.matmul(np.matmul(R, tmatrix.transpose(0,2,1,3)), R.conj().T)
 
-    for i,n,m in miepy.mode_indices(lmax):
-        r = miepy.vsh.lmax_to_rmax(n)
-        idx = np.s_[r-(2*n+1):r]
-        R[idx,idx] = miepy.vsh.vsh_rotation_matrix(n, quat)
+    return tmatrix_rot.transpose(0,2,1,3)
 
-    tmatrix_rot = np.einsum('ms,uw,asbw->ambu', R, np.conjugate(R), tmatrix)
+def rotate_tmatrices(tmatrix, quat):
+    """Rotate many T-matrices at once
 
-    return tmatrix_rot
+    Arguments:
+        tmatrix[N,2,rmax,2,rmax]    tmatrices to be rotated
+        quat[N]                     quaternions representing the rotations
+
+    Returns:
+        The rotated T-matrices [N,2,rmax,2,rmax]
+    """
+    Nmatrices, _, rmax = tmatrix.shape[:3]
+    quat = np.atleast_2d(miepy.quaternion.as_float_array(quat))
+    tmatrix = np.ascontiguousarray(tmatrix, dtype=complex).reshape(-1, 2*rmax)
+    tmatrix_rot = miepy.cpp.vsh_rotation.rotate_tmatrices(tmatrix, quat)
+
+    return tmatrix_rot.reshape(Nmatrices, 2, rmax, 2, rmax)
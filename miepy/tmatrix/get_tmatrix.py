@@ -1,17 +1,102 @@
 import os
 import subprocess
 import tempfile 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
 import miepy
-import pandas
+import functools
 from functools import namedtuple
 from .required_files import main_input_file, sct_input_file
 from .axisymmetric_file import axisymmetric_file
 from .non_axisymmetric_file import non_axisymmetric_file
 from .sphere_cluster_file import sphere_cluster_file
+from . import cache
 
 
+def read_nfmds_tmatrix(filename):
+    """Read the complex entries of an NFM-DS T-matrix file (tmatrix.dat) as a flat array, in file order
+
+    Arguments:
+        filename     path to the T-matrix file
+    """
+    with open(filename, 'r') as f:
+        for i in range(3):
+            f.readline()
+        values = np.array(f.read().split(), dtype=float)
+
+    return values[::2] + 1j*values[1::2]
+
+@functools.lru_cache(maxsize=None)
+def _axisymmetric_indices(lmax, n_rank, m_rank):
+    """Flat indices into T[2,rmax,2,rmax] and into the NFM-DS axisymmetric T-matrix, and the factors
+       relating their entries, such that T.flat[destination] = data[source]*factor"""
+    rmax = miepy.vsh.lmax_to_rmax(lmax)
+    destination, source, factor = [], [], []
+
+    def add(a, r1, b, r2, x, y, f):
+        destination.append(np.ravel_multi_index((a, r1, b, r2), (2, rmax, 2, rmax)))
+        source.append(x*2*n_rank + y)
+        factor.append(f)
+
+    for r1,n1,m1 in miepy.mode_indices(lmax, m_start=-m_rank, m_stop=m_rank):
+        for r2,n2,m2 in miepy.mode_indices(lmax, m_start=-m_rank, m_stop=m_rank):
+            if m1 != m2:
+                continue
+
+            n_max = n_rank - max(1, abs(m1)) + 1
+            l1 = n1 - max(1, abs(m1)) 
+            l2 = n2 - max(1, abs(m2)) 
+
+            x = 2*n_rank*abs(m1) + l1
+            y = l2
+
+            f = -1j**(n2-n1)
+            add(1, r1, 1, r2, x, y, f)
+            add(0, r1, 0, r2, x+n_max, y+n_max, f)
+            add(0, r1, 1, r2, x+n_max, y, f*np.sign(m1))
+            add(1, r1, 0, r2, x, y+n_max, f*np.sign(m2))
+
+    return np.array(destination, dtype=int), np.array(source, dtype=int), np.array(factor, dtype=complex)
+
+@functools.lru_cache(maxsize=None)
+def _non_axisymmetric_indices(lmax, n_rank):
+    """Flat indices into T[2,rmax,2,rmax] and into the NFM-DS non-axisymmetric T-matrix, and the factors
+       relating their entries, such that T.flat[destination] = data[source]*factor"""
+    rmax = miepy.vsh.lmax_to_rmax(lmax)
+
+    def rindex(n, m):
+        return (n-1)*(n+2) + m + 1
+
+    ### NFM-DS orders the modes by m = 0, -1, 1, -2, 2, ..., and by n within each m
+    r, n, m = np.empty(rmax, dtype=int), np.empty(rmax, dtype=int), np.empty(rmax, dtype=int)
+    n_i, m_i = 1, 0
+    for i in range(rmax):
+        if n_i > n_rank:
+            m_i = -(m_i + 1) if m_i >= 0 else -m_i
+            n_i = abs(m_i)
+        r[i], n[i], m[i] = rindex(n_i, m_i), n_i, m_i
+        n_i += 1
+
+    n1, n2 = n[:,np.newaxis], n[np.newaxis]
+    m1, m2 = m[:,np.newaxis], m[np.newaxis]
+    r1, r2 = np.broadcast_arrays(r[:,np.newaxis], r[np.newaxis])
+    i, j = np.meshgrid(np.arange(rmax), np.arange(rmax), indexing='ij')
+
+    f = -1j**(n2 - n1)
+    odd = (m1 % 2 == 1) & (m2 % 2 == 1)
+    sign = np.sign(m1*m2)
+    f1 = f*np.where(odd, sign**(n1 + n2 + 1), 1)
+    f2 = f*np.where(odd, sign**(n1 + n2), 1)
+
+    shape = (2, rmax, 2, rmax)
+    destination = [np.ravel_multi_index((a, r1, b, r2), shape) for a, b in [(0,0), (1,1), (0,1), (1,0)]]
+    source = [(rmax + i)*2*rmax + rmax + j, i*2*rmax + j, (rmax + i)*2*rmax + j, i*2*rmax + j + rmax]
+    factor = [f1, f1, -f2, -f2]
+
+    return (np.concatenate([d.ravel() for d in destination]), np.concatenate([s.ravel() for s in source]),
+            np.concatenate([np.broadcast_to(f, (rmax, rmax)).ravel() for f in factor]))
+
 tmatrix_input = namedtuple('TmatrixInput', 'number, name, input_function')
 class tmatrix_solvers:
     axisymmetric     = tmatrix_input(number=1, name='AXSYM', input_function=axisymmetric_file)
@@ -26,12 +111,27 @@ def nfmds_solver(lmax, input_kwargs, solver=tmatrix_solvers.axisymmetric, extend
         input_kwargs   keyword arguments forwarded to solver.input_function
         solver         type of solver to use (default: axisymmetric)
         extended_precision (bool)    whether to use extended precision (default: False)
+
+    If the persistent on-disk cache is enabled (see miepy.tmatrix.cache), T-matrices are stored in it and loaded
+    from it when the same T-matrix is requested again
     """
     rmax = miepy.vsh.lmax_to_rmax(lmax)
 
     if 'conducting' in input_kwargs and input_kwargs['conducting']:
         input_kwargs['index'] = 1
 
+    install_path = miepy.__path__[0]
+    if extended_precision:
+        command = '{install_path}/bin/tmatrix_extended'.format(install_path=install_path)
+    else:
+        command = '{install_path}/bin/tmatrix'.format(install_path=install_path)
+
+    if cache.enabled:
+        key = cache.tmatrix_key(solver.name, lmax, input_kwargs, extended_precision, executable=command)
+        T = cache.load(key)
+        if T is not None:
+            return T
+
     ### create temporary directory tree
     with tempfile.TemporaryDirectory() as direc:
         ### create 4 sub-directories
@@ -58,12 +158,6 @@ def nfmds_solver(lmax, input_kwargs, solver=tmatrix_solvers.axisymmetric, extend
             f.write((solver.input_function(Nrank=lmax, **input_kwargs)))
 
         ### execute program and communicate
-        install_path = miepy.__path__[0]
-        if extended_precision:
-            command = '{install_path}/bin/tmatrix_extended'.format(install_path=install_path)
-        else:
-            command = '{install_path}/bin/tmatrix'.format(install_path=install_path)
-
         proc = subprocess.Popen([command], cwd=sources_dir, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
         proc.communicate(str(solver.number).encode())
         proc.wait()
@@ -82,77 +176,51 @@ def nfmds_solver(lmax, input_kwargs, solver=tmatrix_solvers.axisymmetric, extend
 
         ### read T-matrix output
         tmatrix_file = '{tmatrix_output_dir}/tmatrix.dat'.format(tmatrix_output_dir=tmatrix_output_dir)
-        data = pandas.read_csv(tmatrix_file, skiprows=3,
-                  delim_whitespace=True, header=None).values.flatten()  # read as flat array
-        data = data[~np.isnan(data)]  # throw out the NaNs
-        data_real = data[::2]  # every other element is the real part
-        data_imag = data[1::2]
+        data = read_nfmds_tmatrix(tmatrix_file)
 
         ### restructure T-matrix
-        T = np.zeros((2, rmax, 2, rmax), dtype=complex)
-
         if solver == tmatrix_solvers.axisymmetric:
-            T_nfmds = np.reshape(data_real, (-1, 2*n_rank)) \
-                      + 1j*np.reshape(data_imag, (-1, 2*n_rank))  # reshape the final result to have 2*n_rank columns
-
-            for r1,n1,m1 in miepy.mode_indices(lmax, m_start=-m_rank, m_stop=m_rank):
-                for r2,n2,m2 in miepy.mode_indices(lmax, m_start=-m_rank, m_stop=m_rank):
-                    if m1 != m2:
-                        continue
-
-                    n_max = n_rank - max(1, abs(m1)) + 1
-                    l1 = n1 - max(1, abs(m1)) 
-                    l2 = n2 - max(1, abs(m2)) 
-
-                    x = 2*n_rank*abs(m1) + l1
-                    y = l2
-
-                    factor = -1j**(n2-n1)
-                    T[1,r1,1,r2] = T_nfmds[x, y]*factor
-                    T[0,r1,0,r2] = T_nfmds[x+n_max, y+n_max]*factor
-                    T[0,r1,1,r2] = T_nfmds[x+n_max, y]*factor*np.sign(m1)
-                    T[1,r1,0,r2] = T_nfmds[x, y+n_max]*factor*np.sign(m2)
+            destination, source, factor = _axisymmetric_indices(lmax, n_rank, m_rank)
         else:
-            def rindex(n, m):
-                return (n-1)*(n+2) + m + 1
-
-            M = (data_real + 1j*data_imag).reshape([2*rmax, 2*rmax])
-
-            m1p, n1p = 0, 1
-            for i in range(rmax):
-                if n1p > n_rank:
-                    if m1p >= 0:
-                        m1p = -(m1p + 1)
-                    else:
-                        m1p = -m1p
-                    n1p = abs(m1p)
-
-                m2p, n2p = 0, 1
-                for j in range(rmax):
-                    if n2p > n_rank:
-                        if m2p >= 0:
-                            m2p = -(m2p + 1)
-                        else:
-                            m2p = -m2p
-                        n2p = abs(m2p)
-
-                    r1 = rindex(n1p, m1p)
-                    r2 = rindex(n2p, m2p)
-
-                    factor = -1j**(n2p-n1p)
-                    f1 = 1
-                    f2 = 1
-                    if m1p % 2 == 1 and m2p % 2 == 1:
-                        f1 *= np.sign(m1p*m2p)**(n1p+n2p+1)
-                        f2 *= np.sign(m1p*m2p)**(n1p+n2p)
-
-                    T[0,r1,0,r2] = M[rmax+i, rmax+j]*factor*f1
-                    T[1,r1,1,r2] = M[i, j]*factor*f1
-                    T[0,r1,1,r2] = -M[i+rmax, j]*factor*f2
-                    T[1,r1,0,r2] = -M[i, j+rmax]*factor*f2
-
-                    n2p += 1
-
-                n1p += 1
+            destination, source, factor = _non_axisymmetric_indices(lmax, n_rank)
+
+        T = np.zeros((2, rmax, 2, rmax), dtype=complex)
+        T.flat[destination] = data[source]*factor
 
+        if cache.enabled:
+            cache.store(key, T)
         return T
+
+def compute_many(requests, workers=None):
+    """Compute many T-matrices concurrently. Every NFM-DS job runs as a separate process in its own
+       temporary directory, so the jobs of different requests run in parallel; the requests are submitted
+       to a pool of worker threads that wait on the processes, and the results are collected as they complete.
+       Fewer than 2 requests, or a single worker, are computed serially without a pool.
+
+       The requests run concurrently and must not share mutable state: particle.compute_tmatrix modifies its
+       particle, so no particle may appear in more than one request. Only pass expensive (numerical) T-matrices;
+       cheap ones, such as Mie T-matrices, are faster computed serially
+
+    Arguments:
+        requests    list of functions without arguments that return T-matrices, e.g.
+                    functools.partial(miepy.tmatrix.tmatrix_spheroid, axis_xy, axis_z, wavelength, eps, eps_m, lmax)
+        workers     number of concurrent jobs (default: number of CPUs)
+
+    Returns:
+        list of the T-matrices, in the order of the requests
+    """
+    requests = list(requests)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(requests)))
+
+    if workers == 1:
+        return [request() for request in requests]
+
+    results = [None]*len(requests)
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(request): i for i, request in enumerate(requests)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    return results
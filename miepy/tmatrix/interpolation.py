@@ -0,0 +1,93 @@
+"""
+Interpolation of particle T-matrices over wavelength, for spectral sweeps
+"""
+
+import types
+import warnings
+import numpy as np
+import miepy
+
+class tmatrix_interpolant:
+    """Rational interpolant of the T-matrix of a particle over a band of wavelengths.
+
+       The T-matrix (in the particle frame) is computed at adaptively chosen wavelengths and all its elements are
+       fit with a single AAA rational interpolant in frequency (see miepy.sweep.adaptive_sampling), until
+       successive fits agree to within tolerance relative to the largest element. Calling the interpolant with a
+       wavelength returns the T-matrix; compute_tmatrix and dict_key can replace particle.compute_tmatrix and
+       particle._dict_key (see miepy.particles.particle.interpolate_tmatrix)
+    """
+    def __init__(self, particle, wavelength_min, wavelength_max, lmax, eps_m, tolerance=1e-4,
+                 initial_samples=9, max_samples=60):
+        """Arguments:
+               particle         the particle
+               wavelength_min   shortest wavelength
+               wavelength_max   longest wavelength
+               lmax             maximum number of multipoles
+               eps_m            medium permittivity (independent of wavelength)
+               tolerance        relative accuracy of the T-matrix (default: 1e-4)
+               initial_samples  number of initial samples, evenly spaced in frequency (default: 9)
+               max_samples      largest number of T-matrix computations (default: 60)
+        """
+        self.particle = particle
+        self.wavelength_min = wavelength_min
+        self.wavelength_max = wavelength_max
+        self.lmax = lmax
+        self.eps_m = eps_m
+        self.tolerance = tolerance
+        self._compute_tmatrix = types.MethodType(type(particle).compute_tmatrix, particle)
+        self._dict_key = types.MethodType(type(particle)._dict_key, particle)
+
+        rmax = miepy.vsh.lmax_to_rmax(lmax)
+        self.shape = (2, rmax, 2, rmax)
+
+        def sample(wavelength):
+            self._compute_tmatrix(lmax, wavelength, eps_m)
+            return np.array(particle.tmatrix_fixed).ravel()
+
+        def fit(wavelengths, results):
+            values = np.array(results)
+            scale = np.max(np.abs(values))
+            interpolant = miepy.sweep.rational_interpolant(wavelengths, values, values[0],
+                                    tolerance=0.1*tolerance, max_terms=max_samples, scale=scale)
+            return interpolant, scale
+
+        wavelengths, _, self.interpolant, self.converged = miepy.sweep.adaptive_sampling(sample, fit,
+                wavelength_min, wavelength_max, tolerance=tolerance, initial_samples=initial_samples,
+                max_samples=max_samples, grid=500)
+        self.wavelengths = np.sort(wavelengths)
+
+        if not self.converged:
+            warnings.warn('the T-matrix interpolant did not converge to tolerance={} with {} samples'.format(
+                          tolerance, max_samples))
+
+    def __call__(self, wavelength):
+        """The T-matrix [2,rmax,2,rmax] in the particle frame at a wavelength"""
+        return self.interpolant.evaluate(wavelength)[0].reshape(self.shape)
+
+    def compute_tmatrix(self, lmax, wavelength, eps_m, **kwargs):
+        """Interpolated replacement of particle.compute_tmatrix. T-matrices at a lower lmax are the reduced
+           T-matrix of the interpolant; outside of the band, at a larger lmax or in another medium, the T-matrix
+           is computed exactly
+
+           Arguments:
+               lmax         maximum number of multipoles
+               wavelength   incident wavelength
+               eps_m        permittivity of the medium
+        """
+        inside = self.wavelength_min <= wavelength <= self.wavelength_max
+        if not inside or lmax > self.lmax or np.any(eps_m != self.eps_m):
+            return self._compute_tmatrix(lmax, wavelength, eps_m, **kwargs)
+
+        self.particle.tmatrix_fixed = miepy.tmatrix.tmatrix_reduce_lmax(self(wavelength), lmax)
+        self.particle._rotate_fixed_tmatrix()
+
+        return self.particle.tmatrix
+
+    def dict_key(self, wavelength):
+        """Replacement of particle._dict_key that includes the identity of the interpolant, so that particles with
+           interpolated T-matrices are only identified with particles that share the interpolant
+
+           Arguments:
+               wavelength   incident wavelength
+        """
+        return (self._dict_key(wavelength), id(self))
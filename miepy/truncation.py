@@ -0,0 +1,151 @@
+"""
+Selection of the expansion order lmax of the particles and estimates of the truncation error
+"""
+
+import numpy as np
+import miepy
+from scipy.spatial.distance import cdist
+
+def wiscombe_lmax(x):
+    """Expansion order of a particle with size parameter x, from Wiscombe's criterion
+       Returns lmax (same shape as x)
+
+       Arguments:
+           x       size parameter k*radius of the circumscribing sphere (array-like)
+    """
+    x = np.asarray(x, dtype=float)
+    cube_root = np.cbrt(x)
+
+    lmax = np.where(x <= 8, x + 4*cube_root + 1,
+           np.where(x < 4200, x + 4.05*cube_root + 2, x + 4*cube_root + 2))
+
+    return np.maximum(1, np.rint(lmax)).astype(int)
+
+def size_lmax(x, tolerance=1e-4):
+    """Expansion order of a particle with size parameter x. Wiscombe's criterion (see wiscombe_lmax) is meant
+       for particles comparable to the wavelength and asks for at least 5 orders at x ~ 1. For x < 1 the order n
+       scattering coefficients decay as x^(2n+1)/((2n-1)!!(2n+1)!!), and lmax is the smallest order (at least 2)
+       whose coefficients are below tolerance relative to the dipole, as required by truncation_error,
+       if that is smaller than Wiscombe's
+       Returns lmax (same shape as x)
+
+       Arguments:
+           x          size parameter k*radius of the circumscribing sphere (array-like)
+           tolerance  accepted relative amplitude of the highest order (default: 1e-4)
+    """
+    x = np.asarray(x, dtype=float)
+    lmax = wiscombe_lmax(x)
+
+    small = np.full(x.shape, 2, dtype=int)
+    relative = np.ones_like(x)
+    for n in range(2, int(np.max(lmax, initial=2)) + 1):
+        relative = relative*x**2/((2*n - 1)*(2*n + 1))
+        small = np.where(relative >= tolerance, n + 1, small)
+
+    return np.where(x < 1, np.minimum(small, lmax), lmax)
+
+def proximity_ratio(position, radius):
+    """Convergence ratio of the expansion of every particle in the near field of its neighbors
+       Returns ratio[N] (1 for touching or overlapping particles, 0 for a single particle)
+
+       For a pair of spheres, the fields scattered back and forth converge to the foci of bispherical
+       coordinates, at +-c from their center; the order n content of these fields on sphere i decays
+       as exp(-n*mu_i), where sinh(mu_i) = c/a_i. The ratio of particle i is the largest over its neighbors
+
+       Arguments:
+           position[N,3]      particle positions
+           radius[N]          radii of the circumscribing spheres
+    """
+    position = np.atleast_2d(np.asarray(position, dtype=float))
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), position.shape[:1])
+    Nparticles = position.shape[0]
+
+    if Nparticles < 2:
+        return np.zeros(Nparticles, dtype=float)
+
+    d = cdist(position, position)
+    np.fill_diagonal(d, np.inf)
+    ai = radius[:,np.newaxis]
+    aj = radius[np.newaxis]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        c2 = (d**2 - (ai + aj)**2)*(d**2 - (ai - aj)**2)/(4*d**2)
+        ratio = np.exp(-np.arcsinh(np.sqrt(np.maximum(c2, 0))/ai))
+    ratio[d <= ai + aj] = 1
+    np.fill_diagonal(ratio, 0)
+
+    return np.max(ratio, axis=1)
+
+def proximity_lmax(position, radius, tolerance=1e-4, lmax_limit=20):
+    """Expansion order needed to resolve the near fields of the neighboring particles,
+       the smallest lmax where ratio^(2*lmax) < tolerance (see proximity_ratio)
+       Returns lmax[N]
+
+       Arguments:
+           position[N,3]      particle positions
+           radius[N]          radii of the circumscribing spheres
+           tolerance          accepted coupling of the truncated orders (default: 1e-4)
+           lmax_limit         largest lmax returned, for touching or overlapping particles (default: 20)
+    """
+    ratio = proximity_ratio(position, radius)
+    lmax = np.full(ratio.shape, lmax_limit, dtype=int)
+
+    converging = ratio < 1
+    lmax[converging] = np.ceil(np.log(tolerance)/(2*np.log(ratio[converging]))).astype(int)
+    lmax[ratio == 0] = 1
+
+    return np.clip(lmax, 1, lmax_limit)
+
+def proximity_error(position, radius, lmax):
+    """Estimate of the truncation error of every particle in the near field of its neighbors,
+       ratio^(2*lmax_i) (see proximity_ratio)
+       Returns error[N]
+
+       Arguments:
+           position[N,3]      particle positions
+           radius[N]          radii of the circumscribing spheres
+           lmax[N]            per-particle lmax (or a single lmax)
+    """
+    return proximity_ratio(position, radius)**(2*np.asarray(lmax))
+
+def auto_lmax(position, radius, k, tolerance=1e-4, lmax_limit=20):
+    """Select the expansion order of every particle from its size parameter (see size_lmax)
+       and the gaps to its neighbors (see proximity_lmax)
+       Returns lmax[N]
+
+       Arguments:
+           position[N,3]      particle positions
+           radius[N]          radii of the circumscribing spheres
+           k                  medium wavenumber
+           tolerance          accepted coupling and amplitude of the truncated orders (default: 1e-4)
+           lmax_limit         largest lmax returned (default: 20)
+    """
+    position = np.atleast_2d(np.asarray(position, dtype=float))
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), position.shape[:1])
+
+    lmax = np.maximum(size_lmax(k*radius, tolerance), proximity_lmax(position, radius, tolerance, lmax_limit))
+    return np.clip(lmax, 1, lmax_limit)
+
+def truncation_error(p, lmax):
+    """A-posteriori estimate of the truncation error of every particle: the relative amplitude of
+       the highest order n = lmax_i of its expansion coefficients. For a converged expansion the
+       coefficients decay with n, and the neglected orders are smaller still. The coefficients of
+       closely spaced particles can decay much faster than the interactions converge; see proximity_error
+       Returns error[N]
+
+       Arguments:
+           p[N,2,rmax]    expansion coefficients (padded to the largest lmax)
+           lmax[N]        per-particle lmax (or a single lmax)
+    """
+    Nparticles = p.shape[0]
+    lmax = np.broadcast_to(np.asarray(lmax, dtype=int), (Nparticles,))
+    error = np.zeros(Nparticles, dtype=float)
+
+    for i in range(Nparticles):
+        rmax = miepy.vsh.lmax_to_rmax(lmax[i])
+        rmax_lower = miepy.vsh.lmax_to_rmax(lmax[i] - 1)
+        total = np.linalg.norm(p[i,:,:rmax])
+        if total > 0:
+            error[i] = np.linalg.norm(p[i,:,rmax_lower:rmax])/total
+
+    return error
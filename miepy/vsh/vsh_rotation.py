@@ -4,6 +4,84 @@ VSH rotation functions
 
 import numpy as np
 import miepy
+import threading
+from collections import OrderedDict
+
+# total size in bytes of the cached rotation operators; an operator at lmax=20 is about 3 MB
+rotation_cache_nbytes = 64*2**20
+_rotation_cache = OrderedDict()
+_rotation_cache_used = 0
+_rotation_cache_lock = threading.Lock()
+
+def _quaternion_components(quat):
+    """quaternion components [...,4] of a quaternion or array of quaternions"""
+    if isinstance(quat, np.ndarray) and quat.dtype != np.quaternion:
+        return np.asarray(quat, dtype=float)
+
+    return miepy.quaternion.as_float_array(quat)
+
+def clear_rotation_cache():
+    """Clear the cache of VSH rotation operators"""
+    global _rotation_cache_used
+
+    with _rotation_cache_lock:
+        _rotation_cache.clear()
+        _rotation_cache_used = 0
+
+def vsh_rotation_operator(lmax, quat):
+    """Block-diagonal rotation operator of all multipole orders up to lmax. The operators of the
+    most recently used quaternions are cached, up to rotation_cache_nbytes in total
+
+    Arguments:
+        lmax    maximum multipole order
+        quat    quaternion representing the rotation
+
+    Returns:
+        Rotation operator D[rmax,rmax], such that p' = D*p
+    """
+    global _rotation_cache_used
+
+    components = _quaternion_components(quat)
+    key = (lmax,) + tuple(components)
+
+    with _rotation_cache_lock:
+        D = _rotation_cache.get(key)
+        if D is not None:
+            _rotation_cache.move_to_end(key)
+            return D
+
+    D = miepy.cpp.vsh_rotation.vsh_rotation_matrix(lmax, components)
+    D.setflags(write=False)
+
+    if D.nbytes > rotation_cache_nbytes:
+        return D
+
+    with _rotation_cache_lock:
+        if key not in _rotation_cache:
+            _rotation_cache[key] = D
+            _rotation_cache_used += D.nbytes
+
+        while _rotation_cache_used > rotation_cache_nbytes:
+            _rotation_cache_used -= _rotation_cache.popitem(last=False)[1].nbytes
+
+    return D
+
+def vsh_rotation_operators(lmax, quat):
+    """Block-diagonal rotation operators of all multipole orders up to lmax for many quaternions,
+    computed in a single parallel call (not cached)
+
+    Arguments:
+        lmax    maximum multipole order
+        quat    array of quaternions [Q] (or their components [Q,4])
+
+    Returns:
+        Rotation operators D[Q,rmax,rmax]
+    """
+    components = np.atleast_2d(_quaternion_components(quat))
+    rmax = miepy.vsh.lmax_to_rmax(lmax)
+    D = miepy.cpp.vsh_rotation.vsh_rotation_matrices(lmax, components)
+
+    return D.reshape(-1, rmax, rmax)
 
 def vsh_rotation_matrix(n, quat):
     """Rotation matrix for a given multipole order
@@ -15,18 +93,10 @@ def vsh_rotation_matrix(n, quat):
     Returns:
         Rotation matrix R[2n+1,2n+1], such that p' = R*p
     """
-    import warnings
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        import spherical
-
-    l = 2*n + 1
-    R = spherical.wigner_D(quat.components, n, n).reshape((l,l))
+    rmax = miepy.vsh.lmax_to_rmax(n)
+    idx = np.s_[rmax-(2*n+1):rmax]
 
-    m = np.arange(-n, n+1)
-    R *= np.power(-1.0, np.subtract.outer(m, m))
-
-    return np.conj(R)
+    return vsh_rotation_operator(n, quat)[idx,idx]
 
 def rotate_expansion_coefficients(p_exp, quat):
     """Rotate a set of expansion coefficients to a new reference frame
@@ -38,18 +108,8 @@ def rotate_expansion_coefficients(p_exp, quat):
     Returns:
         The rotated expansion coefficients, p_rot[2,rmax]
     """
-    p_rot = np.empty_like(p_exp)
     rmax = p_exp.shape[-1]
     lmax = miepy.vsh.rmax_to_lmax(rmax)
+    D = vsh_rotation_operator(lmax, quat)
 
-    for n in range(1,lmax+1):
-        R = vsh_rotation_matrix(n, quat)
-        rmax = miepy.vsh.lmax_to_rmax(n)
-        idx = np.s_[rmax-(2*n+1):rmax]
-
-        if p_rot.ndim == 3:
-            p_rot[...,idx] = np.einsum('ab,Npb->Npa', R, p_exp[...,idx])
-        else:
-            p_rot[:,idx] = np.einsum('ab,pb->pa', R, p_exp[:,idx])
-
-    return p_rot
+    return np.matmul(p_exp, D.T)
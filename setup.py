@@ -27,13 +27,15 @@ REQUIRED = [
     'matplotlib',
     'tqdm',
     'sympy',
-    'pandas',
     'pyyaml',
     'numpy_quaternion',
-    'spherical',
     'vpython',
 ]
 
+EXTRAS = {
+    'test': ['pytest', 'spherical'],
+}
+
 
 def read(fname):
     return open(os.path.join(os.path.dirname(__file__), fname)).read()
@@ -140,6 +142,7 @@ setup(
     long_description=read('README.md'),
     long_description_content_type='text/markdown',
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     python_requires=REQUIRES_PYTHON,
     include_package_data = True,
     ext_modules=[CMakeExtension('miepy/cpp', './cpp')],
@@ -0,0 +1,8 @@
+import pytest
+import miepy
+
+@pytest.fixture(autouse=True)
+def disable_tmatrix_cache(monkeypatch, tmp_path):
+    """Tests never read or write the persistent T-matrix cache, unless they enable it themselves"""
+    monkeypatch.setattr(miepy.tmatrix.cache, 'enabled', False)
+    monkeypatch.setattr(miepy.tmatrix.cache, 'directory', str(tmp_path / 'tmatrix_cache'))
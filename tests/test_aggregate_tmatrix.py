@@ -0,0 +1,87 @@
+"""
+Tests for the aggregate T-matrix builders: block-sparse storage, interaction cutoffs,
+translation deduplication and incremental updates
+"""
+
+import numpy as np
+import pytest
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+lmax = 2
+
+position = [[-350*nm, 0, 0], [0, 120*nm, 0], [350*nm, 0, 40*nm], [0, -300*nm, 0]]
+
+def test_sparse_aggregate_tmatrix():
+    """block-sparse aggregate T-matrix without a cutoff equals the dense aggregate T-matrix"""
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in position]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax)
+    k = cluster.material_data.k_b
+    size = cluster.Nparticles*2*cluster.rmax
+
+    dense = miepy.interactions.particle_aggregate_tmatrix(cluster.position, cluster.tmatrix, k)
+    sparse = miepy.interactions.particle_sparse_aggregate_tmatrix(cluster.position, cluster.tmatrix, k)
+    assert np.allclose(miepy.interactions.to_bsr_matrix(sparse).toarray(), dense.reshape(size, size), rtol=0, atol=1e-15)
+    assert sparse.dropped_coupling == 0
+
+def test_interaction_cutoff():
+    """an interaction cutoff drops far pairs, with an error below the estimated dropped coupling"""
+    chain = [[i*1500*nm, 0, 0] for i in range(20)]
+    def chain_cluster(**kwargs):
+        return miepy.sphere_cluster(position=chain, radius=75*nm, material=Ag,
+                                    source=source, wavelength=wavelength, lmax=lmax, **kwargs)
+
+    dense = chain_cluster()
+    sparse = chain_cluster(cutoff=5000*nm)
+    dropped = sparse.solve_info.dropped_coupling
+
+    assert 0 < dropped < 1
+    error = np.max(np.abs(sparse.p_inc - dense.p_inc))/np.max(np.abs(dense.p_inc))
+    assert error < dropped
+
+    with pytest.raises(ValueError):
+        chain_cluster(cutoff=5000*nm, solver=miepy.solver.exact)
+
+def test_translation_deduplication():
+    """repeated pair displacements are translated once, without changing the aggregate T-matrix"""
+    grid = np.array([[i*450*nm, j*500*nm, 0] for i in range(4) for j in range(3)])
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in grid]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax)
+    k = cluster.material_data.k_b
+
+    agg_tmatrix, stats = miepy.interactions.particle_aggregate_tmatrix(grid, cluster.tmatrix, k, return_stats=True)
+    assert stats.pairs == 66
+    assert stats.unique_translations == (7*5 - 1)//2
+    assert 0 < stats.hit_rate < 1
+
+    # a tiny shift makes every displacement distinct
+    shifted = grid + np.random.uniform(-1e-3*nm, 1e-3*nm, size=grid.shape)
+    reference, stats = miepy.interactions.particle_aggregate_tmatrix(shifted, cluster.tmatrix, k, return_stats=True)
+    assert stats.hit_rate == 0
+    error = np.linalg.norm(agg_tmatrix - reference)/np.linalg.norm(reference)
+    assert error < 1e-4
+
+def test_update_aggregate_tmatrix():
+    """updating the blocks of the changed particles gives the rebuilt aggregate T-matrix"""
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in position]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax, interactions=False)
+    k = cluster.material_data.k_b
+    changed = np.array([False, True, False, True])
+    moved = np.copy(cluster.position)
+    moved[changed] += 50*nm
+
+    agg_tmatrix = miepy.interactions.particle_aggregate_tmatrix(cluster.position, cluster.tmatrix, k)
+    stats = miepy.interactions.particle_update_aggregate_tmatrix(agg_tmatrix, moved, cluster.tmatrix, k, changed)
+    expected = miepy.interactions.particle_aggregate_tmatrix(moved, cluster.tmatrix, k)
+    assert stats.pairs == 5
+    assert np.allclose(agg_tmatrix, expected, rtol=0, atol=1e-15)
+
+    particle_lmax = [2, 1, 2, 1]
+    agg_tmatrix = miepy.interactions.particle_aggregate_tmatrix(cluster.position, cluster.tmatrix, k, lmax=particle_lmax)
+    miepy.interactions.particle_update_aggregate_tmatrix(agg_tmatrix, moved, cluster.tmatrix, k, changed, lmax=particle_lmax)
+    expected = miepy.interactions.particle_aggregate_tmatrix(moved, cluster.tmatrix, k, lmax=particle_lmax)
+    assert np.allclose(agg_tmatrix, expected, rtol=0, atol=1e-15)
@@ -0,0 +1,62 @@
+"""
+Tests for incremental updates of the positions and orientations of the particles of a cluster
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+lmax = 2
+
+position = [[-350*nm, 0, 0], [0, 120*nm, 0], [350*nm, 0, 40*nm], [0, -300*nm, 0]]
+
+def test_incremental_update():
+    """updates that move or rotate some of the particles match newly built clusters"""
+    moved = np.array(position)
+    moved[2] += [30*nm, -20*nm, 10*nm]
+
+    cluster = miepy.sphere_cluster(position=position, radius=75*nm, material=Ag, source=source,
+                                   wavelength=wavelength, lmax=lmax)
+    cluster.update_position(moved)
+    expected = miepy.sphere_cluster(position=moved, radius=75*nm, material=Ag, source=source,
+                                    wavelength=wavelength, lmax=lmax)
+    assert np.allclose(cluster.p_src, expected.p_src, rtol=0, atol=1e-12)
+    assert np.allclose(cluster.p_inc, expected.p_inc, rtol=0, atol=1e-5*np.linalg.norm(expected.p_src))
+
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in position]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax,
+                            solver=miepy.solver.exact)
+    orientation = [p.orientation for p in cluster.particles]
+    orientation[1] = miepy.quaternion.from_spherical_coords(0.4, 0.2)
+    cluster.update(position=moved, orientation=orientation)
+
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag, orientation=q) for pos, q in zip(moved, orientation)]
+    expected = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax)
+    assert np.allclose(cluster.p_inc, expected.p_inc, rtol=0, atol=1e-5*np.linalg.norm(expected.p_src))
+
+def test_batched_tmatrix_rotation():
+    """batched rotation of the cluster T-matrices agrees with the analytic rotations about z (phases e^{-imφ})
+       and by π about y (m -> -m with sign (-1)^(n+m))"""
+    particles = [miepy.ellipsoid(pos, 60*nm, 80*nm, 100*nm, Ag) for pos in position]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax)
+    qz = lambda phi: miepy.quaternion.from_rotation_vector([0, 0, phi])
+    orientation = [qz(0.4), qz(0.4), qz(-1.1), miepy.quaternion.from_rotation_vector([0, np.pi, 0])]
+    cluster.update(orientation=orientation)
+
+    r, n, m = np.array(list(miepy.mode_indices(lmax))).T
+    flip = np.array([np.flatnonzero((n == ni) & (m == -mi))[0] for ni, mi in zip(n, m)])
+    sign = (-1.0)**(n + m)
+
+    for i, phi in enumerate([0.4, 0.4, -1.1]):
+        phase = np.exp(-1j*m*phi)
+        T = cluster.particles[i].tmatrix_fixed
+        expected = np.einsum('i,aibj,j->aibj', phase, T, phase.conj())
+        assert np.allclose(cluster.tmatrix[i], expected, rtol=0, atol=1e-14*np.max(np.abs(T)))
+
+    T = cluster.particles[3].tmatrix_fixed
+    expected = np.einsum('i,aibj,j->aibj', sign, T[:,flip][...,flip], sign)
+    assert np.allclose(cluster.tmatrix[3], expected, rtol=0, atol=1e-14*np.max(np.abs(T)))
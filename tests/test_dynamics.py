@@ -0,0 +1,86 @@
+"""
+Tests for the Langevin dynamics integrator
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+us = 1e-6
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave([1,0], amplitude=1e6)
+wavelength = 800*nm
+radius = 75*nm
+
+def dimer():
+    position = [[-300*nm, 0, 0], [300*nm, 0, 0]]
+    return miepy.sphere_cluster(position=position, radius=radius, material=Ag,
+                                source=source, wavelength=wavelength, lmax=2)
+
+def test_deterministic_drift():
+    """at zero temperature, every step moves the particles by F/drag*dt"""
+    cluster = dimer()
+    drag, _ = miepy.dynamics.stokes_drag(radius)
+    dt = 10*us
+    traj = miepy.dynamics.langevin(cluster, dt, 3, temperature=0)
+
+    assert traj.shape == (4,)
+    assert np.allclose(traj['time'], dt*np.arange(4))
+    for step in range(3):
+        expected = traj['position'][step] + traj['force'][step]/drag*dt
+        assert np.allclose(traj['position'][step+1], expected, rtol=0, atol=1e-4*nm)
+    assert np.allclose(traj['position'][-1], cluster.position)
+
+def test_seed_and_file_output(tmp_path):
+    """runs with the same seed are identical, and a file output holds the trajectory"""
+    filename = str(tmp_path / 'traj.npy')
+    first = miepy.dynamics.langevin(dimer(), 10*us, 3, seed=0, output=filename)
+    second = miepy.dynamics.langevin(dimer(), 10*us, 3, seed=0)
+
+    assert np.array_equal(first['position'], second['position'])
+    assert np.array_equal(np.load(filename), second)
+
+def test_preallocated_output():
+    """the trajectory is written into a preallocated array"""
+    output = np.zeros(5, dtype=miepy.dynamics.trajectory_dtype(2))
+    traj = miepy.dynamics.langevin(dimer(), 10*us, 3, seed=0, output=output)
+
+    assert traj is output
+    assert np.all(output['position'][3] != 0)
+    assert np.all(output['position'][4] == 0)
+
+def test_adaptive_stepping():
+    """adaptive steps limit the drift of each step"""
+    max_displacement = 0.1*nm
+    traj = miepy.dynamics.langevin(dimer(), 1, 3, temperature=0, adaptive=True,
+                                   max_displacement=max_displacement)
+
+    displacement = np.linalg.norm(np.diff(traj['position'], axis=0), axis=-1)
+    assert np.allclose(np.max(displacement, axis=1), max_displacement, rtol=1e-6)
+    assert np.all(np.diff(traj['time']) < 1)
+
+def test_rotation_diffusion():
+    """general particles rotate by thermal noise, with orientations kept normalized"""
+    cluster = miepy.cluster(particles=miepy.spheroid([0,0,0], 50*nm, 80*nm, material=Ag),
+                            source=source, wavelength=wavelength, lmax=2)
+    traj = miepy.dynamics.langevin(cluster, 10*us, 3, seed=0)
+
+    q = traj['orientation']
+    assert np.allclose(np.linalg.norm(q, axis=-1), 1)
+    assert not np.allclose(q[-1], q[0])
+
+def test_spheres_not_rotated():
+    """the orientations of a cluster of spheres are not integrated by default, and rotating spheres
+       leaves their interactions unchanged"""
+    particles = [miepy.sphere([x, 0, 0], radius, Ag) for x in [-300*nm, 300*nm]]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=2)
+    traj = miepy.dynamics.langevin(cluster, 10*us, 3, seed=0)
+    assert np.all(traj['orientation'] == traj['orientation'][0])
+
+    p_inc = cluster.p_inc.copy()
+    orientation = [miepy.quaternion.from_spherical_coords(0.4, 0.2)]*2
+    cluster.update(orientation=orientation)
+    assert not np.any(cluster._changed)
+    assert cluster.particles[0].orientation == orientation[0]
+    assert np.array_equal(cluster.p_inc, p_inc)
@@ -0,0 +1,40 @@
+"""
+Tests for the fast multipole operator and solver
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+lmax = 2
+
+position = [[-350*nm, 0, 0], [0, 120*nm, 0], [350*nm, 0, 40*nm], [0, -300*nm, 0]]
+
+def test_fmm_operator():
+    """fast multipole translations agree with the direct translations"""
+    np.random.seed(0)
+    N = 600
+    positions = np.random.uniform(-750*nm, 750*nm, size=(N,3))
+    k = 2*np.pi/wavelength
+    rmax = lmax*(lmax+2)
+    W = np.random.normal(size=(2, N*2*rmax)) + 1j*np.random.normal(size=(2, N*2*rmax))
+
+    fmm = miepy.cpp.interactions.fmm_operator(positions, lmax, k, 1e-6)
+    assert any(order > 0 for order in fmm.expansion_orders)
+
+    direct = np.array([miepy.cpp.interactions.translation_product(positions, lmax, k, w) for w in W])
+    error = np.linalg.norm(fmm.apply(W) - direct)/np.linalg.norm(direct)
+    assert error < 1e-5
+
+def test_fmm_sphere_cluster():
+    """fmm solver agrees with the dense solver for a cluster of spheres"""
+    kwargs = dict(position=position, radius=75*nm, material=Ag, source=source, wavelength=wavelength, lmax=lmax)
+    dense = miepy.sphere_cluster(**kwargs)
+    fmm = miepy.sphere_cluster(solver=miepy.solver.fmm, fmm_accuracy=1e-8, **kwargs)
+
+    assert np.allclose(dense.p_inc, fmm.p_inc, rtol=0, atol=1e-5)
+    assert np.allclose(dense.cross_sections(), fmm.cross_sections(), rtol=1e-6, atol=0)
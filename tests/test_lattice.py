@@ -0,0 +1,46 @@
+"""
+Tests for the lattice detection and the lattice solver
+"""
+
+import numpy as np
+import pytest
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+lmax = 2
+
+def test_lattice_sites():
+    """lattice detection recovers integer coordinates of a lattice with vacancies, and rejects other layouts"""
+    a = np.array([[600*nm, 0, 0], [300*nm, 520*nm, 0]])
+    sites = np.array([[i, j] for i in range(8) for j in range(6) if (i + j) % 5 != 2])
+    positions = sites @ a
+
+    found_sites, lattice_vectors = miepy.interactions.lattice_sites(positions)
+    assert lattice_vectors.shape == (2, 3)
+    assert np.allclose(found_sites @ lattice_vectors + positions[0], positions, rtol=0, atol=1e-15)
+
+    np.random.seed(0)
+    with pytest.raises(ValueError):
+        miepy.interactions.lattice_sites(np.random.uniform(-1000*nm, 1000*nm, size=(10,3)))
+
+def test_lattice_solver():
+    """lattice solver agrees with the dense solver for particles on a lattice"""
+    chain = [[i*450*nm, 0, 0] for i in range(12)]
+    grid = [[i*450*nm, j*500*nm, 0] for i in range(4) for j in range(3)]
+
+    for layout in [chain, grid]:
+        dense = miepy.sphere_cluster(position=layout, radius=75*nm, material=Ag,
+                                     source=source, wavelength=wavelength, lmax=lmax)
+        lattice = miepy.sphere_cluster(position=layout, radius=75*nm, material=Ag,
+                                       source=source, wavelength=wavelength, lmax=lmax, solver=miepy.solver.lattice)
+        assert np.allclose(dense.p_inc, lattice.p_inc, rtol=0, atol=1e-5)
+
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in grid]
+    dense = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax)
+    lattice = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax,
+                            solver=miepy.solver.lattice)
+    assert np.allclose(dense.p_inc, lattice.p_inc, rtol=0, atol=1e-5)
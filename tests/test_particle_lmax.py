@@ -0,0 +1,60 @@
+"""
+Tests for clusters with per-particle lmax
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+
+position = [[-350*nm, 0, 0], [0, 120*nm, 0], [350*nm, 0, 40*nm], [0, -300*nm, 0]]
+
+def test_ragged_aggregate_tmatrix():
+    """the aggregate T-matrix with per-particle lmax is the uniform one without the truncated modes"""
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in position]
+    particle_lmax = [3, 1, 2, 3]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength,
+                            lmax=particle_lmax, interactions=False)
+    k = cluster.material_data.k_b
+
+    uniform = miepy.interactions.particle_aggregate_tmatrix(cluster.position, cluster.tmatrix, k)
+    ragged = miepy.interactions.particle_aggregate_tmatrix(cluster.position, cluster.tmatrix, k, lmax=particle_lmax)
+
+    offsets = miepy.interactions.ragged_offsets(particle_lmax)
+    assert ragged.shape == (offsets[-1], offsets[-1])
+
+    # indices of the ragged coefficients in the uniform layout
+    Nparticles, _, rmax = uniform.shape[:3]
+    keep = miepy.interactions.to_ragged(np.arange(Nparticles*2*rmax).reshape([Nparticles,2,rmax]), particle_lmax)
+    uniform = uniform.reshape([Nparticles*2*rmax, -1])
+    assert np.allclose(ragged, uniform[np.ix_(keep, keep)], rtol=0, atol=1e-14*np.abs(uniform).max())
+
+def test_ragged_cluster():
+    """per-particle lmax solves the reduced system, agreeing with the padded solvers"""
+    particles = [miepy.sphere(pos, 75*nm, Ag) for pos in position]
+    particles[0] = miepy.sphere(position[0], 200*nm, Ag)
+    particle_lmax = [4, 2, 2, 2]
+
+    kwargs = dict(source=source, wavelength=wavelength, lmax=particle_lmax)
+    ragged = miepy.cluster(particles=particles, **kwargs)
+    exact = miepy.cluster(particles=particles, solver=miepy.solver.exact, **kwargs)
+    padded = miepy.cluster(particles=particles, solver=miepy.solver.matrix_free, **kwargs)
+    uniform = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=4)
+
+    assert ragged.p_inc.shape == uniform.p_inc.shape
+    assert np.all(ragged.p_scat[1:,:,miepy.vsh.lmax_to_rmax(2):] == 0)
+    atol = 1e-5*np.linalg.norm(exact.p_src)
+    assert np.allclose(ragged.p_inc, exact.p_inc, rtol=0, atol=atol)
+    assert np.allclose(ragged.p_inc, padded.p_inc, rtol=0, atol=atol)
+
+    C_ragged = ragged.cross_sections()
+    C_uniform = uniform.cross_sections()
+    assert np.allclose(C_ragged, C_uniform, rtol=1e-3, atol=0)
+
+    E_ragged = ragged.E_field(0, 0, 500*nm)
+    E_uniform = uniform.E_field(0, 0, 500*nm)
+    assert np.allclose(E_ragged, E_uniform, rtol=1e-2, atol=0)
@@ -0,0 +1,176 @@
+"""
+Tests for the different linear solvers of the interaction equations
+"""
+
+import numpy as np
+import pytest
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+lmax = 2
+
+position = [[-350*nm, 0, 0], [0, 120*nm, 0], [350*nm, 0, 40*nm], [0, -300*nm, 0]]
+
+def sphere_cluster(source=source, position=position, **kwargs):
+    return miepy.sphere_cluster(position=position,
+                                radius=75*nm,
+                                material=Ag,
+                                source=source,
+                                wavelength=wavelength,
+                                lmax=lmax,
+                                **kwargs)
+
+def particle_cluster(source=source, position=position, **kwargs):
+    particles = [miepy.spheroid(pos, 70*nm, 100*nm, Ag) for pos in position]
+    return miepy.cluster(particles=particles,
+                         source=source,
+                         wavelength=wavelength,
+                         lmax=lmax,
+                         **kwargs)
+
+def test_matrix_free_sphere_cluster():
+    """matrix-free solver agrees with the dense solver for a cluster of spheres"""
+    dense = sphere_cluster()
+    matrix_free = sphere_cluster(solver=miepy.solver.matrix_free)
+
+    assert np.allclose(dense.p_inc, matrix_free.p_inc, rtol=0, atol=1e-5)
+    assert np.allclose(dense.cross_sections(), matrix_free.cross_sections(), rtol=1e-6, atol=0)
+
+def test_matrix_free_particle_cluster():
+    """matrix-free solver agrees with the dense solver for a cluster of non-spherical particles"""
+    dense = particle_cluster()
+    matrix_free = particle_cluster(solver=miepy.solver.matrix_free)
+
+    assert np.allclose(dense.p_inc, matrix_free.p_inc, rtol=0, atol=1e-5)
+    F1, F2 = dense.force(), matrix_free.force()
+    assert np.allclose(F1, F2, rtol=0, atol=1e-5*np.max(np.abs(F1)))
+
+def test_warm_start_update():
+    """updating the positions warm starts the solver from the previous solution"""
+    cluster = sphere_cluster()
+    cold_iterations = cluster.solve_info.iterations
+
+    new_position = np.array(position) + np.array([2*nm, -1*nm, 0])
+    cluster.update_position(new_position)
+    warm_iterations = cluster.solve_info.iterations
+
+    cold = miepy.sphere_cluster(position=new_position,
+                                radius=75*nm,
+                                material=Ag,
+                                source=source,
+                                wavelength=wavelength,
+                                lmax=lmax)
+
+    assert warm_iterations < cold_iterations
+    assert np.allclose(cluster.p_inc, cold.p_inc, rtol=0, atol=1e-5)
+
+def test_solve_sources():
+    """solving several sources at once agrees with solving each source separately"""
+    sources = [miepy.sources.plane_wave.from_string(polarization=pol) for pol in ['x', 'y', 'rhc']]
+
+    for cluster_type in [sphere_cluster, particle_cluster]:
+        solutions = cluster_type().solve_sources(sources)
+
+        for src, solution in zip(sources, solutions):
+            single = cluster_type(source=src)
+
+            assert np.allclose(solution.p_scat, single.p_scat, rtol=0, atol=1e-5)
+            assert np.allclose(solution.cross_sections(), single.cross_sections(), rtol=1e-6, atol=0)
+            F1, F2 = single.force(), solution.force()
+            assert np.allclose(F1, F2, rtol=0, atol=1e-5*np.max(np.abs(F1)))
+
+def test_exact_solver():
+    """exact solver agrees with the iterative solver and reuses its factorization for a new source"""
+    iterative = sphere_cluster()
+    exact = sphere_cluster(solver=miepy.solver.exact)
+    assert np.allclose(iterative.p_inc, exact.p_inc, rtol=0, atol=1e-5*np.linalg.norm(exact.p_src))
+
+    factorization = exact._factorization
+    exact.source = miepy.sources.plane_wave.from_string(polarization='x')
+    exact.solve()
+    assert exact._factorization is factorization
+    assert np.allclose(exact.p_inc, sphere_cluster(source=exact.source).p_inc, rtol=0,
+                       atol=1e-5*np.linalg.norm(exact.p_src))
+
+    exact.update_position(np.array(position) + 5*nm)
+    assert exact._factorization is not factorization
+
+def test_solve_info():
+    """the solve report records convergence, and a failure to converge raises a warning"""
+    cluster = sphere_cluster()
+    info = cluster.solve_info
+
+    assert info.converged
+    assert len(info.residual_history) == info.iterations + 1
+    assert info.residual == info.residual_history[-1]
+    assert info.build_time > 0 and info.solve_time > 0
+
+    with pytest.warns(RuntimeWarning):
+        cluster = sphere_cluster(maxiter=1, tolerance=1e-12)
+
+    assert not cluster.solve_info.converged
+    assert cluster.solve_info.iterations == 1
+
+@pytest.mark.parametrize('solver', [miepy.solver.bicgstab, miepy.solver.matrix_free,
+                                    miepy.solver.fmm, miepy.solver.lattice])
+def test_residual_relative_to_source(solver):
+    """the tolerance applies to the residual relative to |p_src|: scaling the source amplitude far from 1
+       scales the solution but not the iterations, the residual or the convergence"""
+    reference = sphere_cluster(solver=solver)
+
+    for amplitude in [1e-6, 1e6]:
+        scaled_source = miepy.sources.plane_wave.from_string(polarization='rhc', amplitude=amplitude)
+        cluster = sphere_cluster(source=scaled_source, solver=solver)
+        info = cluster.solve_info
+
+        assert info.converged and info.residual < cluster.tolerance
+        assert info.iterations == reference.solve_info.iterations
+        assert np.isclose(info.residual, reference.solve_info.residual, rtol=1e-3, atol=0)
+        assert np.allclose(cluster.p_inc/amplitude, reference.p_inc, rtol=0, atol=1e-9)
+
+@pytest.mark.parametrize('solver', [miepy.solver.bicgstab, miepy.solver.matrix_free,
+                                    miepy.solver.fmm, miepy.solver.lattice])
+@pytest.mark.parametrize('cluster_type', [sphere_cluster, particle_cluster])
+def test_maxiter_exhausted(solver, cluster_type):
+    """every iterative solver stops after maxiter iterations, warns and reports the failure to converge"""
+    converged = cluster_type(solver=solver)
+
+    with pytest.warns(RuntimeWarning, match='did not converge in 3 iterations'):
+        cluster = cluster_type(solver=solver, maxiter=3, tolerance=1e-14)
+
+    info = cluster.solve_info
+    assert not info.converged
+    assert info.iterations == 3
+    assert len(info.residual_history) == 4
+    assert info.residual > 1e-14
+    assert np.all(np.isfinite(cluster.p_inc))
+
+    # the unconverged solution is an approximation that later solves warm start from
+    assert np.linalg.norm(cluster.p_inc - converged.p_inc) < np.linalg.norm(converged.p_inc - converged.p_src)
+    cluster.maxiter = 1000
+    cluster.tolerance = 1e-5
+    cluster.solve()
+    assert cluster.solve_info.converged
+    assert np.allclose(cluster.p_inc, converged.p_inc, rtol=0, atol=1e-5*np.linalg.norm(cluster.p_src))
+
+@pytest.mark.parametrize('solver', [miepy.solver.bicgstab, miepy.solver.matrix_free, miepy.solver.exact,
+                                    miepy.solver.fmm, miepy.solver.lattice])
+def test_single_particle(solver):
+    """a cluster of a single particle has no interactions: every solver returns the source coefficients"""
+    for cluster_type in [sphere_cluster, particle_cluster]:
+        cluster = cluster_type(solver=solver, position=[[0, 0, 0]])
+        single = cluster_type(interactions=False, position=[[0, 0, 0]])
+
+        assert cluster.solve_info.converged
+        assert cluster.solve_info.iterations == 0
+        assert np.allclose(cluster.p_inc, cluster.p_src, rtol=0, atol=1e-15)
+        assert np.allclose(cluster.cross_sections(), single.cross_sections(), rtol=1e-12, atol=0)
+
+    solutions = sphere_cluster(solver=solver, position=[[0, 0, 0]]).solve_sources(
+                    [source, miepy.sources.plane_wave.from_string(polarization='x')])
+    for solution in solutions:
+        assert np.allclose(solution.p_inc, solution.p_src, rtol=0, atol=1e-15)
@@ -4,6 +4,7 @@ Tests for rotation of incident source expansion coefficients
 
 import numpy as np
 import miepy
+import pytest
 
 nm = 1e-9
 um = 1e-6
@@ -39,3 +40,79 @@ def test_plane_wave_rotation():
     L2 = np.sqrt(np.sum(np.abs(E1 - E2)**2))/np.product(X.shape)
     avg = np.average(np.abs(E1) + np.abs(E2))/2
     assert L2 < 7e-6*avg
+
+def test_vsh_rotation_operator():
+    """
+    Wigner-D rotation operators: agree with the spherical package, batched operators agree
+    with single ones, and the inverse rotation undoes the rotation
+    """
+    spherical = pytest.importorskip('spherical')
+
+    lmax = 6
+    rng = np.random.default_rng(0)
+    quats = [miepy.quaternion.from_rotation_vector(v) for v in rng.normal(size=(4,3))]
+    quats += [miepy.quaternion.one, miepy.quaternion.from_rotation_vector([0, np.pi, 0])]
+
+    D = miepy.vsh.vsh_rotation_operators(lmax, quats)
+    for i, quat in enumerate(quats):
+        assert np.allclose(D[i], miepy.vsh.vsh_rotation_operator(lmax, quat))
+
+        for n in range(1, lmax+1):
+            m = np.arange(-n, n+1)
+            expected = spherical.wigner_D(quat.components, n, n).reshape((2*n+1, 2*n+1))
+            expected = np.conj(expected*np.power(-1.0, np.subtract.outer(m, m)))
+            assert np.allclose(miepy.vsh.vsh_rotation_matrix(n, quat), expected)
+
+        p = rng.normal(size=(2, D.shape[-1])) + 1j*rng.normal(size=(2, D.shape[-1]))
+        p_rot = miepy.vsh.rotate_expansion_coefficients(p, quat)
+        assert np.allclose(miepy.vsh.rotate_expansion_coefficients(p_rot, quat.inverse()), p)
+
+def test_vsh_rotation_operator_reference():
+    """
+    Wigner-D rotation operators without a reference package: closed-form n=1 matrices of z-y-z rotations,
+    unitarity, and the composition D(q1)D(q2) = D(q1*q2)
+    """
+    lmax = 6
+    rng = np.random.default_rng(1)
+    qz = lambda angle: miepy.quaternion.from_rotation_vector([0, 0, angle])
+    qy = lambda angle: miepy.quaternion.from_rotation_vector([0, angle, 0])
+
+    for alpha, beta, gamma in rng.uniform(-np.pi, np.pi, size=(4,3)):
+        c, s = np.cos(beta), np.sin(beta)/np.sqrt(2)
+        d = np.array([[(1 + c)/2, -s, (1 - c)/2],
+                      [s, c, -s],
+                      [(1 - c)/2, s, (1 + c)/2]])
+        m = np.arange(-1, 2)
+        expected = np.exp(-1j*m*alpha)[:,np.newaxis]*d*np.exp(-1j*m*gamma)
+
+        quat = qz(alpha)*qy(beta)*qz(gamma)
+        assert np.allclose(miepy.vsh.vsh_rotation_matrix(1, quat), expected, rtol=0, atol=1e-14)
+
+    q1, q2 = [miepy.quaternion.from_rotation_vector(v) for v in rng.normal(size=(2,3))]
+    D1 = miepy.vsh.vsh_rotation_operator(lmax, q1)
+    D2 = miepy.vsh.vsh_rotation_operator(lmax, q2)
+    D12 = miepy.vsh.vsh_rotation_operator(lmax, q1*q2)
+
+    assert np.allclose(D1 @ D1.conj().T, np.identity(len(D1)), rtol=0, atol=1e-13)
+    assert np.allclose(D1 @ D2, D12, rtol=0, atol=1e-13)
+
+def test_vsh_rotation_cache_nbytes(monkeypatch):
+    """the cache of rotation operators is bounded by the total size of the operators"""
+    rotation = miepy.vsh.vsh_rotation
+    lmax = 6
+    quats = [miepy.quaternion.from_rotation_vector([0.1*i, 0, 0.2]) for i in range(1, 6)]
+    nbytes = miepy.vsh.vsh_rotation_operator(lmax, quats[0]).nbytes
+
+    miepy.vsh.clear_rotation_cache()
+    monkeypatch.setattr(rotation, 'rotation_cache_nbytes', 3*nbytes)
+    operators = [miepy.vsh.vsh_rotation_operator(lmax, quat) for quat in quats]
+
+    assert len(rotation._rotation_cache) == 3
+    assert rotation._rotation_cache_used == 3*nbytes
+    assert miepy.vsh.vsh_rotation_operator(lmax, quats[-1]) is operators[-1]
+    assert miepy.vsh.vsh_rotation_operator(lmax, quats[0]) is not operators[0]
+
+    # an operator larger than the whole cache is not cached
+    miepy.vsh.vsh_rotation_operator(lmax + 4, quats[0])
+    assert rotation._rotation_cache_used <= 3*nbytes
+    miepy.vsh.clear_rotation_cache()
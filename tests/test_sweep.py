@@ -0,0 +1,96 @@
+"""
+Tests for spectral sweeps
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave([1,0])
+position = [[-100*nm, 0, 0], [100*nm, 0, 0], [0, 150*nm, 50*nm]]
+wavelengths = np.linspace(400*nm, 800*nm, 5)
+
+def sphere_cluster(wavelength):
+    return miepy.sphere_cluster(position=position, radius=75*nm, material=Ag, source=source,
+                                wavelength=wavelength, lmax=3)
+
+def particle_cluster(wavelength):
+    particles = [miepy.spheroid(pos, 70*nm, 90*nm, Ag) for pos in position]
+    return miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=3)
+
+def test_sweep_matches_new_clusters():
+    """a sweep of one cluster agrees with new clusters built at every wavelength"""
+    for build in [sphere_cluster, particle_cluster]:
+        result = build(wavelengths[0]).spectrum(wavelengths, quantities=['cross_sections', 'force'])
+
+        for i, wavelength in enumerate(wavelengths):
+            expected = build(wavelength)
+            C = expected.cross_sections()
+            assert np.allclose(result['cross_sections'].extinction[i], C.extinction, rtol=1e-4, atol=0)
+            assert np.allclose(result['cross_sections'].scattering[i], C.scattering, rtol=1e-4, atol=0)
+            assert np.allclose(result['force'][i], expected.force(), rtol=1e-3, atol=1e-4*np.max(np.abs(expected.force())))
+
+def test_sweep_custom_quantities():
+    """a sweep evaluates a dict of custom quantities, which agree with new clusters built at every wavelength"""
+    theta = np.linspace(0, np.pi, 4)
+    quantities = {'E_far': lambda cluster: cluster.E_angular(theta, np.zeros_like(theta)),
+                  'p_scat': lambda cluster: cluster.p_scat}
+    result = miepy.sweep.spectrum(sphere_cluster(wavelengths[0]), wavelengths, quantities)
+
+    assert result['E_far'].shape == (len(wavelengths), 2, len(theta))
+    for i, wavelength in enumerate(wavelengths):
+        expected = sphere_cluster(wavelength)
+        for name, f in quantities.items():
+            value = f(expected)
+            assert np.allclose(result[name][i], value, rtol=0, atol=1e-4*np.max(np.abs(value)))
+
+def drude(wavelength):
+    energy = 1239.84193*nm/wavelength
+    return 5 - 9**2/(energy**2 + 0.05j*energy)
+
+def test_adaptive_spectrum():
+    """an adaptive spectrum of a smooth resonance converges to an interpolant that agrees with direct solves"""
+    cluster = miepy.sphere_cluster(position=position[:2], radius=75*nm, material=miepy.function_material(drude),
+                                   source=source, wavelength=400*nm, lmax=3)
+    sampled, values, interpolant = cluster.adaptive_spectrum(300*nm, 900*nm, tolerance=1e-3)
+
+    assert len(sampled) < 100
+    assert np.all(np.diff(sampled) > 0)
+    assert np.allclose(interpolant(sampled).extinction, values.extinction)
+
+    test = np.linspace(300*nm, 900*nm, 31)
+    expected = cluster.spectrum(test)['cross_sections']
+    for field in expected._fields:
+        exact = getattr(expected, field)
+        assert np.max(np.abs(getattr(interpolant(test), field) - exact)) < 1e-3*np.max(np.abs(exact))
+
+def test_interpolated_tmatrix_sweep():
+    """a sweep with interpolated T-matrices agrees with exact T-matrices, with fewer T-matrix computations"""
+    material = miepy.function_material(drude)
+    sweep = np.linspace(450*nm, 850*nm, 41)
+
+    def cluster(interpolate):
+        particles = [miepy.spheroid(pos, 60*nm, 90*nm, material) for pos in position]
+        if interpolate:
+            interpolant = particles[0].interpolate_tmatrix(sweep[0], sweep[-1], 2, 1, tolerance=1e-5)
+            assert interpolant.converged and len(interpolant.wavelengths) < len(sweep)
+        return miepy.cluster(particles=particles, source=source, wavelength=sweep[0], lmax=2)
+
+    exact = cluster(False).spectrum(sweep)['cross_sections'].extinction
+    interpolated = cluster(True).spectrum(sweep)['cross_sections'].extinction
+    assert np.allclose(interpolated, exact, rtol=1e-4, atol=0)
+
+def test_interpolated_tmatrix_not_shared_with_exact():
+    """a particle with an interpolated T-matrix is not identified with an identical particle with an exact T-matrix"""
+    material = miepy.function_material(drude)
+    particles = [miepy.spheroid(pos, 60*nm, 90*nm, material) for pos in position[:2]]
+    interpolant = particles[1].interpolate_tmatrix(450*nm, 850*nm, 2, 1, tolerance=1e-3)
+    assert particles[0]._dict_key(600*nm) != particles[1]._dict_key(600*nm)
+
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=600*nm, lmax=2)
+    exact = miepy.spheroid(position[0], 60*nm, 90*nm, material).compute_tmatrix(2, 600*nm, 1)
+    assert np.allclose(cluster.tmatrix[0], exact, rtol=0, atol=1e-14*np.max(np.abs(exact)))
+    assert np.allclose(cluster.tmatrix[1], interpolant(600*nm), rtol=0, atol=1e-14*np.max(np.abs(exact)))
+    assert not np.allclose(cluster.tmatrix[1], exact, rtol=0, atol=1e-10*np.max(np.abs(exact)))
@@ -1,6 +1,7 @@
 import numpy as np
 import miepy
 import pytest
+from functools import partial
 
 nm = 1e-9
 
@@ -118,3 +119,65 @@ def test_sphere_cluster_tmatrix_particle():
 
     assert np.allclose(C1, C2, rtol=7e-4, atol=0), 'equal cross-sections'
     assert np.allclose(p1, p2, rtol=1e-2, atol=1e-12), 'equal cluster scattering coefficients'
+
+def test_compute_many(monkeypatch):
+    """concurrent NFM-DS jobs return the T-matrices in request order, also when building a cluster"""
+    monkeypatch.setattr(miepy.tmatrix.cache, 'enabled', False)
+    wavelengths = np.linspace(500*nm, 700*nm, 4)
+    requests = [partial(miepy.tmatrix.tmatrix_spheroid, 50*nm, 80*nm, wav, 4+0.1j, eps_b, lmax)
+                for wav in wavelengths]
+
+    serial = miepy.tmatrix.compute_many(requests, workers=1)
+    parallel = miepy.tmatrix.compute_many(requests, workers=3)
+    for T1, T2 in zip(serial, parallel):
+        assert np.array_equal(T1, T2)
+
+    particles = [miepy.spheroid([300*nm*i, 0, 0], radius + 5*nm*(i % 3), 2*radius, Ag) for i in range(5)]
+    clusters = [miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax,
+                              medium=medium, tmatrix_workers=workers) for workers in (1, 3)]
+    assert np.array_equal(clusters[0].tmatrix, clusters[1].tmatrix)
+
+def test_compute_many_serial_fallback(monkeypatch):
+    """analytic T-matrices and single numerical T-matrices are computed without a thread pool"""
+    monkeypatch.setattr(miepy.tmatrix.get_tmatrix, 'ThreadPoolExecutor', None)
+
+    particles = [miepy.sphere([300*nm*i, 0, 0], radius + 5*nm*i, Ag) for i in range(3)]
+    particles.append(miepy.spheroid([0, 300*nm, 0], radius, 2*radius, Ag))
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=lmax,
+                            medium=medium, tmatrix_workers=4)
+
+    for particle, tmatrix in zip(particles, cluster.tmatrix):
+        assert np.array_equal(tmatrix, particle.tmatrix)
+
+def test_read_nfmds_tmatrix(tmp_path):
+    """NFM-DS T-matrix files are read as complex entries in file order, including ragged final rows"""
+    filename = str(tmp_path / 'tmatrix.dat')
+    with open(filename, 'w') as f:
+        f.write('  Half - Dimensions of the T Matrix:\n           1           1\n  T Matrix:\n')
+        f.write('    1.0E+00   -2.5E-01    0.0E+00    3.0E-20\n')
+        f.write('   -4.0E+00    5.0E+00\n')
+
+    data = miepy.tmatrix.get_tmatrix.read_nfmds_tmatrix(filename)
+    assert np.array_equal(data, [1 - 0.25j, 3e-20j, -4 + 5j])
+
+def test_ebcm_sphere_is_mie():
+    """EBCM T-matrix of a sphere, with and without axial symmetry, equals the Mie T-matrix"""
+    eps = Ag.eps(wavelength).item()
+    T_mie = miepy.tmatrix.tmatrix_sphere(radius, wavelength, eps, eps_b, lmax)
+    surface = miepy.tmatrix.spheroid_surface(radius, radius)
+
+    for axisymmetric in [True, False]:
+        T = miepy.tmatrix.tmatrix_ebcm(surface, wavelength, eps, eps_b, lmax, axisymmetric=axisymmetric)
+        assert np.allclose(T, T_mie, rtol=0, atol=1e-12)
+
+def test_ebcm_equals_nfmds():
+    """EBCM T-matrices of spheroids and ellipsoids agree with NFM-DS"""
+    eps = 4 + 0.5j
+    T1 = miepy.tmatrix.tmatrix_ellipsoid(50*nm, 65*nm, 80*nm, wavelength, eps, eps_b, lmax)
+    T2 = miepy.tmatrix.tmatrix_ebcm(miepy.tmatrix.ellipsoid_surface(50*nm, 65*nm, 80*nm), wavelength, eps, eps_b, lmax)
+    assert np.allclose(T1, T2, rtol=0, atol=1e-9)
+
+    particles = [miepy.ellipsoid([0,0,0], radius, radius, 1.5*radius, Ag),
+                 miepy.spheroid([0,0,0], radius, 1.5*radius, Ag, tmatrix_method='ebcm')]
+    T1, T2 = (particle.compute_tmatrix(lmax, wavelength, eps_b) for particle in particles)
+    assert np.allclose(T1, T2, rtol=0, atol=1e-9*np.max(np.abs(T1)))
@@ -0,0 +1,88 @@
+"""
+Tests for the persistent T-matrix cache
+"""
+
+import os
+import numpy as np
+import miepy
+import pytest
+
+nm = 1e-9
+cache = miepy.tmatrix.cache
+
+@pytest.fixture
+def cache_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'enabled', True)
+    monkeypatch.setattr(cache, 'directory', str(tmp_path))
+    return tmp_path
+
+def spheroid_tmatrix(wavelength):
+    return miepy.tmatrix.tmatrix_spheroid(50*nm, 80*nm, wavelength, 4+0.1j, 1.33**2, 2)
+
+def test_cached_tmatrix_is_reused(cache_directory, monkeypatch):
+    """a repeated T-matrix is loaded from the cache without running NFM-DS"""
+    T = spheroid_tmatrix(600*nm)
+    assert len(os.listdir(cache_directory)) == 1
+
+    monkeypatch.setattr(miepy.tmatrix.get_tmatrix.subprocess, 'Popen', None)
+    assert np.array_equal(spheroid_tmatrix(600*nm), T)
+
+def test_key_depends_on_parameters():
+    """keys differ for any change of the solver parameters, including tiny ones"""
+    kwargs = dict(geometry_parameters=[50*nm, 80*nm], wavelength=600*nm, index=2+0.1j, Nint=200)
+    key = cache.tmatrix_key('AXSYM', 4, kwargs, False)
+
+    assert key == cache.tmatrix_key('AXSYM', 4, dict(reversed(list(kwargs.items()))), False)
+    assert key != cache.tmatrix_key('AXSYM', 4, dict(kwargs, wavelength=600*nm*(1 + 1e-15)), False)
+    assert key != cache.tmatrix_key('AXSYM', 4, dict(kwargs, Nint=300), False)
+    assert key != cache.tmatrix_key('AXSYM', 5, kwargs, False)
+    assert key != cache.tmatrix_key('AXSYM', 4, kwargs, True)
+
+def test_key_depends_on_executable(tmp_path):
+    """keys differ for NFM-DS executables of different content"""
+    kwargs = dict(geometry_parameters=[50*nm, 80*nm], wavelength=600*nm, index=2+0.1j, Nint=200)
+    executable = tmp_path / 'tmatrix'
+    executable.write_bytes(b'version 1')
+    key = cache.tmatrix_key('AXSYM', 4, kwargs, False, executable=str(executable))
+
+    assert key != cache.tmatrix_key('AXSYM', 4, kwargs, False)
+
+    executable.write_bytes(b'version 2 of the solver')
+    assert key != cache.tmatrix_key('AXSYM', 4, kwargs, False, executable=str(executable))
+
+def test_disabled_cache_is_not_written(tmp_path):
+    """no files are written while the cache is disabled"""
+    spheroid_tmatrix(600*nm)
+    assert not cache.enabled
+    assert not os.path.exists(cache.directory)
+
+def test_lru_eviction(cache_directory):
+    """the least recently used T-matrices are evicted when the cache is full"""
+    T = np.zeros((2, 8, 2, 8), dtype=complex)
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.store(key, T)
+        os.utime(cache_directory / (key + '.npy'), (i, i))
+
+    assert cache.load('a') is not None
+    cache.evict(size=2*cache.cache_size()//3)
+    assert sorted(os.listdir(cache_directory)) == ['a.npy', 'c.npy']
+
+    cache.clear_tmatrix_cache()
+    assert cache.load('a') is None
+
+def test_store_tracks_size(cache_directory, monkeypatch):
+    """stores track the size of the cache, scanning the directory only once and again when it is full"""
+    T = np.zeros((2, 8, 2, 8), dtype=complex)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: scans.append(1) or entries())
+
+    for key in ['a', 'b', 'c', 'b']:
+        cache.store(key, T)
+    assert len(scans) == 1
+    assert cache._tracked_size[cache.directory] == cache.cache_size()
+
+    monkeypatch.setattr(cache, 'max_size', cache.cache_size())
+    cache.store('d', T)
+    assert len(os.listdir(cache_directory)) == 3
+    assert cache._tracked_size[cache.directory] == cache.cache_size()
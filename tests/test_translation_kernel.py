@@ -0,0 +1,52 @@
+"""
+Tests for the rotation (point-and-shoot) translation kernel and the Wigner d-matrices it uses
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave.from_string(polarization='rhc')
+wavelength = 700*nm
+lmax = 2
+
+position = [[-350*nm, 0, 0], [0, 120*nm, 0], [350*nm, 0, 40*nm], [0, -300*nm, 0]]
+
+def test_rotation_translation_kernel():
+    """rotation (point-and-shoot) translations agree with the direct translations"""
+    kernel = miepy.translation_kernel
+    k = 2*np.pi/wavelength
+
+    for lmax_test in [1, 3, 6]:
+        for rad, theta, phi in [(400*nm, 0.7, 0.4), (400*nm, 0, 0), (600*nm, np.pi, 0), (300*nm, 2.5, -2.0)]:
+            direct = miepy.cpp.vsh_translation.vsh_translation_block(lmax_test, rad, theta, phi, k, kernel.direct)
+            rotation = miepy.cpp.vsh_translation.vsh_translation_block(lmax_test, rad, theta, phi, k, kernel.rotation)
+            for A, B in zip(direct, rotation):
+                assert np.linalg.norm(A - B) < 1e-12*np.linalg.norm(A)
+
+    np.random.seed(0)
+    positions = np.random.uniform(-750*nm, 750*nm, size=(10,3))
+    rmax = 4*(4+2)
+    w = np.random.normal(size=10*2*rmax) + 1j*np.random.normal(size=10*2*rmax)
+    direct = miepy.cpp.interactions.translation_product(positions, 4, k, w, kernel.direct)
+    rotation = miepy.cpp.interactions.translation_product(positions, 4, k, w, kernel.rotation)
+    assert np.linalg.norm(direct - rotation) < 1e-12*np.linalg.norm(direct)
+
+    kwargs = dict(position=position, radius=75*nm, material=Ag, source=source, wavelength=wavelength, lmax=lmax)
+    dense = miepy.sphere_cluster(**kwargs)
+    matrix_free = miepy.sphere_cluster(solver=miepy.solver.matrix_free, translation=kernel.rotation, **kwargs)
+    assert np.allclose(dense.p_inc, matrix_free.p_inc, rtol=0, atol=1e-5)
+
+def test_wigner_d():
+    """Wigner d-matrices are orthogonal with the known values for n = 1"""
+    beta = 1.1
+    d = miepy.cpp.special.wigner_d(8, beta)
+
+    for n in range(9):
+        assert np.allclose(d[n] @ d[n].T, np.eye(2*n+1), rtol=0, atol=1e-13)
+
+    assert np.isclose(d[1][1,1], np.cos(beta))
+    assert np.isclose(d[1][2,1], -np.sin(beta)/np.sqrt(2))
+    assert np.isclose(d[1][2,2], (1 + np.cos(beta))/2)
@@ -0,0 +1,85 @@
+"""
+Tests for the automatic selection of lmax and the truncation error estimates
+"""
+
+import numpy as np
+import miepy
+
+nm = 1e-9
+
+Ag = miepy.materials.Ag()
+source = miepy.sources.plane_wave([1,0])
+wavelength = 600*nm
+radius = 40*nm
+
+def dimer(gap, lmax):
+    position = [[-radius - gap/2, 0, 0], [radius + gap/2, 0, 0]]
+    return miepy.sphere_cluster(position=position, radius=radius, material=Ag,
+                                source=source, wavelength=wavelength, lmax=lmax)
+
+def test_wiscombe_lmax():
+    """Wiscombe's criterion in its three size parameter ranges"""
+    x = np.array([1, 8, 100, 5000])
+    expected = np.rint([x[0] + 4 + 1, x[1] + 8 + 1, x[2] + 4.05*100**(1/3) + 2, x[3] + 4*5000**(1/3) + 2])
+    assert np.all(miepy.truncation.wiscombe_lmax(x) == expected)
+
+def test_size_lmax():
+    """small particles need fewer orders than Wiscombe's criterion, and never fewer than 2"""
+    x = np.array([0.01, 0.3, 0.8, 1, 20])
+    lmax = miepy.truncation.size_lmax(x)
+    wiscombe = miepy.truncation.wiscombe_lmax(x)
+
+    assert np.all(lmax <= wiscombe)
+    assert np.all(lmax[x >= 1] == wiscombe[x >= 1])
+    assert np.all(lmax[x < 1] >= 2)
+    assert lmax[1] < wiscombe[1] and lmax[2] < wiscombe[2]
+    assert miepy.truncation.size_lmax(0.3, tolerance=1e-8) > lmax[1]
+
+def test_auto_lmax_dimer():
+    """lmax='auto' grows as the gap closes and keeps the cross-sections accurate"""
+    lmax = []
+    for gap in [100*nm, 10*nm, 5*nm]:
+        auto = dimer(gap, 'auto')
+        assert np.all(auto.truncation_error() < auto.lmax_tolerance)
+        lmax.append(auto.lmax)
+
+        if gap > 6*nm:
+            reference = dimer(gap, 14)
+            assert np.allclose(auto.cross_sections(), reference.cross_sections(), rtol=1e-4, atol=0)
+
+    assert lmax[0] < lmax[1] < lmax[2]
+
+def test_auto_lmax_per_particle():
+    """lmax='auto' of a cluster selects a larger lmax for the larger particle"""
+    particles = [miepy.sphere([0, 0, 0], 300*nm, Ag),
+                 miepy.sphere([500*nm, 0, 0], 50*nm, Ag),
+                 miepy.spheroid([-550*nm, 0, 0], 50*nm, 80*nm, Ag)]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax='auto')
+
+    assert cluster.particle_lmax[0] > cluster.particle_lmax[1]
+    assert cluster.lmax == cluster.particle_lmax[0]
+    assert np.all(cluster.truncation_error() < cluster.lmax_tolerance)
+
+def test_refine_lmax_recomputes_refined_particles():
+    """refining lmax recomputes only the T-matrices of the particles whose lmax is raised"""
+    particles = [miepy.sphere([0, 0, 0], 300*nm, Ag),
+                 miepy.sphere([500*nm, 0, 0], 50*nm, Ag),
+                 miepy.spheroid([-550*nm, 0, 0], 50*nm, 80*nm, Ag)]
+    cluster = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=[2, 6, 6])
+    initial_lmax = cluster.particle_lmax.copy()
+
+    calls = np.zeros(len(particles), dtype=int)
+    for i, particle in enumerate(particles):
+        def counted(*args, compute=particle.compute_tmatrix, i=i, **kwargs):
+            calls[i] += 1
+            return compute(*args, **kwargs)
+        particle.compute_tmatrix = counted
+
+    cluster._refine_lmax()
+    refined = cluster.particle_lmax > initial_lmax
+    assert np.array_equal(refined, [True, False, False])
+    assert np.all(calls[~refined] == 0)
+    assert np.all(calls[refined] == (cluster.particle_lmax - initial_lmax)[refined])
+
+    expected = miepy.cluster(particles=particles, source=source, wavelength=wavelength, lmax=cluster.particle_lmax)
+    assert np.allclose(cluster.tmatrix, expected.tmatrix, rtol=0, atol=1e-12*np.max(np.abs(expected.tmatrix)))